@@ -3,9 +3,14 @@ import logging
 
 from .config import Config, Bangfile
 from .event import event
-from .path import Dirpath
+from .path import Dirpath, FileIndex
 from .event import event
 from .decorators import once
+from .manifest import Manifest
+from .pool import OutputPool
+from .writer import OutputWriter
+from .types import TypeMatcher, Page
+from .md.extensions.embed import EmbedResolver
 
 
 __version__ = "3.0.0"
@@ -21,12 +26,17 @@ class Project(object):
     def __init__(self, project_dir, output_dir):
         self.project_dir = Dirpath(project_dir)
         self.output_dir = Dirpath(output_dir)
+        self.cache_dir = self.project_dir.child_dir(".bang")
         #self.input_dir = self.project_dir.child_dir('input')
         self.input_dirs = [
             self.project_dir.child_dir('input'),
         ]
         self.config = self.config_class(self)
         self.types = {}
+        self.writer = self.create_writer()
+        self._file_index = None
+        self._compiled = False
+        self._type_matcher = None
 
         self.configure()
 
@@ -50,20 +60,31 @@ class Project(object):
             folder path (subdir of self.output_dir) where the file should be
             copied.
         """
-        is_private_cb = self.config.get(
-            "is_private_callback",
-            self.is_private_basename
-        )
-
+        file_index = self.file_index
         for input_dir in self.input_dirs:
-            input_files = input_dir.files()
-            input_files.ne_basename(callback=is_private_cb)
-            input_files.nin_basename(callback=is_private_cb)
-            for input_file in input_files:
+            for entry in file_index.files(input_dir):
+                input_file = input_dir.create_file(entry.path)
                 relpath = input_file.relative_to(input_dir)
                 output_dir = self.output_dir.child_file(relpath).parent
                 yield relpath, input_file, output_dir
 
+    @property
+    def file_index(self):
+        """The FileIndex shared by everything that looks for files
+
+        The index that is created while configuring (eg, by the assets
+        plugin) is shared with the first compile, every compile after that
+        starts a new index so changed files are found. A new index is also
+        created if config.is_private_callback changes"""
+        is_private = self.config.get(
+            "is_private_callback",
+            self.is_private_basename
+        )
+        index = self._file_index
+        if index is None or index.is_private != is_private:
+            index = self._file_index = FileIndex(is_private=is_private)
+        return index
+
     def get_types(self, type_name):
         """return the instances of type_name found during project compile"""
         types = self.types.get(type_name, None)
@@ -80,6 +101,44 @@ class Project(object):
 
         return types
 
+    def get_type_matcher(self):
+        """Returns the TypeMatcher the compile finds the type of every input
+        file with, it is created when the configure finishes and only created
+        again if the Type classes change"""
+        type_classes = tuple(self.config.types.get_mro_classes())
+        matcher = self._type_matcher
+        if not matcher or matcher.type_classes != type_classes:
+            matcher = self._type_matcher = TypeMatcher(type_classes)
+        return matcher
+
+    def resolve_embeds(self, pages):
+        """Fetch the remote embeds (eg, tweets) of pages that aren't cached
+        yet, this happens before pages are rendered so rendering never waits
+        on the network, see EmbedResolver
+
+        :param pages: Iterable[Page]
+        """
+        config = self.config
+        try:
+            resolver = EmbedResolver(
+                config.markdown,
+                max_workers=config.get("embed_workers", 8),
+                timeout=config.get("embed_timeout", 10),
+                offline=config.get("embed_offline", False),
+            )
+            resolver.resolve(pages)
+
+        finally:
+            config.markdown_pool.checkin()
+
+    def create_writer(self):
+        """Returns the OutputWriter everything is output with, a new writer is
+        created for each output"""
+        return OutputWriter(
+            self.output_dir,
+            hardlinks=self.config.get("output_hardlinks", False)
+        )
+
     def configure(self):
         event.bind_event_params(config=self.config)
 
@@ -105,6 +164,8 @@ class Project(object):
         # overriding
         event.push("configure.finish")
 
+        self.get_type_matcher()
+
         logger.debug(f"Project project_dir: {self.project_dir}")
         for i, input_dir in enumerate(self.input_dirs, 1):
             logger.debug(f"Project input_dir {i}: {input_dir}")
@@ -117,40 +178,90 @@ class Project(object):
 
         This just populates self.types but doesn't do any actual outputting
         and is really only broken out from output() for easier testing"""
+        if self._compiled:
+            self._file_index = None
+        self._compiled = True
         event.broadcast("compile.start")
 
         self.config.theme.compile()
 
         self.types = {}
-        type_classes = self.config.types
+        type_matcher = self.get_type_matcher()
 
         for relpath, input_file, output_dir in self:
-            for type_class in type_classes.get_mro_classes():
-                if type_class.match(input_file.basename):
-                    types = self.get_types(type_class.name)
-                    instance = type_class(input_file, output_dir, self.config)
-                    logger.debug(f"Found: {instance}")
-                    types.append(instance)
-                    break
+            type_class, slug = type_matcher.match(input_file.basename)
+            if type_class:
+                types = self.get_types(type_class.name)
+                instance = type_class(input_file, output_dir, self.config)
+                if slug is not None:
+                    instance.slug = slug
+                logger.debug(f"Found: {instance}")
+                types.append(instance)
 
         # do any cleanup after finishing the compile phase
         event.broadcast("compile.finish")
 
-    def output(self):
+    def output(self, incremental=False, jobs=1):
         """go through input/ dir and compile the files and move them to
-        output/ dir"""
+        output/ dir
+
+        Files are output with .writer, so an output file that wouldn't change
+        isn't written again
+
+        :param incremental: bool, if True then only the instances that have
+            changed since the previous output will be output again and only
+            the files that are no longer valid will be removed from the output
+            directory, if False then everything is output and any file in the
+            output directory that wasn't output is removed
+        :param jobs: int, if greater than 1 then pages will be output by this
+            many worker processes
+        """
         # conceptually the same event as compile.finish but here for
         # completeness and easier readability of the intention of a callback
         # in bangfiles
         event.broadcast('output.clear')
 
-        if self.output_dir.exists():
-            logger.info("Clearing output directory")
-            self.output_dir.clear()
+        self.writer = self.create_writer()
+        # what plugins inject into templates can change between outputs
+        self.config.reset_injection()
+
+        manifest = Manifest(self.config)
+        if incremental:
+            manifest.load()
+
+        if manifest.is_stale():
+            if incremental:
+                logger.info("Manifest is stale, outputting everything")
+
+            modified = None
+
+        else:
+            modified = manifest.compile(self.types)
+            logger.info(f"Incremental output of {len(modified)} instance(s)")
+            unmodified = [
+                instance
+                for instances in self.types.values()
+                for instance in instances
+                if instance not in modified
+            ]
+            if self.output_dir.exists():
+                manifest.clean(self.output_dir)
+
+            for instance in unmodified:
+                self.writer.keep(instance.output_file)
+
+        self.resolve_embeds(
+            instance
+            for instances in self.types.values()
+            for instance in instances
+            if isinstance(instance, Page)
+            and (modified is None or instance in modified)
+        )
 
         event.broadcast('output.start')
 
-        with self.config.context("output") as config:
+        with self.config.context("output") as config, \
+            OutputPool(self, jobs) as pool:
 
             config.theme.output()
 
@@ -159,10 +270,35 @@ class Project(object):
                 event.broadcast(f'output.start.{type_name}')
                 logger.debug(f"{type_name}: {len(instances)} instance(s)")
 
+                pool.output(
+                    instance for instance in instances
+                    if modified is None or instance in modified
+                )
+
                 for instance in instances:
-                    instance.output()
+                    manifest.add(instance)
 
                 event.broadcast(f'output.finish.{type_name}')
 
         event.broadcast('output.finish')
 
+        # this is after output.finish because its callbacks (eg, feed) render
+        # pages again
+        low_memory = self.config.get("low_memory", False)
+        for instances in self.types.values():
+            for instance in instances:
+                if isinstance(instance, Page):
+                    if low_memory:
+                        instance.release()
+
+                    else:
+                        instance.release_parsed()
+
+        if modified is None:
+            self.writer.sweep()
+
+        manifest.save()
+
+        md_cache = self.config.markdown_cache
+        if md_cache:
+            md_cache.prune()
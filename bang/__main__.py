@@ -5,31 +5,68 @@ import sys
 import argparse
 import subprocess
 import os
+import json
+import shutil
+import tempfile
 from collections import defaultdict
 import logging
 import logging.config
 import time
+from contextlib import nullcontext
 
 from datatypes import PathServer
 
 from bang import __version__, Project
 from bang.path import Dirpath, DataDirpath
-from bang.utils import Profiler
+from bang.utils import Profiler, get_peak_rss
+from bang.cache import MarkdownCache
+from bang.watch import ReloadServer, Rebuilder
+from bang.profiling import BuildProfiler
+from bang.bench import SiteGenerator, Benchmark, compare
 
 
 logger = logging.getLogger(__name__)
 
 
 def console_compile(args, project_dir, output_dir):
-    with Profiler() as total:
-        s = Project(project_dir, output_dir)
-
-        with Profiler() as compile_total:
-            s.compile()
+    profile = getattr(args, "profile", None)
+    jobs = getattr(args, "jobs", 1)
+    if profile is not None and jobs > 1:
+        logger.warning("Profiling only works in one process, ignoring --jobs")
+        jobs = 1
 
-        with Profiler() as output_total:
-            s.output()
+    # phases are always recorded but everything else is only instrumented
+    # while the profiler is active
+    bp = BuildProfiler()
 
+    with Profiler() as total:
+        s = Project(project_dir, output_dir)
+        if getattr(args, "low_memory", False):
+            s.config.low_memory = True
+
+        if getattr(args, "offline", False):
+            s.config.embed_offline = True
+
+        with bp if profile is not None else nullcontext():
+            with Profiler() as compile_total, bp.phase("compile"):
+                s.compile()
+
+            with Profiler() as output_total, bp.phase("output"):
+                s.output(
+                    incremental=getattr(args, "incremental", False),
+                    jobs=jobs,
+                )
+
+    if profile is not None:
+        bp.report()
+        if profile:
+            bp.write_json(profile)
+
+    logger.info("Wrote {} file(s), skipped {} unchanged file(s)".format(
+        s.writer.written,
+        s.writer.skipped,
+    ))
+    logger.info("Peak RSS: {:.1f} MB".format(get_peak_rss() / 1048576))
     logger.info("Compiling done in {}".format(compile_total))
     logger.info("Outputting done in {}".format(output_total))
     logger.info("Compile done in {}".format(total))
@@ -60,7 +97,20 @@ def console_serve(args, project_dir, output_dir):
         logger.info("    http://localhost:{}".format(args.port))
         logger.info("")
         logger.info("* " * 40)
-        s = PathServer(output_dir, server_address=("", args.port))
+        if getattr(args, "watch", False):
+            s = ReloadServer(output_dir, server_address=("", args.port))
+
+            p = Project(project_dir, output_dir)
+            rebuilder = Rebuilder(p, s)
+            p.compile()
+            p.output(incremental=True)
+
+            logger.info("watching for changes")
+            rebuilder.start()
+
+        else:
+            s = PathServer(output_dir, server_address=("", args.port))
+
         try:
             s.serve_forever()
 
@@ -71,6 +121,130 @@ def console_serve(args, project_dir, output_dir):
     return ret_code
 
 
+def console_cache(args, project_dir, output_dir):
+    s = Project(project_dir, output_dir)
+    md_cache = MarkdownCache(s.cache_dir.child_dir("markdown"))
+
+    if args.action == "clear":
+        logger.info("Clearing markdown cache in {}".format(md_cache.cache_dir))
+        md_cache.clear()
+
+        if getattr(args, "embeds", False):
+            embed_cache = s.config.embed_cache
+            logger.info("Clearing embed cache {}".format(embed_cache.path))
+            embed_cache.clear()
+
+    elif args.action == "stats":
+        stats = md_cache.stats()
+        logger.info("Markdown cache: {}".format(md_cache.cache_dir))
+        logger.info("    entries: {}".format(stats["count"]))
+        logger.info("    size: {:.1f} MB".format(stats["size"] / 1048576))
+        logger.info("    max size: {:.1f} MB".format(
+            s.config.get(
+                "markdown_cache_size",
+                MarkdownCache.default_max_size
+            ) / 1048576
+        ))
+
+        stats = s.config.embed_cache.stats()
+        logger.info("Embed cache: {}".format(s.config.embed_cache.path))
+        logger.info("    embeds: {}".format(stats["count"]))
+        logger.info("    size: {:.1f} MB".format(stats["size"] / 1048576))
+
+    return 0
+
+
+def console_bench(args, project_dir, output_dir):
+    bench_dir = Dirpath(tempfile.mkdtemp(prefix="bang-bench-"))
+    try:
+        gen = SiteGenerator(
+            bench_dir,
+            posts=args.posts,
+            paragraphs=args.paragraphs,
+            seed=args.seed,
+        )
+        logger.info("Generating {} posts in {}".format(args.posts, bench_dir))
+        gen.generate()
+
+        b = Benchmark(
+            bench_dir,
+            bench_dir.child_dir("output"),
+            repeat=args.repeat,
+            jobs=args.jobs,
+            low_memory=args.low_memory,
+        )
+        results = b.run()
+        results["params"] = gen.get_params()
+
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    best = results["best"]
+    logger.info("Best: {:.1f} pages/sec".format(best["pages_per_sec"]))
+    logger.info("    compile: {:.2f}s, output: {:.2f}s".format(
+        best["compile"],
+        best["output"],
+    ))
+    logger.info("Peak RSS: {:.1f} MB".format(results["peak_rss"] / 1048576))
+    md_stats = results["markdown"]
+    logger.info(
+        "Markdown: {} instance(s) created in {:.1f} ms, {} resets"
+        " averaging {:.3f} ms".format(
+            md_stats["instances"],
+            md_stats["create_time"] * 1000,
+            md_stats["resets"],
+            md_stats["reset_avg"] * 1000,
+        )
+    )
+    logger.info("MagicRef: {:.1f} ms for a {} line post".format(
+        results["magicref"]["seconds"] * 1000,
+        results["magicref"]["lines"],
+    ))
+    if results["blocks"]:
+        logger.info("Block processor tests:")
+        for name, seconds in results["blocks"].items():
+            logger.info("    {:>8.2f} us/block  {}".format(
+                seconds * 1000000,
+                name,
+            ))
+
+    if args.compare:
+        with open(args.compare, encoding="UTF-8") as fp:
+            previous = json.load(fp)
+
+        logger.info("Compared to {} ({}):".format(
+            args.compare,
+            previous.get("version", "")
+        ))
+        for k, change in compare(results, previous).items():
+            logger.info("    {}: {:+.1%}".format(k, change))
+
+    if args.results:
+        with open(args.results, "w", encoding="UTF-8") as fp:
+            json.dump(results, fp, indent=2)
+        logger.info("Results written to {}".format(args.results))
+
+    return 0
+
+
+def console_theme(args, project_dir, output_dir):
+    s = Project(project_dir, output_dir)
+    theme = s.config.theme
+
+    if args.action == "compile":
+        with Profiler() as total:
+            count = theme.compile_templates()
+
+        logger.info("Compiled {} template(s) of theme {} into {} in {}".format(
+            count,
+            theme.name,
+            theme.compiled_dir,
+            total,
+        ))
+
+    return 0
+
+
 def console_test(args, project_dir, output_dir):
     os.environ.setdefault("BANG_ENV", "test")
 
@@ -223,6 +397,53 @@ def console():
         help="Compile your site",
         add_help=False
     )
+    compile_parser.add_argument(
+        '--incremental', '-i',
+        dest='incremental',
+        action='store_true',
+        help=(
+            "Only output the files that have changed since the last compile"
+            " instead of clearing the output directory"
+        )
+    )
+    compile_parser.add_argument(
+        '--jobs', '-j',
+        dest='jobs',
+        default=1,
+        type=int,
+        help="How many worker processes should output pages"
+    )
+    compile_parser.add_argument(
+        '--profile',
+        dest='profile',
+        nargs='?',
+        const='',
+        default=None,
+        metavar='JSON-PATH',
+        help=(
+            "Report where the compile spent its time, pass a path to also"
+            " write the report as json"
+        )
+    )
+    compile_parser.add_argument(
+        '--low-memory',
+        dest='low_memory',
+        action='store_true',
+        help=(
+            "Release the rendered html of pages once they are output, this"
+            " keeps memory down on big sites at the cost of loading the html"
+            " again if it is needed later"
+        )
+    )
+    compile_parser.add_argument(
+        '--offline',
+        dest='offline',
+        action='store_true',
+        help=(
+            "Never fetch embeds (eg, tweets), the embeds that aren't cached"
+            " are reported and left as links"
+        )
+    )
     compile_parser.set_defaults(func=console_compile)
 
     serve_parser = subparsers.add_parser(
@@ -238,6 +459,15 @@ def console():
         type=int,
         help='The port for the webserver'
     )
+    serve_parser.add_argument(
+        '--watch', '-w',
+        dest='watch',
+        action='store_true',
+        help=(
+            "Compile the project, then recompile it and reload the browser"
+            " whenever a file in the project changes"
+        )
+    )
     serve_parser.set_defaults(func=console_serve)
 
     generate_parser = subparsers.add_parser(
@@ -251,6 +481,105 @@ def console():
     )
     generate_parser.set_defaults(func=console_generate)
 
+    cache_parser = subparsers.add_parser(
+        "cache",
+        parents=[parent_parser],
+        help="Manage the project's cache of rendered markdown and embeds",
+        add_help=False
+    )
+    cache_parser.add_argument(
+        'action',
+        choices=["clear", "stats"],
+        help="clear the cache or print information about it"
+    )
+    cache_parser.add_argument(
+        '--embeds',
+        dest='embeds',
+        action='store_true',
+        help=(
+            "Also clear the fetched embeds (eg, tweets), they will be fetched"
+            " again by the next compile that isn't --offline"
+        )
+    )
+    cache_parser.set_defaults(func=console_cache)
+
+    theme_parser = subparsers.add_parser(
+        "theme",
+        parents=[parent_parser],
+        help="Manage the project's theme",
+        add_help=False
+    )
+    theme_parser.add_argument(
+        'action',
+        choices=["compile"],
+        help=(
+            "precompile the theme's templates so they load faster, they"
+            " are ignored once any template changes"
+        )
+    )
+    theme_parser.set_defaults(func=console_theme)
+
+    bench_parser = subparsers.add_parser(
+        "bench",
+        parents=[parent_parser],
+        help="Benchmark compiling a generated project",
+        add_help=False
+    )
+    bench_parser.add_argument(
+        '--posts',
+        dest='posts',
+        default=200,
+        type=int,
+        help="How many posts the generated project should have"
+    )
+    bench_parser.add_argument(
+        '--paragraphs',
+        dest='paragraphs',
+        default=8,
+        type=int,
+        help="How many paragraphs each generated post should have"
+    )
+    bench_parser.add_argument(
+        '--seed',
+        dest='seed',
+        default=0,
+        type=int,
+        help="The random seed, the same seed generates the same project"
+    )
+    bench_parser.add_argument(
+        '--repeat',
+        dest='repeat',
+        default=3,
+        type=int,
+        help="How many times the project is compiled, the best run counts"
+    )
+    bench_parser.add_argument(
+        '--jobs', '-j',
+        dest='jobs',
+        default=1,
+        type=int,
+        help="How many worker processes should output pages"
+    )
+    bench_parser.add_argument(
+        '--low-memory',
+        dest='low_memory',
+        action='store_true',
+        help="Benchmark with the compile's --low-memory flag"
+    )
+    bench_parser.add_argument(
+        '--results',
+        dest='results',
+        default="",
+        help="Write the results as json to this path"
+    )
+    bench_parser.add_argument(
+        '--compare',
+        dest='compare',
+        default="",
+        help="Compare the results to the json results of a previous run"
+    )
+    bench_parser.set_defaults(func=console_bench)
+
     test_parser = subparsers.add_parser(
         "test",
         parents=[serve_parser],
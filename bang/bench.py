@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark bang against generated projects
+
+This is used by `bang bench`, it generates a synthetic blog with posts that
+use most of the markdown bang supports (footnotes, magic refs, images, tables,
+code blocks, and embeds), compiles and outputs it a few times, and records how
+fast that was so the results of different versions can be compared
+"""
+import re
+import json
+import time
+import random
+import shutil
+import base64
+import logging
+import platform
+import datetime
+import xml.etree.ElementTree as etree
+
+from .compat import *
+from .path import Dirpath
+from .utils import get_peak_rss
+
+
+logger = logging.getLogger(__name__)
+
+
+class SiteGenerator(object):
+    """Generates a synthetic project
+
+    Everything is generated from a seeded random instance so the same
+    arguments always generate the same project
+
+    :Example:
+        gen = SiteGenerator(project_dir, posts=500)
+        gen.generate()
+    """
+    PNG = base64.b64decode(
+        "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk"
+        "+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+    )
+    """A 1x1 png so the generated images are real images"""
+
+    WORDS = (
+        "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod"
+        " tempor incididunt ut labore et dolore magna aliqua enim ad minim"
+        " veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea"
+        " commodo consequat duis aute irure in reprehenderit voluptate velit"
+        " esse cillum fugiat nulla pariatur excepteur sint occaecat cupidatat"
+        " non proident sunt culpa qui officia deserunt mollit anim id est"
+        " laborum"
+    ).split()
+
+    def __init__(self, project_dir, posts=100, paragraphs=8, seed=0):
+        """
+        :param project_dir: str, the project will be generated here
+        :param posts: int, how many posts to generate
+        :param paragraphs: int, about how many paragraphs each post has
+        :param seed: int, the random seed
+        """
+        self.project_dir = Dirpath(project_dir)
+        self.posts = posts
+        self.paragraphs = paragraphs
+        self.random = random.Random(seed)
+
+    def get_params(self):
+        return {"posts": self.posts, "paragraphs": self.paragraphs}
+
+    def get_sentence(self, min_words=6, max_words=18):
+        words = self.random.choices(
+            self.WORDS,
+            k=self.random.randint(min_words, max_words)
+        )
+        return " ".join(words).capitalize() + "."
+
+    def get_paragraph(self):
+        return " ".join(
+            self.get_sentence() for _ in range(self.random.randint(2, 6))
+        )
+
+    def get_bangfile(self):
+        return "\n".join([
+            "from bang import event",
+            "from bang.plugins import blog",
+            "",
+            "",
+            "@event('configure.project')",
+            "def configure_project(event):",
+            "    config = event.config",
+            "    config.host = 'bench.example.com'",
+            "    config.name = 'bench'",
+            "    # every run should render all the markdown",
+            "    config.markdown_cache_size = 0",
+            "",
+        ])
+
+    def get_post(self, index):
+        """Returns the markdown body and the twitter embed cache of a post
+
+        :param index: int
+        :returns: tuple[str, dict]
+        """
+        lines = [f"# Post {index} {self.get_sentence(2, 5)[:-1]}", ""]
+        footnotes = []
+        links = []
+        embeds = {}
+
+        for i in range(self.paragraphs):
+            kind = self.random.choice([
+                "footnote",
+                "magicref",
+                "image",
+                "table",
+                "code",
+                "embed",
+                "text",
+            ])
+
+            if kind == "footnote":
+                lines.append(f"{self.get_paragraph()}[^n]")
+                footnotes.append(f"[^n]: {self.get_sentence()}")
+
+            elif kind == "magicref":
+                lines.append(f"{self.get_sentence()} [link text][n]")
+                links.append(f"[n]: https://example.com/{index}/{i}")
+
+            elif kind == "image":
+                lines.append(f"![{self.get_sentence(2, 4)}](image-{i}.png)")
+
+            elif kind == "table":
+                lines.extend([
+                    "| one | two | three |",
+                    "| --- | --- | ----- |",
+                ])
+                for _ in range(self.random.randint(2, 8)):
+                    lines.append("| {} |".format(" | ".join(
+                        self.random.choice(self.WORDS) for _ in range(3)
+                    )))
+
+            elif kind == "code":
+                lines.append("```python")
+                for n in range(self.random.randint(3, 15)):
+                    lines.append(f"def func_{n}(foo, bar):")
+                    lines.append(f"    return foo + bar * {n}")
+                lines.append("```")
+
+            elif kind == "embed":
+                embed = self.random.choice(["youtube", "vimeo", "twitter"])
+                if embed == "youtube":
+                    lines.append(
+                        f"https://www.youtube.com/watch?v=bench{index}x{i}"
+                    )
+
+                elif embed == "vimeo":
+                    lines.append(f"https://vimeo.com/{index}{i}")
+
+                else:
+                    # twitter embeds are pre-cached so the benchmark never
+                    # touches the network
+                    url = f"https://twitter.com/bench/status/{index}{i}"
+                    lines.append(url)
+                    embeds[url] = {
+                        "html": "<blockquote class=\"twitter-tweet\">"
+                            f"<p>{self.get_sentence()}</p></blockquote>",
+                    }
+
+            else:
+                lines.append(self.get_paragraph())
+
+            lines.append("")
+
+        lines.extend(links)
+        lines.append("")
+        lines.extend(footnotes)
+        lines.append("")
+        return "\n".join(lines), embeds
+
+    def generate(self):
+        """Generate the project
+
+        :returns: int, how many posts were generated
+        """
+        self.project_dir.child_file("bangfile.py").write_text(
+            self.get_bangfile()
+        )
+
+        input_dir = self.project_dir.child_dir("input")
+        for index in range(self.posts):
+            post_dir = input_dir.child_dir(f"post-{index:05}")
+            post_dir.touch()
+
+            body, embeds = self.get_post(index)
+            post_dir.child_file("post.md").write_text(body)
+
+            for i in range(self.paragraphs):
+                if f"image-{i}.png" in body:
+                    post_dir.child_file(f"image-{i}.png").write_bytes(self.PNG)
+
+            if embeds:
+                post_dir.child_file("_embed", "twitter.json").write_text(
+                    json.dumps(embeds)
+                )
+
+        return self.posts
+
+
+class BlockBenchmark(object):
+    """Times the .test() of bang's markdown block processors
+
+    Every block processor's .test() is called with every paragraph block of
+    every page, so this is how much each one costs per block
+
+    :Example:
+        bb = BlockBenchmark(md, ["para one", "![image](che.jpg)"])
+        results = bb.run()
+    """
+    block_regex = re.compile(r"\n\s*\n")
+
+    def __init__(self, md, blocks, repeat=20):
+        """
+        :param md: Markdown
+        :param blocks: list[str], the blocks every processor is tested with
+        :param repeat: int, how many times every block is tested
+        """
+        self.md = md
+        self.blocks = blocks
+        self.repeat = repeat
+
+    @classmethod
+    def get_blocks(cls, pages):
+        """Returns the blocks of the bodies of pages"""
+        blocks = []
+        for page in pages:
+            blocks.extend(
+                b for b in cls.block_regex.split(page.body) if b.strip()
+            )
+        return blocks
+
+    def get_processors(self):
+        """Returns the (name, processor) of every block processor bang added
+        to .md"""
+        registry = self.md.parser.blockprocessors
+        for item in registry._priority:
+            processor = registry[item.name]
+            if processor.__class__.__module__.startswith(__package__):
+                yield item.name, processor
+
+    def run(self):
+        """
+        :returns: dict[str, float], the average seconds each processor's
+            .test() took for one block
+        """
+        processors = list(self.get_processors())
+        timings = [0.0] * len(processors)
+        count = len(self.blocks) * self.repeat
+        parent = etree.Element("div")
+        perf_counter = time.perf_counter
+        for _ in range(self.repeat):
+            for block in self.blocks:
+                # like the block parser, every processor tests a block
+                # before the next block is tested
+                for i, (name, processor) in enumerate(processors):
+                    start = perf_counter()
+                    processor.test(parent, block)
+                    timings[i] += perf_counter() - start
+
+        ret = {}
+        if count:
+            for i, (name, processor) in enumerate(processors):
+                ret[name] = timings[i] / count
+
+        return ret
+
+
+class MagicRefBenchmark(object):
+    """Times the magic ref preprocessor on one big footnote heavy post
+
+    :Example:
+        mb = MagicRefBenchmark(md, paragraphs=1000)
+        results = mb.run()
+    """
+    def __init__(self, md, paragraphs=1000, repeat=3, seed=0):
+        """
+        :param md: Markdown
+        :param paragraphs: int, every paragraph has a link, a footnote, and
+            an inline code span, and is followed by their definitions
+        :param repeat: int, the fastest run counts
+        :param seed: int, the random seed for the generated post
+        """
+        self.md = md
+        self.paragraphs = paragraphs
+        self.repeat = repeat
+        self.gen = SiteGenerator("", seed=seed)
+
+    def get_lines(self):
+        lines = []
+        for i in range(self.paragraphs):
+            lines.extend([
+                "{} [link text][n] {} `[^n]` {}[^n] {}".format(
+                    self.gen.get_sentence(),
+                    self.gen.get_sentence(),
+                    self.gen.get_sentence(),
+                    self.gen.get_paragraph(),
+                ),
+                "",
+                f"[n]: https://example.com/{i}",
+                f"[^n]: {self.gen.get_sentence()}",
+                "",
+            ])
+        return lines
+
+    def run(self):
+        """
+        :returns: dict, the lines of the post and the seconds the fastest
+            run took
+        """
+        processor = self.md.preprocessors["MagicRefPreprocessor"]
+        lines = self.get_lines()
+        seconds = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            processor.run(lines)
+            seconds.append(time.perf_counter() - start)
+
+        return {"lines": len(lines), "seconds": min(seconds)}
+
+
+class Benchmark(object):
+    """Compiles and outputs a project a few times and records how long it
+    took
+
+    :Example:
+        b = Benchmark(project_dir, output_dir, repeat=3)
+        results = b.run()
+    """
+    def __init__(
+        self,
+        project_dir,
+        output_dir,
+        repeat=3,
+        jobs=1,
+        low_memory=False
+    ):
+        """
+        :param project_dir: str
+        :param output_dir: str
+        :param repeat: int, how many times to compile and output, the best
+            run is the one that counts
+        :param jobs: int, passed to Project.output
+        :param low_memory: bool, sets config.low_memory
+        """
+        self.project_dir = Dirpath(project_dir)
+        self.output_dir = Dirpath(output_dir)
+        self.repeat = repeat
+        self.jobs = jobs
+        self.low_memory = low_memory
+
+    def get_peak_rss(self):
+        return get_peak_rss()
+
+    def run_once(self, project):
+        if self.output_dir.exists():
+            # every run should write every file
+            shutil.rmtree(self.output_dir)
+
+        start = time.perf_counter()
+        project.compile()
+        compiled = time.perf_counter()
+        project.output(jobs=self.jobs)
+        stop = time.perf_counter()
+
+        pages = sum(
+            len(instances)
+            for type_name, instances in project.types.items()
+            if type_name != "other"
+        )
+        total = stop - start
+        return {
+            "pages": pages,
+            "compile": compiled - start,
+            "output": stop - compiled,
+            "total": total,
+            "pages_per_sec": pages / total if total else 0.0,
+        }
+
+    def run(self):
+        """Run the benchmark
+
+        :returns: dict, the results
+        """
+        from . import __version__, Project
+
+        start = time.perf_counter()
+        project = Project(self.project_dir, self.output_dir)
+        if self.low_memory:
+            project.config.low_memory = True
+        configure = time.perf_counter() - start
+
+        runs = []
+        for i in range(1, self.repeat + 1):
+            r = self.run_once(project)
+            logger.info(
+                "Run {}: {} pages in {:.2f}s ({:.1f} pages/sec)".format(
+                    i,
+                    r["pages"],
+                    r["total"],
+                    r["pages_per_sec"],
+                )
+            )
+            runs.append(r)
+
+        return {
+            "version": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "jobs": self.jobs,
+            "low_memory": self.low_memory,
+            "configure": configure,
+            "runs": runs,
+            "best": max(runs, key=lambda r: r["pages_per_sec"]),
+            "peak_rss": self.get_peak_rss(),
+            "markdown": project.config.markdown_pool.get_stats(),
+            "blocks": self.run_blocks(project),
+            "magicref": self.run_magicref(project),
+        }
+
+    def run_blocks(self, project):
+        """Run BlockBenchmark with the blocks of the project's pages"""
+        pages = []
+        for type_name, instances in project.types.items():
+            if type_name != "other":
+                pages.extend(instances)
+
+        config = project.config
+        with config.context("output"):
+            try:
+                bb = BlockBenchmark(
+                    config.markdown,
+                    BlockBenchmark.get_blocks(pages),
+                )
+                return bb.run()
+
+            finally:
+                config.markdown_pool.checkin()
+
+    def run_magicref(self, project):
+        """Run MagicRefBenchmark with the project's markdown"""
+        config = project.config
+        try:
+            return MagicRefBenchmark(config.markdown).run()
+
+        finally:
+            config.markdown_pool.checkin()
+
+
+def compare(results, previous):
+    """Compare results against the results of a previous benchmark
+
+    :param results: dict, see Benchmark.run()
+    :param previous: dict, see Benchmark.run()
+    :returns: dict[str, float], how much each measurement changed, as a
+        fraction of the previous measurement (eg, 0.1 is 10% more)
+    """
+    ret = {}
+    best = results["best"]
+    previous_best = previous["best"]
+    for k in ["pages_per_sec", "compile", "output", "total"]:
+        if previous_best.get(k):
+            ret[k] = (best[k] - previous_best[k]) / previous_best[k]
+
+    if previous.get("peak_rss"):
+        ret["peak_rss"] = (
+            (results["peak_rss"] - previous["peak_rss"]) / previous["peak_rss"]
+        )
+
+    # results from before the block and magicref benchmarks don't have them
+    previous_blocks = previous.get("blocks", {})
+    for name, seconds in results.get("blocks", {}).items():
+        if previous_blocks.get(name):
+            ret[f"blocks.{name}"] = (
+                (seconds - previous_blocks[name]) / previous_blocks[name]
+            )
+
+    previous_seconds = previous.get("magicref", {}).get("seconds")
+    if previous_seconds and "magicref" in results:
+        ret["magicref"] = (
+            (results["magicref"]["seconds"] - previous_seconds)
+            / previous_seconds
+        )
+
+    return ret
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+
+from .compat import *
+from .path import Dirpath
+
+
+logger = logging.getLogger(__name__)
+
+
+class MarkdownCache(object):
+    """A content addressed disk cache of rendered markdown
+
+    Every entry holds the title, html, and meta of a Page rendered in a
+    certain context and is keyed by a hash of everything that goes into the
+    render (see .get_key()), so an entry never has to be invalidated, it just
+    stops being requested and is eventually evicted by .prune()
+
+    Entries are json files in a two level directory structure:
+
+        <CACHE-DIR>/<FIRST 2 CHARS OF KEY>/<KEY>.json
+
+    The modified time of an entry file is updated whenever it is read, so
+    .prune() can evict the least recently used entries first
+    """
+    default_max_size = 256 * 1024 * 1024
+    """The default size in bytes, configurable with markdown_cache_size"""
+
+    def __init__(self, cache_dir, max_size=0):
+        """
+        :param cache_dir: Dirpath, where the entries will be saved
+        :param max_size: int, the maximum size in bytes of all the entries,
+            .prune() will evict entries until the cache is under this size,
+            0 means there is no maximum size
+        """
+        self.cache_dir = Dirpath(cache_dir)
+        self.max_size = max_size
+
+    def get_key(self, page):
+        """Returns the key for page in the current context
+
+        :param page: Page
+        :returns: str
+        """
+        from . import __version__
+
+        config = page.config
+        h = hashlib.sha256()
+        for v in [
+            __version__,
+            config.markdown_pool.get_fingerprint(),
+            page.url,
+            config.base_url,
+            config.get("lazyload_images", True),
+            config.get("highlight_code", False),
+            page.body,
+        ]:
+            h.update(String(v).encode("UTF-8"))
+            h.update(b"\0")
+
+        return h.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Get the entry at key
+
+        :param key: str, see .get_key()
+        :returns: tuple[str, str, dict]|None, the (title, html, meta) of the
+            entry or None if there is no entry at key
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, encoding="UTF-8") as fp:
+                d = json.load(fp)
+
+        except (OSError, ValueError):
+            return None
+
+        try:
+            os.utime(path)
+
+        except OSError:
+            pass
+
+        return d["title"], d["html"], d["meta"]
+
+    def set(self, key, title, html, meta):
+        """Save the rendered markdown at key
+
+        The entry is written to a temp file and then moved into place so
+        concurrent builds never see a partial entry
+        """
+        path = self.get_path(key)
+        basedir = os.path.dirname(path)
+        os.makedirs(basedir, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=basedir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="UTF-8") as fp:
+                json.dump({"title": title, "html": html, "meta": meta}, fp)
+            os.replace(tmp_path, path)
+
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def entries(self):
+        """Yields all the entries in the cache
+
+        :returns: generator[os.DirEntry]
+        """
+        if self.cache_dir.isdir():
+            for basedir in os.scandir(self.cache_dir):
+                if basedir.is_dir():
+                    for entry in os.scandir(basedir.path):
+                        if entry.name.endswith(".json"):
+                            yield entry
+
+    def stats(self):
+        """Returns information about the cache
+
+        :returns: dict[str, int], with count and size keys
+        """
+        count = size = 0
+        for entry in self.entries():
+            count += 1
+            size += entry.stat().st_size
+        return {"count": count, "size": size}
+
+    def prune(self):
+        """Evict the least recently used entries until the cache is smaller
+        than .max_size
+
+        :returns: int, how many entries were evicted
+        """
+        evicted = 0
+        if self.max_size:
+            entries = []
+            size = 0
+            for entry in self.entries():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                size += st.st_size
+
+            if size > self.max_size:
+                entries.sort()
+                for _, entry_size, path in entries:
+                    os.unlink(path)
+                    evicted += 1
+                    size -= entry_size
+                    if size <= self.max_size:
+                        break
+
+                logger.info(f"Evicted {evicted} markdown cache entries")
+
+        return evicted
+
+    def clear(self):
+        if self.cache_dir.exists():
+            self.cache_dir.clear()
+
+
+class EmbedCache(object):
+    """The project's store of fetched embeds (eg, tweets)
+
+    Every embed processor shares this one sqlite database, so an embed used
+    by many pages is only stored, and fetched, once. Every write is its own
+    transaction so the database is never left half written
+
+    :Example:
+        cache = EmbedCache(cache_dir.child_file("embed.sqlite"))
+        cache.set("twitter", url, {"html": "..."})
+        body = cache.get("twitter", url)
+    """
+    def __init__(self, path, ttl=0):
+        """
+        :param path: str, the sqlite database file
+        :param ttl: int, seconds an embed is kept before it is fetched again,
+            0 means embeds never expire
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._connection = None
+
+    @property
+    def connection(self):
+        """The database connection, it is only opened the first time it is
+        needed so projects without embeds never create the database"""
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(
+                self.path,
+                timeout=30,
+                check_same_thread=False,
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeds ("
+                " name TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " body TEXT NOT NULL,"
+                " created REAL NOT NULL,"
+                " PRIMARY KEY (name, url))"
+            )
+            connection.commit()
+            self._connection = connection
+
+        return self._connection
+
+    def get(self, name, url, ttl=None):
+        """Get the embed of url
+
+        :param name: str, the name of the embed processor (eg, "twitter")
+        :param url: str
+        :param ttl: int, overrides .ttl, pass 0 to get expired embeds also
+        :returns: dict|None, the response body of the embed, None if it
+            isn't stored or it has expired
+        """
+        if self._connection is None and not os.path.isfile(self.path):
+            return None
+
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body, created FROM embeds WHERE name = ? AND url = ?",
+                (name, url)
+            ).fetchone()
+
+        if row:
+            body, created = row
+            if not ttl or created + ttl > time.time():
+                return json.loads(body)
+
+        return None
+
+    def set(self, name, url, body):
+        """Store the response body of url's embed"""
+        self.set_many(name, {url: body})
+
+    def set_many(self, name, bodies):
+        """Store many embeds in one transaction
+
+        :param name: str
+        :param bodies: dict[str, dict], url keys and response body values
+        """
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO embeds (name, url, body, created)"
+                    " VALUES (?, ?, ?, ?)",
+                    [
+                        (name, url, json.dumps(body), now)
+                        for url, body in bodies.items()
+                    ]
+                )
+
+    def stats(self):
+        """Returns information about the cache
+
+        :returns: dict[str, int], with count and size keys
+        """
+        count = 0
+        if os.path.isfile(self.path):
+            with self.lock:
+                count = self.connection.execute(
+                    "SELECT COUNT(*) FROM embeds"
+                ).fetchone()[0]
+
+        size = os.path.getsize(self.path) if count else 0
+        return {"count": count, "size": size}
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def clear(self):
+        self.close()
+        if os.path.isfile(self.path):
+            os.unlink(self.path)
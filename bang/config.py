@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 import os
+import json
 from contextlib import contextmanager
 import logging
 from functools import cached_property
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import (
+    Environment,
+    FileSystemLoader,
+    ModuleLoader,
+    ChoiceLoader,
+    FileSystemBytecodeCache,
+)
 from datatypes import (
     Url,
     ContextNamespace,
@@ -21,8 +28,9 @@ from .path import (
     Dirpath,
     Filepath
 )
-from .md import Markdown
-from .utils import HTML
+from .md import MarkdownPool
+from .cache import MarkdownCache, EmbedCache
+from .utils import inject_html
 
 
 
@@ -93,6 +101,14 @@ class Config(ContextNamespace):
     def output_dir(self):
         return self.project.output_dir
 
+    @property
+    def cache_dir(self):
+        return self.project.cache_dir
+
+    @property
+    def writer(self):
+        return self.project.writer
+
     @property
     def fields(self):
         """return a dict of all active values in the config at the moment"""
@@ -100,17 +116,117 @@ class Config(ContextNamespace):
 
     @property
     def markdown(self):
-        """Returns a unique markdown instance for each context"""
-        context = self.current_context()
-        md = context.get("_markdown_instance", None)
-        if not md:
-            logger.debug("Creating Markdown instance for context [{}]".format(
-                self.context_name()
-            ))
-            extensions = self.get("markdown_extensions", None)
-            md = Markdown.create_instance(self, extensions=extensions)
-            context["_markdown_instance"] = md
-        return md
+        """Returns the current thread's markdown instance for this context,
+        see MarkdownPool"""
+        return self.markdown_pool.checkout()
+
+    @property
+    def markdown_pool(self):
+        """Returns the project's MarkdownPool"""
+        context = self.get_context(self._context_names[0])
+        pool = context.get("_markdown_pool", None)
+        if pool is None:
+            pool = MarkdownPool(self)
+            context["_markdown_pool"] = pool
+        return pool
+
+    def get_markdown_fingerprint(self):
+        """Returns the config values in the current context that change how
+        markdown renders, contexts with the same fingerprint render a page to
+        the same html
+
+        :returns: tuple
+        """
+        return (
+            self.get("scheme", None),
+            self.get("host", None),
+        ) + self.get_parse_fingerprint()
+
+    def get_parse_fingerprint(self):
+        """Returns the config values in the current context that change how
+        markdown is parsed, contexts with the same parse fingerprint share
+        the parsed page and only run the contextual treeprocessors again, see
+        Markdown.parse()
+
+        :returns: tuple
+        """
+        return (
+            self.get("lazyload_images", True),
+            self.get("highlight_code", False),
+            self.markdown_pool.get_extensions_fingerprint(
+                self.get("markdown_extensions", None)
+            ),
+        )
+
+    def get_injection(self):
+        """Returns the html that is injected into the head and body of every
+        template in the current context
+
+        The html is gathered from the output.inject event the first time
+        a template is rendered in a context and is then reused for every
+        other template in that context, see .reset_injection()
+
+        :returns: tuple[str, str], the head html and the body html
+        """
+        context = self.get_context(self._context_names[0])
+        injections = context.get("_injections", None)
+        if injections is None:
+            injections = {}
+            context["_injections"] = injections
+
+        context_name = self.context_name()
+        if context_name not in injections:
+            r = event.broadcast("output.inject", head=[], body=[])
+            injections[context_name] = (
+                "\n".join(r.head),
+                "\n".join(r.body),
+            )
+
+        return injections[context_name]
+
+    def reset_injection(self):
+        """Forget the injected html so the next template gathers it again"""
+        context = self.get_context(self._context_names[0])
+        context["_injections"] = {}
+
+    @property
+    def markdown_cache(self):
+        """Returns the project's markdown disk cache or None if the cache
+        has been turned off by setting markdown_cache_size to 0"""
+        context = self.get_context(self._context_names[0])
+        cache = context.get("_markdown_cache", None)
+        if cache is None:
+            max_size = self.get(
+                "markdown_cache_size",
+                MarkdownCache.default_max_size
+            )
+            if max_size:
+                cache = MarkdownCache(
+                    self.cache_dir.child_dir("markdown"),
+                    max_size
+                )
+
+            else:
+                cache = False
+
+            context["_markdown_cache"] = cache
+
+        return cache or None
+
+    @property
+    def embed_cache(self):
+        """Returns the project's EmbedCache, embeds expire after
+        embed_cache_ttl seconds (0, the default, means never)"""
+        context = self.get_context(self._context_names[0])
+        cache = context.get("_embed_cache", None)
+        if cache is None:
+            cache = EmbedCache(
+                self.cache_dir.child_file("embed.sqlite"),
+                self.get("embed_cache_ttl", 0)
+            )
+            context["_embed_cache"] = cache
+
+        return cache
 
     @property
     def base_url(self):
@@ -237,14 +353,16 @@ class Theme(object):
     """
     @cached_property
     def template(self):
-        # https://jinja.palletsprojects.com/en/latest/api/#jinja2.Environment
-        return Environment(
-            loader=FileSystemLoader(self.template_dirs),
-            #extensions=['jinja2.ext.with_'] # http://jinja.pocoo.org/docs/dev/templates/#with-statement
-            lstrip_blocks=True,
-            trim_blocks=True,
+        return self.create_environment(
+            loader=self.get_template_loader(),
+            bytecode_cache=self.get_bytecode_cache(),
         )
 
+    @property
+    def compiled_dir(self):
+        """Where `bang theme compile` puts the precompiled templates"""
+        return self.config.cache_dir.child_dir("themes", self.name)
+
     def __init__(self, theme_dir, config, **kwargs):
         self.theme_dir = theme_dir
         self.name = self.theme_dir.basename
@@ -252,6 +370,103 @@ class Theme(object):
         self.input_dir = self.theme_dir.child_dir("input")
         self.template_dirs = [self.theme_dir.child_dir("template")]
 
+    def create_environment(self, **kwargs):
+        # https://jinja.palletsprojects.com/en/latest/api/#jinja2.Environment
+        return Environment(
+            #extensions=['jinja2.ext.with_'] # http://jinja.pocoo.org/docs/dev/templates/#with-statement
+            lstrip_blocks=True,
+            trim_blocks=True,
+            **kwargs
+        )
+
+    def get_template_loader(self):
+        """Returns the loader for the theme's templates
+
+        If the theme has been precompiled (see .compile_templates()) and none
+        of the templates have changed since then the precompiled templates are
+        loaded first
+
+        https://jinja.palletsprojects.com/en/latest/api/#loaders
+        """
+        loader = FileSystemLoader(self.template_dirs)
+
+        stats_file = self.compiled_dir.child_file("templates.json")
+        if stats_file.isfile():
+            if json.loads(stats_file.read_text()) == self.get_template_stats():
+                logger.debug(
+                    f"Using precompiled templates in {self.compiled_dir}"
+                )
+                loader = ChoiceLoader([
+                    ModuleLoader(String(self.compiled_dir)),
+                    loader,
+                ])
+
+            else:
+                logger.warning(
+                    f"Ignoring precompiled templates for theme {self.name}"
+                    " because its templates have changed, run"
+                    " `bang theme compile` again"
+                )
+
+        return loader
+
+    def get_bytecode_cache(self):
+        """Returns the cache that persists compiled templates between builds,
+        this can be turned off by setting template_cache to False
+
+        https://jinja.palletsprojects.com/en/latest/api/#bytecode-cache
+        """
+        if self.config.get("template_cache", True):
+            cache_dir = self.config.cache_dir.child_dir("jinja", self.name)
+            cache_dir.touch()
+            return FileSystemBytecodeCache(String(cache_dir))
+
+    def get_template_stats(self):
+        """Returns the size and modified time of every file in the template
+        directories
+
+        :returns: dict[str, list[int, int]]
+        """
+        templates = {}
+        for template_dir in self.template_dirs:
+            if template_dir.isdir():
+                for template_file in template_dir.files():
+                    relpath = template_file.relative_to(template_dir)
+                    if relpath not in templates:
+                        st = template_file.stat()
+                        templates[relpath] = [st.st_size, st.st_mtime_ns]
+        return templates
+
+    def compile_templates(self):
+        """Precompile all the templates into python modules in .compiled_dir
+
+        :returns: int, how many templates were compiled
+        """
+        compiled_dir = self.compiled_dir
+        if compiled_dir.exists():
+            compiled_dir.clear()
+
+        count = 0
+        def log_function(msg):
+            nonlocal count
+            logger.debug(msg)
+            if msg.startswith("Compiled"):
+                count += 1
+
+        env = self.create_environment(
+            loader=FileSystemLoader(self.template_dirs)
+        )
+        env.compile_templates(
+            String(compiled_dir),
+            zip=None,
+            log_function=log_function,
+        )
+
+        compiled_dir.child_file("templates.json").write_text(
+            json.dumps(self.get_template_stats())
+        )
+        return count
+
     def get_template_name(self, template_name):
         parts = []
         prefix = self.config.get("template_prefix", "").strip("/")
@@ -291,9 +506,10 @@ class Theme(object):
 
         logger.debug(f"Rendering HTML with template: {template_name}")
 
+        head, body = self.config.get_injection()
         r = event.broadcast(
             'output.template',
-            html=HTML(html),
+            html=inject_html(html, head, body),
             template_name=template_name,
         )
         return r.html
@@ -306,10 +522,36 @@ class Theme(object):
         :param **kwargs: dict, all these will be passed to the template
         """
         html = self.render_template(template_name, **kwargs)
-        f = Filepath(filepath, encoding=self.config.encoding)
-        f.write_text(html)
+        if self.config.writer.write_text(filepath, html, self.config.encoding):
+            logger.debug(f"Rendered HTML written to: {filepath}")
+
+    def get_template_index(self):
+        """Returns the relpaths of all the files in the template directories
 
-        logger.debug(f"Rendered HTML written to: {f}")
+        The index is built once and then built again only if .template_dirs
+        changes (eg, a plugin appends a template directory), so checking if
+        a template exists never has to touch the filesystem
+
+        :returns: set[str]
+        """
+        key = tuple(self.template_dirs)
+        if getattr(self, "_template_index_key", None) != key:
+            index = set()
+            for template_dir in self.template_dirs:
+                template_dir = String(template_dir)
+                for basedir, dirnames, filenames in os.walk(template_dir):
+                    relbase = os.path.relpath(basedir, template_dir)
+                    for filename in filenames:
+                        relpath = os.path.normpath(
+                            os.path.join(relbase, filename)
+                        )
+                        index.add(relpath.replace(os.sep, "/"))
+
+            self._template_index = index
+            self._template_index_key = key
+            self._template_names = {}
+
+        return self._template_index
 
     def has_templates(self, dirname):
         """Return True if there is a directory in any of the template
@@ -320,16 +562,42 @@ class Theme(object):
             together
         :returns: bool
         """
-        for template_dir in self.template_dirs:
-            if template_dir.has_dir(dirname):
+        prefix = dirname.strip("/") + "/"
+        for relpath in self.get_template_index():
+            if relpath.startswith(prefix):
                 return True
         return False
 
     def has_template(self, template_name):
         """Return True if the theme contains template_name"""
         template_name, template_relpath = self.get_template_info(template_name)
-        for template_dir in self.template_dirs:
-            if template_dir.has_file(template_relpath):
-                return True
-        return False
+        return template_relpath in self.get_template_index()
+
+    def find_template(self, template_names):
+        """Return the first template name in template_names that the theme
+        contains
+
+        The answer is remembered for each distinct list of names, so every
+        instance of a Type class gets its template name without checking the
+        template index again
+
+        :param template_names: Sequence[str], the template names in the order
+            they should be tried
+        :returns: str|None, None if the theme has none of template_names
+        """
+        self.get_template_index()
+        key = (tuple(template_names), self.config.get("template_prefix", ""))
+        if key not in self._template_names:
+            template_name = None
+            for tn in template_names:
+                logger.debug(
+                    f"Attempting to use theme template [{self.name}.{tn}]"
+                )
+                if self.has_template(tn):
+                    template_name = tn
+                    break
+
+            self._template_names[key] = template_name
+
+        return self._template_names[key]
 
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+import logging
+
+from .compat import *
+from .path import Filepath
+from .types import Page
+
+
+logger = logging.getLogger(__name__)
+
+
+class Manifest(object):
+    """Keeps track of the state of every input file from the last output so
+    an incremental output can skip everything that hasn't changed since then
+
+    The manifest is saved as json in the project's cache directory and looks
+    something like this:
+
+        {
+            "fingerprint": "<HASH OF BANG VERSION, BANGFILES, CONFIG, AND THE
+                INJECTED HTML>",
+            "templates": {"<TEMPLATE RELPATH>": [<SIZE>, <MTIME>]},
+            "entries": {
+                "<INPUT PATH>": {
+                    "size": <SIZE>,
+                    "mtime": <MTIME>,
+                    "hash": "<MD5 OF CONTENTS, IF IT WAS NEEDED>",
+                    "output": "<OUTPUT RELPATH>",
+                    "template": "<TEMPLATE NAME>",
+                    "prev": "<PREV INPUT PATH>",
+                    "next": "<NEXT INPUT PATH>",
+                }
+            }
+        }
+
+    If the fingerprint of the previous output doesn't match the current
+    fingerprint then everything is considered modified
+    """
+    basename = "manifest.json"
+
+    def __init__(self, config):
+        self.config = config
+        self.path = Filepath(config.cache_dir, self.basename)
+
+        self.fingerprint = self.get_fingerprint()
+        self.templates = self.get_templates()
+        self.entries = {}
+
+        # the values from the previous output, these are populated in .load()
+        self.previous = {}
+
+    def get_fingerprint(self):
+        """Returns a hash of everything that could change the output of every
+        instance at once, if any of these change then everything needs to be
+        output again
+
+        :returns: str
+        """
+        from . import __version__
+
+        config = self.config
+        h = hashlib.md5()
+        h.update(String(__version__).encode())
+        h.update(String(config.output_dir).encode())
+        h.update(String(config.theme_name).encode())
+
+        bangfiles = [
+            Filepath(config.project.project_dir, "bangfile.py"),
+            Filepath(config.theme.theme_dir, "bangfile.py"),
+        ]
+        for bangfile in bangfiles:
+            if bangfile.isfile():
+                h.update(bangfile.read_bytes())
+
+        for k, v in sorted(config.fields.items(), key=lambda kv: kv[0]):
+            if v is None or isinstance(v, (basestring, int, float, bool)):
+                h.update(f"{k}={v}".encode())
+
+        # the injected html is in every page (eg, the links to the hashed
+        # assets) so when it changes every page has to be output again
+        with config.context("output") as output_config:
+            for html in output_config.get_injection():
+                h.update(html.encode())
+
+        return h.hexdigest()
+
+    def get_templates(self):
+        """Returns the size and modified time of every file in the theme's
+        template directories
+
+        :returns: dict[str, list[int, int]]
+        """
+        return self.config.theme.get_template_stats()
+
+    def load(self):
+        """Load the manifest from the previous output, if it exists"""
+        if self.path.isfile():
+            try:
+                self.previous = json.loads(self.path.read_text())
+
+            except ValueError as e:
+                logger.warning(f"Ignoring corrupt manifest {self.path}: {e}")
+                self.previous = {}
+
+    def save(self):
+        self.path.parent.touch()
+        self.path.write_text(json.dumps({
+            "fingerprint": self.fingerprint,
+            "templates": self.templates,
+            "entries": self.entries,
+        }))
+        logger.debug(f"Manifest with {len(self.entries)} entries saved")
+
+    def is_stale(self):
+        """Return True if nothing from the previous output can be reused"""
+        return self.previous.get("fingerprint", "") != self.fingerprint
+
+    def is_templates_modified(self):
+        """Return True if any of the template files have changed"""
+        return self.previous.get("templates", {}) != self.templates
+
+    def get_key(self, instance):
+        return String(instance.input_file) if instance else ""
+
+    def get_entry(self, instance, previous_entry=None):
+        """Create the manifest entry for instance
+
+        :param instance: Type
+        :param previous_entry: dict, the instance's entry from the previous
+            output. The input file is only hashed when its size is unchanged
+            but its modified time isn't, since that is the only time the hash
+            can tell us something the size and modified time can't
+        :returns: dict
+        """
+        st = self.config.project.file_index.stat(instance.input_file)
+        entry = {
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "hash": "",
+            "output": instance.output_file.relative_to(self.config.output_dir),
+        }
+
+        if previous_entry and previous_entry["size"] == entry["size"]:
+            if previous_entry["mtime"] == entry["mtime"]:
+                entry["hash"] = previous_entry["hash"]
+
+            else:
+                entry["hash"] = instance.input_file.checksum()
+
+        if isinstance(instance, Page):
+            entry["template"] = instance.template_name
+            entry["prev"] = self.get_key(instance.prev_instance)
+            entry["next"] = self.get_key(instance.next_instance)
+
+        return entry
+
+    def compile(self, types):
+        """Figure out which instances need to be output
+
+        :param types: dict[str, Types], the project's types
+        :returns: set[Type], the instances that have changed since the
+            previous output
+        """
+        modified = set()
+        previous_entries = self.previous.get("entries", {})
+        templates_modified = self.is_templates_modified()
+
+        for instances in types.values():
+            for instance in instances:
+                key = self.get_key(instance)
+                previous_entry = previous_entries.get(key, None)
+                entry = self.get_entry(instance, previous_entry)
+                self.entries[key] = entry
+
+                if previous_entry is None:
+                    modified.add(instance)
+
+                elif entry["size"] != previous_entry["size"]:
+                    modified.add(instance)
+
+                elif (
+                    entry["mtime"] != previous_entry["mtime"]
+                    and (
+                        not entry["hash"]
+                        or entry["hash"] != previous_entry["hash"]
+                    )
+                ):
+                    modified.add(instance)
+
+                elif entry["output"] != previous_entry["output"]:
+                    modified.add(instance)
+
+                elif isinstance(instance, Page):
+                    if templates_modified:
+                        modified.add(instance)
+
+                    else:
+                        for k in ["template", "prev", "next"]:
+                            if entry[k] != previous_entry.get(k, None):
+                                modified.add(instance)
+                                break
+
+        # pages output the titles of their neighbors so if a neighbor has
+        # changed then the page needs to be output again also
+        for instance in list(modified):
+            if isinstance(instance, Page):
+                for neighbor in [instance.prev_instance, instance.next_instance]:
+                    if neighbor:
+                        modified.add(neighbor)
+
+        return modified
+
+    def add(self, instance):
+        """Make sure instance is in the manifest, this is only needed for
+        instances that weren't seen in .compile()"""
+        key = self.get_key(instance)
+        if key not in self.entries:
+            self.entries[key] = self.get_entry(instance)
+
+    def clean(self, output_dir):
+        """Remove the outputs of the previous output that no instance outputs
+        anymore, this gets rid of the outputs of removed input files and the
+        old outputs of instances whose output path changed. This has to be
+        called after .compile()
+
+        Everything else is left alone, modified instances are output again
+        through the writer so unchanged files aren't rewritten, and the files
+        plugins generate (eg, assets, feeds and sitemaps) are left to them
+
+        :param output_dir: Dirpath
+        :returns: int, how many files were removed
+        """
+        output_dir = String(output_dir)
+        outputs = set(entry["output"] for entry in self.entries.values())
+        removed = 0
+
+        for entry in self.previous.get("entries", {}).values():
+            relpath = entry.get("output", "")
+            if not relpath or relpath in outputs:
+                continue
+
+            path = os.path.join(output_dir, relpath)
+            try:
+                os.unlink(path)
+
+            except FileNotFoundError:
+                continue
+
+            removed += 1
+
+            # remove any directories the file leaves empty
+            basedir = os.path.dirname(path)
+            while basedir != output_dir and basedir.startswith(output_dir):
+                try:
+                    os.rmdir(basedir)
+
+                except OSError:
+                    break
+
+                basedir = os.path.dirname(basedir)
+
+        logger.info(f"Removed {removed} file(s) from output directory")
+        return removed
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 #from collections import defaultdict
-from collections import Counter
+from collections import Counter, defaultdict
+import copy
+import hashlib
 import logging
+import threading
+import time
 
 import markdown
 from markdown.extensions.toc import TocExtension
@@ -76,23 +80,176 @@ class Markdown(markdown.Markdown):
 
         return instance
 
+    @property
+    def fingerprint(self):
+        """Returns a hash of all the registered processors, this will be
+        different for instances with different extensions
+
+        :returns: str
+        """
+        fingerprint = getattr(self, "_fingerprint", "")
+        if not fingerprint:
+            h = hashlib.md5()
+            h.update(String(markdown.__version__).encode())
+            h.update(String(self.output_format).encode())
+            for registry in [
+                self.preprocessors,
+                self.parser.blockprocessors,
+                self.inlinePatterns,
+                self.treeprocessors,
+                self.postprocessors,
+            ]:
+                for item in registry._priority:
+                    processor_class = registry[item.name].__class__
+                    h.update("{}:{}:{}.{}\n".format(
+                        item.name,
+                        item.priority,
+                        processor_class.__module__,
+                        processor_class.__qualname__,
+                    ).encode())
+
+            fingerprint = h.hexdigest()
+            self._fingerprint = fingerprint
+
+        return fingerprint
+
 #     def __init__(self, **kwargs):
 #         #self.registered_extension_names = set()
 #         super(Markdown, self).__init__(**kwargs)
 
+    resets = 0
+    """How many times .parse() and .serialize() have reset this instance"""
+
+    reset_time = 0.0
+    """How many seconds those resets took"""
+
     def reset(self):
+        """Clear everything left over from the previous document, the
+        htmlStash, references, and the state of every registered extension
+        (eg, Meta, footnotes, toc) are cleared by the parent"""
         super(Markdown, self).reset()
         self.page = None
+        self.embed_misses = []
+
+    def get_contextual_index(self):
+        """Returns the index of the first treeprocessor that depends on the
+        context (eg, AbsoluteLinkTreeprocessor), every treeprocessor from this
+        index on is run by .serialize() instead of .parse()
+
+        :returns: int
+        """
+        treeprocessors = list(self.treeprocessors)
+        for i, treeprocessor in enumerate(treeprocessors):
+            if getattr(treeprocessor, "contextual", False):
+                return i
+        return len(treeprocessors)
+
+    def start(self, page):
+        """Reset this instance so it can work on page"""
+        start = time.perf_counter()
+        self.reset()
+        self.reset_time += time.perf_counter() - start
+        self.resets += 1
+        self.page = page
+
+    def parse(self, page):
+        """The first phase of converting page's markdown body, this runs the
+        preprocessors, the block parser, and every treeprocessor that doesn't
+        depend on the context
 
-    def output(self, page):
+        :param page: Page
+        :returns: ParsedDocument, this can be passed to .serialize() of any
+            instance with the same extensions in any context
+        """
+        self.start(page)
+
+        source = String(page.body)
+        if not source.strip():
+            return ParsedDocument(None, [], {}, [])
+
+        self.lines = source.split("\n")
+        for prep in self.preprocessors:
+            self.lines = prep.run(self.lines)
+
+        root = self.parser.parseDocument(self.lines).getroot()
+
+        index = self.get_contextual_index()
+        for treeprocessor in list(self.treeprocessors)[:index]:
+            new_root = treeprocessor.run(root)
+            if new_root is not None:
+                root = new_root
+
+        return ParsedDocument(
+            root,
+            list(self.htmlStash.rawHtmlBlocks),
+            getattr(self, "Meta", {}),
+            list(self.embed_misses),
+        )
+
+    def serialize(self, page, parsed, copy_root=True):
+        """The second phase of converting page's markdown body, this runs the
+        treeprocessors that depend on the context on a copy of the parsed
+        tree and then serializes it and runs the postprocessors
+
+        :param page: Page
+        :param parsed: ParsedDocument, returned from .parse()
+        :param copy_root: bool, False if parsed won't be serialized again so
+            its tree can be changed in place
+        :returns: str, the html
+        """
+        self.start(page)
+        self.Meta = parsed.meta
+
+        if parsed.root is None:
+            return ""
+
+        self.htmlStash.rawHtmlBlocks = list(parsed.html_blocks)
+        self.htmlStash.html_counter = len(parsed.html_blocks)
+
+        root = copy.deepcopy(parsed.root) if copy_root else parsed.root
+        index = self.get_contextual_index()
+        for treeprocessor in list(self.treeprocessors)[index:]:
+            new_root = treeprocessor.run(root)
+            if new_root is not None:
+                root = new_root
+
+        # this is the end of the parent's .convert()
+        output = self.serializer(root)
+        if self.stripTopLevelTags:
+            try:
+                start = output.index(
+                    "<{}>".format(self.doc_tag)
+                ) + len(self.doc_tag) + 2
+                end = output.rindex("</{}>".format(self.doc_tag))
+                output = output[start:end].strip()
+
+            except ValueError as e:
+                if output.strip().endswith("<{} />".format(self.doc_tag)):
+                    output = ""
+
+                else:
+                    raise ValueError(
+                        "Markdown failed to strip top-level tags"
+                    ) from e
+
+        for pp in self.postprocessors:
+            output = pp.run(output)
+
+        return output.strip()
+
+    def output(self, page, parsed=None):
         """output the markdown body of the given Page instance
 
         :param page: Page, the page instance whose markdown body will be parsed
+        :param parsed: ParsedDocument, the already parsed body of page, see
+            .parse(), if this is None the body is parsed
         :returns: string, the html from Page.body
         """
-        self.reset()
-        self.page = page
-        return self.convert(page.body)
+        if parsed is None:
+            return self.serialize(page, self.parse(page), copy_root=False)
+
+        else:
+            return self.serialize(page, parsed)
 
 #     def convert(self, source):
 #         """This is the method that all the magic happens, so if you need to start peering
@@ -180,6 +337,8 @@ class Markdown(markdown.Markdown):
         return registry
 
     def register(self, extension, processor=None, priority="", **kwargs):
+        self._fingerprint = ""
+
         if processor:
             name = kwargs.get("name", String(processor.__class__.__name__))
             registry = self.registered(processor)
@@ -208,3 +367,188 @@ class Markdown(markdown.Markdown):
                 configs=kwargs.get("configs", {})
             )
 
+
+
+class ParsedDocument(object):
+    """The context independent result of Markdown.parse()
+
+    This is the element tree after the block parser and every treeprocessor
+    that doesn't depend on the context ran (eg, inline patterns, footnotes,
+    toc), the tree is never changed so it can be serialized in as many
+    contexts as needed, see Markdown.serialize()
+    """
+    __slots__ = ("root", "html_blocks", "meta", "embed_misses")
+
+    def __init__(self, root, html_blocks, meta, embed_misses):
+        """
+        :param root: xml.etree.ElementTree.Element|None, None if the body was
+            empty
+        :param html_blocks: list, the raw html the htmlStash held
+        :param meta: dict, the meta extension's values
+        :param embed_misses: list[str], the urls of the remote embeds that
+            weren't cached so they were left as links
+        """
+        self.root = root
+        self.html_blocks = html_blocks
+        self.meta = meta
+        self.embed_misses = embed_misses
+
+
+class MarkdownPool(object):
+    """Holds the Markdown instances of a project
+
+    Creating a Markdown instance sets up every extension, so instances are
+    created once and reused, each thread checks out its own instance for each
+    (extensions, context) key and keeps it until it checks them back in, so
+    two threads never convert with the same instance at the same time.
+    Between pages an instance is only reset, see Markdown.output()
+
+    Page checks its instance back in after each parse and serialize, so a
+    thread holds an instance only while it is converting
+
+    :Example:
+        pool = MarkdownPool(config)
+        md = pool.checkout()
+        try:
+            html = md.output(page)
+
+        finally:
+            pool.checkin()
+    """
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        # every instance that was created and the instances that aren't
+        # checked out by a thread, both keyed by .get_key()
+        self.instances = defaultdict(list)
+        self.available = defaultdict(list)
+        self.create_time = 0.0
+
+        # Markdown.fingerprint of the instances of each key
+        self.fingerprints = {}
+
+    def get_extensions_fingerprint(self, extensions):
+        """Returns a hash of the configured extensions list
+
+        :param extensions: list[str|markdown.Extension]|None, None is the
+            default extensions of Markdown.create_extensions()
+        :returns: str
+        """
+        if not extensions:
+            return "default"
+
+        h = hashlib.md5()
+        for extension in extensions:
+            if isinstance(extension, basestring):
+                h.update(f"{extension}\n".encode())
+
+            else:
+                extension_class = extension.__class__
+                h.update("{}.{}:{}\n".format(
+                    extension_class.__module__,
+                    extension_class.__qualname__,
+                    sorted(extension.getConfigs().items()),
+                ).encode())
+
+        return h.hexdigest()
+
+    def get_key(self, extensions=None):
+        return (
+            self.get_extensions_fingerprint(extensions),
+            self.config.context_name(),
+        )
+
+    def checkout(self):
+        """Returns the current thread's Markdown instance for the current
+        context, the instance is created if there isn't one available
+
+        :returns: Markdown
+        """
+        checked_out = getattr(self.local, "instances", None)
+        if checked_out is None:
+            checked_out = self.local.instances = {}
+
+        extensions = self.config.get("markdown_extensions", None)
+        key = self.get_key(extensions)
+        md = checked_out.get(key)
+        if md is None:
+            with self.lock:
+                available = self.available[key]
+                md = available.pop() if available else None
+
+            if md is None:
+                logger.debug(
+                    f"Creating Markdown instance for context [{key[1]}]"
+                )
+                start = time.perf_counter()
+                md = Markdown.create_instance(
+                    self.config,
+                    extensions=extensions
+                )
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    self.create_time += elapsed
+                    self.instances[key].append(md)
+
+            checked_out[key] = md
+
+        return md
+
+    def get_fingerprint(self):
+        """Returns the Markdown.fingerprint of the instances for the current
+        context, this doesn't leave anything checked out so it doesn't need
+        a .checkin()
+
+        :returns: str
+        """
+        key = self.get_key(self.config.get("markdown_extensions", None))
+        fingerprint = self.fingerprints.get(key)
+        if fingerprint is None:
+            checked_out = getattr(self.local, "instances", None) or {}
+            md = checked_out.get(key)
+            if md is None:
+                md = self.checkout()
+                fingerprint = md.fingerprint
+                # nothing was converted so the instance doesn't need a reset
+                self.local.instances.pop(key)
+                with self.lock:
+                    self.available[key].append(md)
+
+            else:
+                fingerprint = md.fingerprint
+
+            self.fingerprints[key] = fingerprint
+
+        return fingerprint
+
+    def checkin(self):
+        """Give every instance the current thread checked out back to the
+        pool, this should be called when a thread is done converting"""
+        checked_out = getattr(self.local, "instances", None)
+        if checked_out:
+            with self.lock:
+                for key, md in checked_out.items():
+                    md.reset()
+                    self.available[key].append(md)
+            checked_out.clear()
+
+    def get_stats(self):
+        """Returns how many instances were created and how much the creates
+        and resets cost
+
+        :returns: dict
+        """
+        with self.lock:
+            instances = [md for mds in self.instances.values() for md in mds]
+
+        resets = sum(md.resets for md in instances)
+        reset_time = sum(md.reset_time for md in instances)
+        return {
+            "instances": len(instances),
+            "create_time": self.create_time,
+            "resets": resets,
+            "reset_time": reset_time,
+            "reset_avg": reset_time / resets if resets else 0.0,
+        }
@@ -26,6 +26,85 @@ class Postprocessor(BasePostprocessor):
         raise NotImplementedError()
 
 
+class BlockClassifier(object):
+    """Cheap checks of a paragraph block that bang's block processors share
+
+    Every block processor's .test() is called with every paragraph block, and
+    most of those blocks are plain prose that none of them want. A block is
+    classified once, by looking at only its first and last characters, and
+    then every processor can reject it with a bitmask check before any regex
+    runs
+
+    Use .get_instance(md) so every processor of a Markdown instance shares
+    one classifier
+
+    :Example:
+        classifier = BlockClassifier.get_instance(md)
+        if classifier.classify(block) & BlockClassifier.URL:
+            # block might be a url on its own
+            pass
+    """
+    IMAGE = 1
+    """The block could be a markdown image or an image in a link"""
+
+    URL = 2
+    """The block could be a url on its own"""
+
+    IMAGE_PATH = 4
+    """The block could be the path of an image on its own"""
+
+    image_ends = frozenset("gGfFpPoO")
+    """The last characters of the image extensions that can be embedded
+    (eg, jpg, gif, bmp, png, ico, tiff)"""
+
+    @classmethod
+    def get_instance(cls, md):
+        instance = getattr(md, "block_classifier", None)
+        if instance is None:
+            instance = cls()
+            md.block_classifier = instance
+        return instance
+
+    def __init__(self):
+        self.block = None
+        self.stripped = ""
+        self.kinds = 0
+
+    def classify(self, block):
+        """Returns the kinds block could be
+
+        :param block: str
+        :returns: int, the bitmask of .IMAGE, .URL, and .IMAGE_PATH, 0 if
+            block is prose
+        """
+        if block is not self.block:
+            stripped = block.strip()
+            kinds = 0
+            if stripped:
+                first = stripped[0]
+                if first == "!" or first == "[":
+                    kinds = self.IMAGE
+
+                elif (first == "h" or first == "H") and (
+                    stripped[:4].lower() == "http"
+                ):
+                    kinds = self.URL
+
+                if stripped[-1] in self.image_ends:
+                    kinds |= self.IMAGE_PATH
+
+            self.block = block
+            self.stripped = stripped
+            self.kinds = kinds
+
+        return self.kinds
+
+    def strip(self, block):
+        """Returns block stripped of surrounding whitespace"""
+        self.classify(block)
+        return self.stripped
+
+
 class Blockprocessor(BaseBlockprocessor):
     """Fixes differences between BlockProcessor and the other extension processors
 
@@ -37,6 +116,7 @@ class Blockprocessor(BaseBlockprocessor):
         Markdown instance like every other processor, so this normalizes that so
         it acts like all the others"""
         self.md = md
+        self.classifier = BlockClassifier.get_instance(md)
         super(Blockprocessor, self).__init__(md.parser)
 
     def test(self, parent, block):
@@ -54,6 +134,11 @@ class Treeprocessor(BaseTreeprocessor):
     https://python-markdown.github.io/extensions/api/#working_with_et
     http://effbot.org/zone/element-index.htm#documentation
     """
+    contextual = False
+    """True if what this does depends on the context (eg, the scheme or host),
+    contextual treeprocessors are run every time a page is serialized in a
+    new context instead of once when it is parsed, see Markdown.parse()"""
+
     def dump(self, elem):
         """dump elem to stdout to debug"""
         return etree.dump(elem)
@@ -14,6 +14,8 @@ class AbsoluteLinkTreeprocessor(Treeprocessor):
     http://effbot.org/zone/pythondoc-elementtree-ElementTree.htm
     https://github.com/waylan/Python-Markdown/blob/master/markdown/treeprocessors.py
     """
+    contextual = True
+
     def normalize_url(self, url):
         """normalizes the url into a full url"""
         p = self.md.page
@@ -4,13 +4,19 @@ import tempfile
 import json
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import xml.etree.ElementTree as etree
 #import requests
 
 from ...path import Dirpath
-from . import Extension, Postprocessor, Blockprocessor as BaseBlockprocessor
-from ...utils import HTML, HTTPClient
+from . import (
+    Extension,
+    Postprocessor,
+    Blockprocessor as BaseBlockprocessor,
+    BlockClassifier,
+)
+from ...utils import HTTPClient
 
 
 logger = logging.getLogger(__name__)
@@ -51,24 +57,54 @@ class LinkifyPostprocessor(Postprocessor):
         )
       )''', re.I | re.X)
 
+    PREFILTER_RE = re.compile(
+        r"[\w-]:[/a-z0-9%]|www\d{0,3}\.|[a-z0-9.\-]\.[a-z]{2,4}/",
+        re.I
+    )
+    """Matches the start of anything LINKIFY_RE can match, html without a
+    match doesn't need to be tokenized at all. These are the three url
+    starts of LINKIFY_RE without their + quantifiers, so this never misses a
+    url but also never backtracks through every word of the html"""
+
+    TAG_RE = re.compile(
+        r"""
+        <!--.*?-->
+        |
+        <(?P<tagname>a|pre|code|script|style)\b[^>]*>.*?</(?P=tagname)\s*>
+        |
+        <[^>]*>
+        """,
+        re.I | re.S | re.X
+    )
+    """Matches comments, tags, and whole elements whose text shouldn't be
+    linked"""
+
+    def linkify_callback(self, m):
+        return '<a class="embed" href="{}">{}</a>'.format(
+            m.group(0),
+            m.group(0)
+        )
+
+    def linkify(self, text):
+        """Link the urls in plain text"""
+        return self.LINKIFY_RE.sub(self.linkify_callback, text)
+
     def run(self, text):
-        def subn_callback(m):
-            return '<a class="embed" href="{}">{}</a>'.format(
-                m.group(0),
-                m.group(0)
-            )
+        if not self.PREFILTER_RE.search(text):
+            return text
 
-        text_linked = ""
-        s = HTML(text)
-        for tag, plain in s.blocks(ignore_tagnames=["a", "pre"]):
-            plain_linked, made = self.LINKIFY_RE.subn(
-                subn_callback, # r'<a class="embed" href="\0">\0</a>',
-                plain
-            )
-            text_linked += tag
-            text_linked += plain_linked
+        parts = []
+        start = 0
+        for m in self.TAG_RE.finditer(text):
+            if start < m.start():
+                parts.append(self.linkify(text[start:m.start()]))
+            parts.append(m.group(0))
+            start = m.end()
+
+        if start < len(text):
+            parts.append(self.linkify(text[start:]))
 
-        return text_linked
+        return "".join(parts)
 
 
 class Blockprocessor(BaseBlockprocessor):
@@ -79,8 +115,17 @@ class Blockprocessor(BaseBlockprocessor):
         m = self.id_regex.search(url)
         return m.group(1) if m else None
 
+    block_kind = BlockClassifier.URL
+    """Blocks that can't be this kind are rejected before .test_regex runs,
+    see BlockClassifier"""
+
     def test(self, parent, block):
-        return self.test_regex.match(block.strip()) and self.get_id(block)
+        classifier = self.classifier
+        return (
+            classifier.classify(block) & self.block_kind
+            and self.test_regex.match(classifier.stripped)
+            and self.get_id(block)
+        )
 
     def get_figure(self, parent, name):
         if self.parser.md.output_format in ["html"]:
@@ -125,7 +170,111 @@ class YoutubeProcessor(Blockprocessor):
             figure.text = placeholder
 
 
-class TwitterProcessor(Blockprocessor):
+class RemoteProcessor(Blockprocessor):
+    """Base class for embeds whose html has to be fetched (eg, tweets)
+
+    The html is never fetched while rendering, EmbedResolver fetches the
+    embeds of all the pages of an output before they are rendered and saves
+    them in the project's EmbedCache, this only ever looks in the cache. A
+    link that isn't cached stays a link
+    """
+    filename = ""
+    """The basename of the legacy cache file in a page's _embed directory"""
+
+    base_url = ""
+    """The oEmbed endpoint"""
+
+    name = ""
+    """The embeds of this processor are stored under this name"""
+
+    def get_cache_directory(self, input_dir=None):
+        """
+        :param input_dir: Dirpath, the input directory of a page, defaults to
+            the input directory of the page being rendered
+        """
+        input_dir = input_dir or self.md.page.input_dir
+        return Dirpath(input_dir, "_embed")
+
+    def read_cache(self, input_dir=None):
+        """Read the legacy per directory cache (eg, _embed/twitter.json),
+        these files are only read now, their embeds are moved into the
+        project's EmbedCache by EmbedResolver"""
+        cache = {}
+        d = self.get_cache_directory(input_dir)
+        if d.has_file(self.filename):
+            contents = d.file_bytes(self.filename)
+            if contents:
+                cache = json.loads(contents)
+        return cache
+
+    def get_html(self, url, body):
+        return body["html"]
+
+    def get_embed_code(self, url):
+        """Returns the cached html of url, expired embeds are still used
+        since refreshing them is EmbedResolver's job
+
+        :returns: str, empty if url isn't cached
+        """
+        body = self.md.config.embed_cache.get(self.name, url, ttl=0)
+        if body is None:
+            body = self.read_cache().get(url)
+
+        if body:
+            return self.get_html(url, body)
+
+        logger.warning(f"Embed for {url} isn't cached")
+        self.md.embed_misses.append(url)
+        return ""
+
+    def get_response(self, url, timeout=None, **params):
+        """Fetch the embed of url, this is called from EmbedResolver
+
+        :param url: str
+        :param timeout: float, seconds, defaults to HTTPClient.timeout
+        :returns: tuple[str, dict], the html and the response body, both
+            are empty if the fetch failed
+        """
+        html = ""
+        body = {}
+
+        params["url"] = url
+        kwargs = {"timeout": timeout} if timeout else {}
+        try:
+            res = HTTPClient().get(self.base_url, params, **kwargs)
+            if res.status_code >= 200 and res.status_code < 400:
+                body = res.json()
+                html = self.get_html(url, body)
+
+            else:
+                logger.error("Embed for {} failed with code {}".format(
+                    url,
+                    res.status_code
+                ))
+
+        except (OSError, ValueError, KeyError) as e:
+            # this catches timeouts and connection errors, and responses that
+            # aren't an oembed json body (eg, an html error page)
+            logger.error(f"Embed for {url} failed: {e}")
+            html = ""
+            body = {}
+
+        return html, body
+
+    def run(self, parent, blocks):
+        url = blocks[0].strip()
+        html = self.get_embed_code(url)
+        if not html:
+            # the block is left for the other processors
+            return False
+
+        blocks.pop(0)
+        figure = self.get_figure(parent, self.name)
+        placeholder = self.parser.md.htmlStash.store(html)
+        figure.text = placeholder
+
+
+class TwitterProcessor(RemoteProcessor):
     """
     https://dev.twitter.com/rest/reference/get/statuses/oembed
     https://dev.twitter.com/web/embedded-tweets
@@ -143,69 +292,132 @@ class TwitterProcessor(Blockprocessor):
 
     name = "twitter"
 
-    def get_cache_directory(self):
-        cache_dir = self.md.page.input_dir.child_dir("_embed")
-        return Dirpath(cache_dir)
-
-    def read_cache(self):
-        cache = {}
-        d = self.get_cache_directory()
-        contents = d.file_bytes(self.filename)
-        if contents:
-            cache = json.loads(contents)
-        return cache
-
-    def write_cache(self, cache):
-        d = self.get_cache_directory()
-        contents = json.dumps(cache)
-        d.add_file(self.filename, contents)
-
-    def get_html(self, url, body):
-        return body["html"]
-
-    def get_embed_code(self, url):
-        cache = self.read_cache()
-
-        # first we check cache, if it isn't in cache then we query twitter
-        if url in cache:
-            body = cache[url]
-            html = self.get_html(url, body)
 
-        else:
-            html, body = self.get_response(url)
-            cache[url] = body
-            self.write_cache(cache)
-
-        return html
+class EmbedResolver(object):
+    """Fetches the remote embeds of pages before they are rendered
 
-    def get_response(self, url, **params):
-        html = ""
-        body = {}
+    The bodies of the pages are scanned for links the RemoteProcessors of a
+    markdown instance would embed, and every one that isn't in the project's
+    EmbedCache is fetched concurrently, so rendering never waits on the
+    network. A link is only fetched once even if it is embedded in more than
+    one page
 
-        params["url"] = url
-        res = HTTPClient().get(self.base_url, params)
-
-        if res.status_code >= 200 and res.status_code < 400:
-            body = res.json()
-            html = self.get_html(url, body)
-
-        else:
-            logger.error("Embed for {} failed with code {}".format(
-                url,
-                res.status_code
-            ))
-
-        return html, body
-
-    def run(self, parent, blocks):
-        url = blocks.pop(0).strip()
-        html = self.get_embed_code(url)
-
-        # if we have the contents then we can load them up
-        if html:
-            figure = self.get_figure(parent, self.name)
-            placeholder = self.parser.md.htmlStash.store(html)
-            figure.text = placeholder
+    :Example:
+        resolver = EmbedResolver(config.markdown, max_workers=8)
+        resolver.resolve(pages)
+    """
+    block_regex = re.compile(r"\n\s*\n")
+
+    def __init__(self, md, max_workers=8, timeout=10, offline=False):
+        """
+        :param md: Markdown, the processors and embed cache of this instance
+            are used
+        :param max_workers: int, the most fetches that can happen at once
+        :param timeout: float, seconds to wait for each fetch
+        :param offline: bool, if True nothing is fetched, the embeds that
+            would have been fetched are reported and kept in .misses
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.offline = offline
+        self.misses = []
+        self.processors = [
+            processor
+            for processor in md.parser.blockprocessors
+            if isinstance(processor, RemoteProcessor)
+        ]
+        self.store = md.config.embed_cache if self.processors else None
+
+    def find_urls(self, page):
+        """yields (processor, url) for each remote embed in page's body"""
+        for block in self.block_regex.split(page.body):
+            block = block.strip()
+            if "://" in block:
+                for processor in self.processors:
+                    if processor.test(None, block):
+                        yield processor, block
+                        break
+
+    def find_fetches(self, pages):
+        """Find the embeds of pages that need to be fetched, embeds in legacy
+        per directory caches are moved into the store instead
+
+        :returns: list[tuple[RemoteProcessor, str]]
+        """
+        store = self.store
+        seen = set()
+        fetches = []
+        imports = {}
+        for page in pages:
+            for processor, url in self.find_urls(page):
+                if (processor, url) in seen:
+                    continue
+
+                seen.add((processor, url))
+                if store.get(processor.name, url) is not None:
+                    continue
+
+                # legacy caches are only checked for embeds the store has
+                # never seen, otherwise an expired embed would never be
+                # fetched again
+                if store.get(processor.name, url, ttl=0) is None:
+                    body = processor.read_cache(page.input_dir).get(url)
+                    if body:
+                        imports.setdefault(processor.name, {})[url] = body
+                        continue
+
+                fetches.append((processor, url))
+
+        for name, bodies in imports.items():
+            logger.debug(f"Moving {len(bodies)} {name} embed(s) to the store")
+            store.set_many(name, bodies)
+
+        return fetches
+
+    def resolve(self, pages):
+        """Fetch every embed of pages that isn't cached and add it to the
+        project's embed cache
+
+        :param pages: Iterable[Page]
+        :returns: int, how many embeds were fetched
+        """
+        if not self.processors:
+            return 0
+
+        fetches = self.find_fetches(pages)
+        if not fetches:
+            return 0
+
+        if self.offline:
+            self.misses = [url for processor, url in fetches]
+            logger.warning(
+                f"Offline, {len(self.misses)} embed(s) aren't cached:"
+            )
+            for url in self.misses:
+                logger.warning(f"    {url}")
+            return 0
+
+        logger.info(f"Fetching {len(fetches)} embed(s)")
+        bodies = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(
+                    processor.get_response,
+                    url,
+                    timeout=self.timeout
+                ): (processor, url)
+                for processor, url in fetches
+            }
+            for future in as_completed(futures):
+                processor, url = futures[future]
+                html, body = future.result()
+                if html:
+                    bodies.setdefault(processor.name, {})[url] = body
+
+        for name, name_bodies in bodies.items():
+            self.store.set_many(name, name_bodies)
+
+        return len(fetches)
 
 
 class VimeoProcessor(Blockprocessor):
@@ -262,6 +474,8 @@ class EmbedImageProcessor(Blockprocessor):
     def get_id(self, url):
         return True
 
+    block_kind = BlockClassifier.IMAGE_PATH
+
     def run(self, parent, blocks):
         block = blocks.pop(0).strip()
         figure = self.get_figure(parent, "image")
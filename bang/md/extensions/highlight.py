@@ -1,14 +1,32 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 import re
+import hashlib
+import logging
 from xml.sax.saxutils import escape
 
 from markdown.extensions import fenced_code
 
+try:
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+    from pygments.formatters import HtmlFormatter
+    from pygments.util import ClassNotFound
+
+except ImportError:
+    highlight = None
+
+
+logger = logging.getLogger(__name__)
+
 
 class CodeBlockPreprocessor(fenced_code.FencedBlockPreprocessor):
     """Generates compatible code blocks that can be used with default highlight.js
 
+    If config.highlight_code is True and pygments is installed then the code
+    blocks are highlighted when the markdown is rendered instead of in the
+    browser
+
     https://github.com/waylan/Python-Markdown/blob/master/markdown/preprocessors.py
     """
     FENCED_BLOCK_RE = re.compile(
@@ -16,26 +34,92 @@ class CodeBlockPreprocessor(fenced_code.FencedBlockPreprocessor):
         re.MULTILINE | re.DOTALL | re.VERBOSE
     )
 
+    highlighted = {}
+    """(lang, md5 of code) -> highlighted html, this is shared by every
+    instance so a snippet is only ever highlighted once"""
+
+    max_highlighted = 4096
+    """When .highlighted gets this big it is cleared"""
+
+    warned = False
+
+    def is_highlighting(self):
+        """Return True if code blocks should be highlighted server side"""
+        config = getattr(self.md, "config", None)
+        if config and config.get("highlight_code", False):
+            if highlight:
+                return True
+
+            if not CodeBlockPreprocessor.warned:
+                CodeBlockPreprocessor.warned = True
+                logger.warning(
+                    "config.highlight_code needs pygments, highlight.js will"
+                    " be used instead"
+                )
+
+        return False
+
+    def highlight_code(self, lang, code):
+        """Returns the highlighted html of code, or None if there isn't a
+        lexer for lang
+
+        :param lang: str
+        :param code: str, the code, already stripped
+        :returns: str|None
+        """
+        key = (lang, hashlib.md5(code.encode("UTF-8")).hexdigest())
+        html = self.highlighted.get(key)
+        if html is None:
+            try:
+                lexer = get_lexer_by_name(lang)
+
+            except ClassNotFound:
+                html = ""
+
+            else:
+                html = highlight(code, lexer, HtmlFormatter(nowrap=True))
+                html = html.rstrip("\n")
+
+            if len(self.highlighted) >= self.max_highlighted:
+                self.highlighted.clear()
+            self.highlighted[key] = html
+
+        return html or None
+
     def run(self, lines):
         """ Match and store Fenced Code Blocks in the HtmlStash. """
         text = "\n".join(lines)
-        while True:
-            m = self.FENCED_BLOCK_RE.search(text)
-            if m:
-                lang = ' nohighlight' # https://highlightjs.org/usage/
-                if m.group('lang'):
-                    lang = ' ' + m.group('lang')
+        highlighting = None
+        parts = []
+        start = 0
+        for m in self.FENCED_BLOCK_RE.finditer(text):
+            if highlighting is None:
+                highlighting = self.is_highlighting()
+
+            lang = ' nohighlight' # https://highlightjs.org/usage/
+            code = m.group('code').strip()
+            block = None
+            if m.group('lang'):
+                lang = ' ' + m.group('lang')
+                if highlighting:
+                    block = self.highlight_code(m.group('lang'), code)
+                    if block is not None:
+                        lang += " highlight"
 
+            if block is None:
                 # https://wiki.python.org/moin/EscapingHtml
-                block = escape(m.group('code').strip())
-                code = '<pre><code class="codeblock{}">{}</code></pre>'.format(lang, block)
-                placeholder = self.md.htmlStash.store(code)
-                text = '{}\n{}\n{}'.format(text[:m.start()], placeholder, text[m.end():])
+                block = escape(code)
 
-            else:
-                break
+            code = '<pre><code class="codeblock{}">{}</code></pre>'.format(lang, block)
+            placeholder = self.md.htmlStash.store(code)
+            parts.extend([text[start:m.start()], "\n", placeholder, "\n"])
+            start = m.end()
+
+        if not parts:
+            return lines
 
-        return text.split("\n")
+        parts.append(text[start:])
+        return "".join(parts).split("\n")
 
 
 class HighlightExtension(fenced_code.FencedCodeExtension):
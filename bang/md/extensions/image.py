@@ -15,7 +15,7 @@ from markdown.inlinepatterns import (
 #     REFERENCE_RE, IMAGE_REFERENCE_RE
 
 from .absolutelink import AbsoluteLinkTreeprocessor
-from . import Extension, Blockprocessor
+from . import Extension, Blockprocessor, BlockClassifier
 
 
 def lazyload(config, el):
@@ -31,6 +31,8 @@ class ImageTreeprocessor(AbsoluteLinkTreeprocessor):
     """support for ImageExtension, this just goes through and makes sure any img
     element in a figure element has a figcaption if the img element has a title
     attribute"""
+    contextual = False
+
     def run(self, doc):
         for elem in self.get_tags(doc, "figure"):
             for child in self.get_tags(elem, "img"):
@@ -103,32 +105,38 @@ class ImageProcessor(Blockprocessor):
 
     IMAGE_REFERENCE_REGEX = r'\!' + BRK + r'\s?\[([^\]]*)\]'
 
+    LINK_BLOCK_RES = [
+        re.compile(r"^\s*{}\s*$".format(LINK_REGEX)),
+        re.compile(r"^\s*{}\s*$".format(REFERENCE_REGEX)),
+    ]
+    """A block that is only a link"""
+
+    IMAGE_RES = [
+        re.compile(IMAGE_LINK_REGEX),
+        re.compile(IMAGE_REFERENCE_REGEX),
+    ]
+    """An image anywhere in a block"""
+
+    IMAGE_BLOCK_RES = [
+        re.compile(r"^\s*{}\s*$".format(IMAGE_LINK_REGEX)),
+        re.compile(r"^\s*{}\s*$".format(IMAGE_REFERENCE_REGEX)),
+    ]
+    """A block that is only an image"""
+
     def test(self, parent, block):
         # figure tag isn't part of xhtml 1.0
         # https://www.w3.org/2010/04/xhtml10-strict.html
         if self.md.output_format not in ["html"]:
             return False
 
-        is_link = False
-        for regex in [self.LINK_REGEX, self.REFERENCE_REGEX]:
-            regex = r"^\s*{}\s*$".format(regex)
-            if re.match(regex, block):
-                is_link = True
-                break
-
-        is_image = False
-        for regex in [self.IMAGE_LINK_REGEX, self.IMAGE_REFERENCE_REGEX]:
-            if is_link:
-                if re.search(regex, block):
-                    is_image = True
-                    break
-            else:
-                regex = r"^\s*{}\s*$".format(regex)
-                if re.match(regex, block):
-                    is_image = True
-                    break
-
-        return is_image
+        if not self.classifier.classify(block) & BlockClassifier.IMAGE:
+            return False
+
+        if any(regex.match(block) for regex in self.LINK_BLOCK_RES):
+            # a link that is an image
+            return any(regex.search(block) for regex in self.IMAGE_RES)
+
+        return any(regex.match(block) for regex in self.IMAGE_BLOCK_RES)
 
     def run(self, parent, blocks):
         block = blocks.pop(0)
@@ -9,6 +9,10 @@ class Sub(object):
     """where all the magic happens, the other classes are mainly boilerplate
     and configuration, this class does the actual searching and replacing of
     the refs
+
+    The whole document is tokenized with one regex, fenced code blocks and
+    inline code spans are matched as tokens of their own so any refs in them
+    are left alone
     """
     def __init__(self, placeholder):
         self.index = 1
@@ -16,11 +20,31 @@ class Sub(object):
         self.link_placeholders = []
         self.footnote_placeholders = []
 
-        self.link_regex = re.compile(r"(?<=\])\[{}\]".format(placeholder))
-        self.def_link_regex = re.compile(r"^\[{}]:".format(placeholder))
-
-        self.footnote_regex = re.compile(r"(?<!^)\[\^{}\]".format(placeholder))
-        self.def_footnote_regex = re.compile(r"^\[\^{}\]:".format(placeholder))
+        placeholder = re.escape(placeholder)
+        # every token starts with ` or [, the lookahead lets the regex
+        # engine skip everything else quickly
+        self.regex = re.compile(
+            r"""
+            (?=[`\[])
+            (?:
+                (?P<fence>
+                    ^(?P<fence_ticks>`{{3,}})(?s:.*?)\n(?P=fence_ticks)[ ]*$
+                )
+                |
+                (?P<code>(?P<code_ticks>`+).*?(?<!`)(?P=code_ticks)(?!`))
+                |
+                \[
+                (?:
+                    (?P<def>(?<=^\[)\^?{placeholder}\]:)
+                    |
+                    (?P<link>(?<=\]\[){placeholder}\])
+                    |
+                    (?P<footnote>(?<!^\[)\^{placeholder}\])
+                )
+            )
+            """.format(placeholder=placeholder),
+            re.M | re.X
+        )
 
     def callback(self, m):
         fn_id = "^" if "^" in m.group(0) else ""
@@ -41,43 +65,34 @@ class Sub(object):
             ret = self.link_placeholders.pop(0)
         return ret + ":"
 
-    def sub(self, line):
-
-        # this ignores inline codeblocks from being evaluated
-        def bits(line):
-            chars = []
-            ignore = False
-            for c in line:
-                if c == '`':
-                    if ignore:
-                        chars.append(c)
-                        yield "".join(chars), ignore
-                        chars = []
-                        ignore = False
-                    else:
-                        yield "".join(chars), ignore
-                        chars = [c]
-                        ignore = True
-                else:
-                    chars.append(c)
-
-            yield "".join(chars), ignore
-
-
-        ret = []
-        for bit, ignore in bits(line):
-            if ignore:
-                ret.append(bit)
+    def sub(self, text):
+        """Replace all the magic refs in text
+
+        :param text: str, the whole document
+        :returns: str
+        """
+        parts = []
+        start = 0
+        for m in self.regex.finditer(text):
+            kind = m.lastgroup
+            if kind == "def":
+                ret = self.def_callback(m)
+
+            elif kind == "link" or kind == "footnote":
+                ret = self.callback(m)
+
             else:
-                bit = self.link_regex.sub(self.callback, bit)
-                bit = self.def_link_regex.sub(self.def_callback, bit)
+                continue
 
-                bit = self.footnote_regex.sub(self.callback, bit)
-                bit = self.def_footnote_regex.sub(self.def_callback, bit)
+            parts.append(text[start:m.start()])
+            parts.append(ret)
+            start = m.end()
 
-                ret.append(bit)
+        if not parts:
+            return text
 
-        return "".join(ret)
+        parts.append(text[start:])
+        return "".join(parts)
 
 
 class MagicRefPreprocessor(Preprocessor):
@@ -89,12 +104,11 @@ class MagicRefPreprocessor(Preprocessor):
         self.config = config
 
     def run(self, lines):
-        ret = []
-        placeholder = self.config["EASY_PLACEHOLDER"]
         s = Sub(self.config["EASY_PLACEHOLDER"])
-        for line in lines:
-            # TODO -- this should skip ``` codeblocks
-            ret.append(s.sub(line))
+        text = "\n".join(lines)
+        ret = s.sub(text)
+        if ret is not text:
+            lines = ret.split("\n")
 
         if len(s.footnote_placeholders) > 0:
             raise RuntimeError("Mismatched magic footnotes")
@@ -102,7 +116,7 @@ class MagicRefPreprocessor(Preprocessor):
         if len(s.link_placeholders) > 0:
             raise RuntimeError("Mismatched magic links")
 
-        return ret
+        return lines
 
 
 class MagicRefExtension(Extension):
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+Pure python CSS and javascript minification with source maps
+
+This is deliberately conservative, it removes comments, indentation, blank
+lines, and the whitespace around punctuation that can never need it. It
+doesn't rename or rewrite anything, so it can't change what the code does.
+Javascript keeps its newlines so automatic semicolon insertion still works
+
+:Example:
+    sm = SourceMap()
+    sm.add("/assets/app.css", minify_css(css_text))
+    text = sm.text
+    map_json = sm.json("app.min.css")
+"""
+import re
+import json
+
+from .compat import *
+
+
+class Minifier(object):
+    """Splits code into lines of code and literals (strings, template
+    literals, regexes) with the comments removed, and then removes the
+    whitespace from the code
+
+    This is the base class, see CSSMinifier and JSMinifier
+    """
+    quotes = "\"'"
+    """The characters that start a string"""
+
+    line_comments = False
+    """True if // starts a comment"""
+
+    regex_literals = False
+    """True if / can start a regex literal"""
+
+    head_keywords = set()
+    """A ( after these keywords starts the head of a statement (eg, if), a /
+    after the ) that closes the head starts a regex"""
+
+    punctuation = ""
+    """Whitespace around these characters is removed"""
+
+    def __init__(self):
+        self.punctuation_regex = re.compile(
+            r"\s*([{}])\s*".format(re.escape(self.punctuation))
+        )
+        self.whitespace_regex = re.compile(r"\s+")
+
+    def tokenize(self, text):
+        """Splits text into lines
+
+        :param text: str
+        :returns: generator[tuple[int, list[tuple[bool, str]], bool]], the
+            0-based line number, the (is_code, text) segments of the line,
+            and True if the line can't be removed or joined to another line
+            because it starts or ends inside a literal
+        """
+        lineno = 0
+        segments = []
+        code = []
+        literal = []
+        pinned = False
+        # the last significant code character, this is used to decide if a /
+        # is division or the start of a regex
+        last = ""
+        last_word = ""
+        in_word = False
+        # True for each open ( that started a statement head, and True if the
+        # last significant character was the ) that closed a statement head
+        parens = []
+        after_head = False
+        i = 0
+        length = len(text)
+
+        def flush_code():
+            if code:
+                segments.append((True, "".join(code)))
+                code.clear()
+
+        def flush_literal():
+            if literal:
+                segments.append((False, "".join(literal)))
+                literal.clear()
+
+        while i < length:
+            c = text[i]
+
+            if c == "\n":
+                flush_code()
+                yield lineno, list(segments), pinned
+                segments.clear()
+                lineno += 1
+                pinned = False
+                i += 1
+
+            elif c in self.quotes:
+                flush_code()
+                literal.append(c)
+                i += 1
+                while i < length and text[i] != c:
+                    if text[i] == "\\" and i + 1 < length:
+                        literal.append(text[i])
+                        i += 1
+
+                    if text[i] == "\n":
+                        # only template literals can span lines, the newline
+                        # is part of the string so neither line can move
+                        flush_literal()
+                        yield lineno, list(segments), True
+                        segments.clear()
+                        lineno += 1
+                        pinned = True
+
+                    else:
+                        literal.append(text[i])
+
+                    i += 1
+
+                literal.append(text[i:i + 1])
+                flush_literal()
+                last = c
+                last_word = ""
+                after_head = False
+                i += 1
+
+            elif text.startswith("/*", i):
+                end = text.find("*/", i + 2)
+                end = length if end < 0 else end + 2
+                lineno_end = lineno + text.count("\n", i, end)
+                if lineno_end > lineno:
+                    flush_code()
+                    yield lineno, list(segments), pinned
+                    segments.clear()
+                    lineno = lineno_end
+                    pinned = False
+
+                # a comment still separates the code around it
+                code.append(" ")
+                i = end
+
+            elif self.line_comments and text.startswith("//", i):
+                end = text.find("\n", i)
+                i = length if end < 0 else end
+
+            elif (
+                self.regex_literals
+                and c == "/"
+                and self.is_regex_start(last, last_word, after_head)
+            ):
+                flush_code()
+                in_class = False
+                literal.append(c)
+                i += 1
+                while i < length and text[i] != "\n":
+                    ch = text[i]
+                    literal.append(ch)
+                    i += 1
+                    if ch == "\\" and i < length:
+                        literal.append(text[i])
+                        i += 1
+
+                    elif ch == "[":
+                        in_class = True
+
+                    elif ch == "]":
+                        in_class = False
+
+                    elif ch == "/" and not in_class:
+                        break
+
+                flush_literal()
+                last = "/"
+                last_word = ""
+                after_head = False
+
+            else:
+                code.append(c)
+                if c.isalnum() or c in "_$":
+                    last_word = last_word + c if in_word else c
+                    in_word = True
+                    last = c
+                    after_head = False
+
+                else:
+                    in_word = False
+                    if not c.isspace():
+                        if c == "(":
+                            parens.append(last_word in self.head_keywords)
+
+                        after_head = c == ")" and bool(parens) and parens.pop()
+                        last_word = ""
+                        last = c
+
+                i += 1
+
+        flush_code()
+        flush_literal()
+        if segments:
+            yield lineno, list(segments), pinned
+
+    def is_regex_start(self, last, last_word, after_head=False):
+        """Return True if a / after last is the start of a regex literal
+
+        :param last: str, the last significant code character
+        :param last_word: str, the word last is the end of, if any
+        :param after_head: bool, True if last is the ) that closes the head
+            of a statement, see .head_keywords
+        """
+        return False
+
+    def minify_code(self, code):
+        code = self.whitespace_regex.sub(" ", code)
+        return self.punctuation_regex.sub(r"\1", code)
+
+    def minify(self, text):
+        """Minify text
+
+        :param text: str
+        :returns: list[tuple[int, str, bool]], the 0-based source line, the
+            minified line, and True if the line has to start on a new line
+            of the output
+        """
+        ret = []
+        for lineno, segments, pinned in self.tokenize(text):
+            line = "".join(
+                self.minify_code(s) if is_code else s
+                for is_code, s in segments
+            )
+
+            if pinned:
+                if segments and segments[0][0]:
+                    # the line only ends inside a literal
+                    line = line.lstrip()
+                ret.append((lineno, line, True))
+
+            else:
+                line = line.strip()
+                if line:
+                    ret.append((lineno, line, False))
+
+        return ret
+
+
+class CSSMinifier(Minifier):
+    punctuation = "{};,>"
+
+    def minify_code(self, code):
+        code = super().minify_code(code)
+        # "a :hover" and "a:hover" are different selectors so only the space
+        # after a colon is removed
+        return code.replace(": ", ":")
+
+
+class JSMinifier(Minifier):
+    quotes = "\"'`"
+
+    line_comments = True
+
+    regex_literals = True
+
+    punctuation = "{}()[];,:=<>!?&|*%^~"
+
+    regex_keywords = set([
+        "return",
+        "typeof",
+        "instanceof",
+        "case",
+        "do",
+        "else",
+        "in",
+        "of",
+        "new",
+        "delete",
+        "void",
+        "throw",
+        "yield",
+        "await",
+    ])
+    """A / after these keywords starts a regex"""
+
+    head_keywords = set(["if", "while", "for", "with"])
+
+    def is_regex_start(self, last, last_word, after_head=False):
+        if not last or last in "(,=:[!&|?{};+-*%<>~^" or after_head:
+            return True
+
+        return last_word in self.regex_keywords
+
+
+def minify_css(text):
+    """Minify CSS, see Minifier.minify()"""
+    return CSSMinifier().minify(text)
+
+
+def minify_js(text):
+    """Minify javascript, see Minifier.minify()"""
+    return JSMinifier().minify(text)
+
+
+class SourceMap(object):
+    """Joins minified files together and builds a version 3 source map of
+    where every line of the joined text came from
+
+    https://sourcemaps.info/spec.html
+    """
+    BASE64 = (
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    )
+
+    def __init__(self, join_lines=False, separator=""):
+        """
+        :param join_lines: bool, True if lines can be joined together, this
+            is safe for CSS but not for javascript
+        :param separator: str, added to the end of a file that doesn't end
+            with it when another file is added (eg, ";" for javascript)
+        """
+        self.join_lines = join_lines
+        self.separator = separator
+        self.sources = []
+        self.lines = []
+        # the segments of each output line as (output column, source index,
+        # source line)
+        self.mappings = []
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    def add(self, source, lines):
+        """Add a minified file
+
+        :param source: str, the url of the original file
+        :param lines: list, the return value of Minifier.minify()
+        """
+        if self.separator and self.lines:
+            if not self.lines[-1].endswith(self.separator):
+                self.lines[-1] += self.separator
+
+        index = len(self.sources)
+        self.sources.append(source)
+        new_line = True
+        for lineno, line, pinned in lines:
+            if new_line or pinned or not self.join_lines or not self.lines:
+                self.lines.append(line)
+                self.mappings.append([(0, index, lineno)])
+
+            else:
+                prev = self.lines[-1]
+                if prev[-1:] not in "{};," and line[:1] not in "{};,":
+                    prev += " "
+
+                self.mappings[-1].append((len(prev), index, lineno))
+                self.lines[-1] = prev + line
+
+            new_line = pinned
+
+    def encode(self, value):
+        """Base64 VLQ encode value"""
+        value = (-value << 1) | 1 if value < 0 else value << 1
+        ret = []
+        while True:
+            digit = value & 31
+            value >>= 5
+            if value:
+                digit |= 32
+
+            ret.append(self.BASE64[digit])
+            if not value:
+                break
+
+        return "".join(ret)
+
+    def get_mappings(self):
+        lines = []
+        prev_index = prev_lineno = 0
+        for segments in self.mappings:
+            fields = []
+            prev_column = 0
+            for column, index, lineno in segments:
+                fields.append("".join([
+                    self.encode(column - prev_column),
+                    self.encode(index - prev_index),
+                    self.encode(lineno - prev_lineno),
+                    self.encode(0),
+                ]))
+                prev_column = column
+                prev_index = index
+                prev_lineno = lineno
+
+            lines.append(",".join(fields))
+
+        return ";".join(lines)
+
+    def json(self, filename):
+        """Returns the source map
+
+        :param filename: str, the basename of the minified file
+        :returns: str
+        """
+        return json.dumps({
+            "version": 3,
+            "file": filename,
+            "sources": self.sources,
+            "names": [],
+            "mappings": self.get_mappings(),
+        })
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals, division, print_function, absolute_import
 import os
+import re
 import sys
 #import logging
 
@@ -39,3 +40,99 @@ class DataDirpath(Dirpath):
         return self.child_dir("project")
 
 
+
+
+class FileIndex(object):
+    """In memory index of the files in directories
+
+    Every directory is read once with os.scandir and its listing is kept, so
+    everything that needs to look through the same directories (the compile,
+    plugins finding their files) shares one scan. Private files and folders
+    are never listed, so private folders are never descended into, and the
+    os.DirEntry instances are kept so the stat of a file is only ever done
+    once
+
+    :Example:
+        index = FileIndex(is_private=lambda basename: basename[0] == "_")
+        for entry in index.files(input_dir):
+            print(entry.path, entry.stat().st_size)
+    """
+    def __init__(self, is_private=None):
+        """
+        :param is_private: Callable[[str], bool], passed the basename of every
+            file and folder, returns True if it should be ignored
+        """
+        self.is_private = is_private
+        self.listings = {}
+        self.entries = {}
+
+    def listdir(self, dirpath):
+        """Returns the files and folders of dirpath, dirpath is only read the
+        first time it is listed
+
+        :param dirpath: str
+        :returns: tuple[list[os.DirEntry], list[os.DirEntry]], the (files,
+            folders) of dirpath sorted by name, both are empty if dirpath
+            doesn't exist
+        """
+        dirpath = os.fspath(dirpath)
+        listing = self.listings.get(dirpath)
+        if listing is None:
+            files = []
+            dirs = []
+            try:
+                with os.scandir(dirpath) as it:
+                    for entry in it:
+                        if self.is_private and self.is_private(entry.name):
+                            continue
+
+                        self.entries[entry.path] = entry
+                        if entry.is_dir():
+                            dirs.append(entry)
+
+                        else:
+                            files.append(entry)
+
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+            files.sort(key=lambda entry: entry.name)
+            dirs.sort(key=lambda entry: entry.name)
+            listing = self.listings[dirpath] = (files, dirs)
+
+        return listing
+
+    def files(self, dirpath, depth=-1, regex=""):
+        """Iterate the files of dirpath, the files of a folder come before the
+        files of its subfolders
+
+        :param dirpath: str
+        :param depth: int, how many levels of folders to iterate, 1 would only
+            iterate dirpath itself, -1 for all of them
+        :param regex: str, if present only files with a basename matching this
+            will be yielded
+        :returns: generator[os.DirEntry]
+        """
+        regex = re.compile(regex) if regex else None
+        dirpaths = [(os.fspath(dirpath), depth)]
+        while dirpaths:
+            dirpath, depth = dirpaths.pop()
+            files, dirs = self.listdir(dirpath)
+            for entry in files:
+                if not regex or regex.search(entry.name):
+                    yield entry
+
+            if depth != 1:
+                depth = depth - 1 if depth > 0 else depth
+                for entry in reversed(dirs):
+                    dirpaths.append((entry.path, depth))
+
+    def stat(self, path):
+        """Returns the stat of path, indexed paths use the stat of their
+        os.DirEntry so the file is only stat'ed once
+
+        :param path: str
+        :returns: os.stat_result
+        """
+        entry = self.entries.get(os.fspath(path))
+        return entry.stat() if entry else os.stat(path)
@@ -7,11 +7,124 @@ It will also automatically inject the javascript and css links into head
 from collections import OrderedDict, defaultdict
 import itertools
 import re
+import os
+import json
+import hashlib
+import logging
+import tempfile
 
+from ..compat import *
 from ..event import event
 from ..path import Filepath, Dirpath
 from ..utils import Url
 from ..decorators import once
+from ..minify import CSSMinifier, JSMinifier, SourceMap
+
+
+logger = logging.getLogger(__name__)
+
+
+class AssetHashes(object):
+    """Remembers the md5 hash of asset files across builds
+
+    Hashes are keyed by (path, size, modified time) and saved as json in the
+    project's cache directory, so an asset that hasn't changed is never read
+    to find its versioned filename. When an asset does have to be hashed it
+    is copied to its output directory in the same pass, see .hash_copy()
+    """
+    buffer_size = 1024 * 1024
+
+    def __init__(self, path=None):
+        """
+        :param path: str, the json file the hashes are saved to, if None the
+            hashes are only kept in memory
+        """
+        self.path = path
+        self.hashes = {}
+        self.modified = False
+        self.buffer = bytearray(self.buffer_size)
+
+        if path and os.path.isfile(path):
+            try:
+                with open(path, encoding="UTF-8") as fp:
+                    self.hashes = json.load(fp)
+
+            except ValueError as e:
+                logger.warning(f"Ignoring corrupt asset hashes {path}: {e}")
+
+    def get(self, path, st):
+        """Returns the hash of path if it hasn't changed since it was hashed
+
+        :param path: str
+        :param st: os.stat_result, the stat of path
+        :returns: str, empty if path needs to be hashed
+        """
+        d = self.hashes.get(String(path))
+        if d and d[0] == st.st_size and d[1] == st.st_mtime_ns:
+            return d[2]
+        return ""
+
+    def set(self, path, st, checksum):
+        self.hashes[String(path)] = [st.st_size, st.st_mtime_ns, checksum]
+        self.modified = True
+
+    def hash(self, path):
+        """Hash path without copying it, see .hash_copy()
+
+        :param path: str
+        :returns: str
+        """
+        h = hashlib.md5()
+        view = memoryview(self.buffer)
+        with open(path, "rb") as src:
+            while count := src.readinto(self.buffer):
+                h.update(view[:count])
+        return h.hexdigest()
+
+    def hash_copy(self, path, output_dir, basename):
+        """Hash path while copying it to output_dir, the file is read once
+        into a reused buffer
+
+        :param path: str, the file to hash
+        :param output_dir: str, where the copy goes
+        :param basename: str, the copy is named <HASH>.<BASENAME>
+        :returns: tuple[str, Filepath, bool], the hash, the copy, and True if
+            the copy was written, it isn't if it already existed
+        """
+        h = hashlib.md5()
+        view = memoryview(self.buffer)
+        os.makedirs(output_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".tmp")
+        try:
+            with open(path, "rb") as src, os.fdopen(fd, "wb") as dst:
+                while count := src.readinto(self.buffer):
+                    h.update(view[:count])
+                    dst.write(view[:count])
+
+            checksum = h.hexdigest()
+            output_file = Filepath(output_dir, f"{checksum}.{basename}")
+            copied = not output_file.isfile()
+            if copied:
+                os.replace(tmp_path, output_file)
+
+            else:
+                # the name is the hash of the contents so there's nothing to
+                # replace
+                os.unlink(tmp_path)
+
+        except BaseException:
+            if os.path.isfile(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return checksum, output_file, copied
+
+    def save(self):
+        if self.path and self.modified:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w", encoding="UTF-8") as fp:
+                json.dump(self.hashes, fp)
+            self.modified = False
 
 
 class Asset(object):
@@ -24,32 +137,70 @@ class Asset(object):
         self.config = config
         self.properties = properties
 
-    def compile(self):
+        # True if .compile() copied the input file while hashing it
+        self.copied = False
+
+    def compile(self, hashes=None, copy=True):
         """The compile phase, go through all the assets and figure out what
-        their output path will be"""
+        their output path and url will be
+
+        :param hashes: AssetHashes, an asset that isn't in hashes is hashed
+            and copied to its output file in one pass
+        :param copy: bool, False if the asset should only be hashed, this is
+            for processes that don't output assets (eg, output workers)
+        """
         if self.is_url():
             self.output_file = self.input_file
+            self.url = self.output_file
 
         else:
+            if hashes is None:
+                hashes = AssetHashes()
+
             basename = self.input_file.basename
-            checksum = self.input_file.checksum()
-            self.output_file = Filepath(
-                self.output_dir,
-                "{}.{}".format(checksum, basename)
-            )
+            st = self.config.project.file_index.stat(self.input_file)
+            checksum = hashes.get(self.input_file, st)
+            if checksum:
+                self.output_file = Filepath(
+                    self.output_dir,
+                    "{}.{}".format(checksum, basename)
+                )
+
+            elif copy:
+                checksum, self.output_file, self.copied = hashes.hash_copy(
+                    self.input_file,
+                    self.output_dir,
+                    basename
+                )
+                hashes.set(self.input_file, st, checksum)
+
+            else:
+                checksum = hashes.hash(self.input_file)
+                self.output_file = Filepath(
+                    self.output_dir,
+                    "{}.{}".format(checksum, basename)
+                )
+                hashes.set(self.input_file, st, checksum)
+
+            relative = self.output_file.relative_to(self.config.output_dir)
+            relative = relative.replace('\\', '/')
+            self.url = Url("{}/{}".format(self.config.base_url, relative))
 
     def output(self):
         """output phase, go through all the assets and actually copy them over
         to the output directory"""
-        if self.is_url():
-            self.url = self.output_file
+        if not self.is_url():
+            if self.copied:
+                self.config.writer.wrote(self.output_file)
+                self.copied = False
 
-        else:
-            self.input_file.copy_to(self.output_file)
+            elif self.output_file.isfile():
+                # the filename has the hash of the contents so an existing
+                # output file is already the same as the input file
+                self.config.writer.skip(self.output_file)
 
-            relative = self.output_file.relative_to(self.config.output_dir)
-            relative = relative.replace('\\', '/')
-            self.url = Url("{}/{}".format(self.config.base_url, relative))
+            else:
+                self.config.writer.copy(self.input_file, self.output_file)
 
     def is_url(self):
         """True if input_file was a url"""
@@ -90,6 +241,96 @@ class JS(Asset):
         )
 
 
+class Bundle(Asset):
+    """Concatenates and minifies assets into one file with a source map
+
+    The bundle is named after the hashes of the assets in it so it only has
+    to be built when its file doesn't exist yet. This is the base class, see
+    CSSBundle and JSBundle
+    """
+    minifier_class = None
+
+    join_lines = False
+    """True if the minified lines can be joined into one line"""
+
+    separator = ""
+    """Added between files that don't end with it, see SourceMap"""
+
+    source_map_format = ""
+    """The comment that tells the browser where the source map is"""
+
+    def __init__(self, assets, output_dir, config, **properties):
+        """
+        :param assets: list[Asset], the assets in the order they should be in
+            the bundle, they should all be compiled
+        """
+        super().__init__(None, output_dir, config, **properties)
+        self.assets = assets
+
+    def compile(self, hashes=None):
+        ext = self.assets[0].input_file.ext
+        checksum = hashlib.md5(
+            "\n".join(a.output_file.basename for a in self.assets).encode()
+        ).hexdigest()
+        self.output_file = Filepath(
+            self.output_dir,
+            "{}.bundle.{}".format(checksum, ext)
+        )
+        self.map_file = Filepath(f"{self.output_file}.map")
+
+        relative = self.output_file.relative_to(self.config.output_dir)
+        relative = relative.replace('\\', '/')
+        self.url = Url("{}/{}".format(self.config.base_url, relative))
+
+    def build(self):
+        """Minify and join the assets
+
+        :returns: tuple[str, str], the bundle and its source map
+        """
+        minifier = self.minifier_class()
+        sm = SourceMap(join_lines=self.join_lines, separator=self.separator)
+        for a in self.assets:
+            sm.add(a.url, minifier.minify(a.input_file.read_text()))
+
+        text = "\n".join([
+            sm.text,
+            self.source_map_format.format(self.map_file.basename),
+        ])
+        return text, sm.json(self.output_file.basename)
+
+    def output(self):
+        """The bundle is only built if its files don't exist, this is checked
+        here instead of in .compile() so anything that removed them between
+        the compile and the output is caught"""
+        writer = self.config.writer
+        if self.output_file.isfile() and self.map_file.isfile():
+            writer.skip(self.output_file)
+            writer.skip(self.map_file)
+
+        else:
+            text, map_text = self.build()
+            writer.write_text(self.output_file, text)
+            writer.write_text(self.map_file, map_text)
+
+
+class CSSBundle(Bundle, CSS):
+    minifier_class = CSSMinifier
+
+    join_lines = True
+
+    source_map_format = "/*# sourceMappingURL={} */"
+
+
+class JSBundle(Bundle, JS):
+    minifier_class = JSMinifier
+
+    # a file that doesn't end with a semicolon followed by a file that starts
+    # with ( or [ would otherwise become a call or an index
+    separator = ";"
+
+    source_map_format = "//# sourceMappingURL={}"
+
+
 class Assets(object):
     """An instance of this class will be available at config.assets.
 
@@ -100,6 +341,8 @@ class Assets(object):
     css_class = CSS
     js_class = JS
     asset_class = Asset
+    css_bundle_class = CSSBundle
+    js_bundle_class = JSBundle
 
     @property
     def dirname(self):
@@ -107,16 +350,30 @@ class Assets(object):
         output directory also"""
         return self.config.get("assets_dir", "assets")
 
+    @property
+    def bundle(self):
+        """True if the local CSS and JS files should be bundled into one
+        minified file each, see .get_bundles()"""
+        return self.config.get("assets_bundle", False)
+
     def __init__(self, output_dir, config):
         self.css = {}
         self.js = {}
         self.other = {}
         self._header_html = ""
         self._body_html = ""
+        self.bundles = {}
+
+        # every directory assets were added from, see .add_dir()
+        self.dirpaths = []
 
         self.config = config
         self.order()
 
+        self.hashes = AssetHashes(
+            config.cache_dir.child_file("assets.json")
+        )
+
         self.output_dir = config.output_dir.child_dir(self.dirname)
 
     def add_dir(self, path):
@@ -126,9 +383,9 @@ class Assets(object):
         .DIRNAME directory inside of it
         """
         assets_dir = Dirpath(path, self.dirname)
-        if assets_dir.exists():
-            for path in assets_dir.files(depth=0):
-                self.add(path)
+        self.dirpaths.append(assets_dir)
+        for entry in self.config.project.file_index.files(assets_dir):
+            self.add(entry.path)
 
     def add(self, path, ext="", **properties):
         """This will add an asset at path and when the html is generated it
@@ -252,15 +509,78 @@ class Assets(object):
             yield a
 
     def compile(self):
-        """The compile phase"""
+        """The compile phase
+
+        In an output worker (see OutputPool) the assets were already hashed
+        and copied by the main process, so the main process's saved hashes
+        are used and nothing is copied or saved
+        """
+        worker = self.config.get("output_worker", False)
         for asset in self:
-            asset.compile()
+            asset.compile(self.hashes, copy=not worker)
+
+        if not worker:
+            self.hashes.save()
+
+        self.bundles = self.get_bundles() if self.bundle else {}
+        for bundle in dict.fromkeys(self.bundles.values()):
+            bundle.compile()
 
     def output(self):
         """the output phase"""
         for asset in self:
             asset.output()
 
+        for bundle in dict.fromkeys(self.bundles.values()):
+            bundle.output()
+
+    def get_bundles(self):
+        """Group the local CSS and JS assets into bundles
+
+        A bundle is a run of assets that are next to each other in
+        .ordered() order (CSS and JS are ordered separately) and that have
+        the same properties (eg, media="print"). Urls are never bundled and
+        an url, or an asset with different properties, ends the run, so the
+        bundles keep the order of the cascade and of the scripts
+
+        :returns: dict[Asset, Bundle], the bundle each bundled asset is in
+        """
+        groups = []
+        runs = {}
+        for a in self.ordered(css=True, js=True, other=False):
+            is_css = isinstance(a, CSS)
+            if a.is_url():
+                runs.pop(is_css, None)
+
+            else:
+                properties = tuple(sorted(a.properties.items()))
+                run = runs.get(is_css)
+                if run and run[1] == properties:
+                    run[2].append(a)
+
+                else:
+                    run = runs[is_css] = (is_css, properties, [a])
+                    groups.append(run)
+
+        ret = {}
+        for is_css, properties, assets in groups:
+            if is_css:
+                bundle_class = self.css_bundle_class
+
+            else:
+                bundle_class = self.js_bundle_class
+
+            bundle = bundle_class(
+                assets,
+                self.output_dir,
+                self.config,
+                **dict(properties)
+            )
+            for a in assets:
+                ret[a] = bundle
+
+        return ret
+
     def css_inline(self):
         """Generates all the css as a body that can go between a
         <style></style> html tag. This is basically the raw css
@@ -282,8 +602,13 @@ class Assets(object):
         :returns: str, the html to inject into the head
         """
         ret = []
+        seen = set()
         for a in self.ordered(css=True, js=True, other=False):
-            ret.append(a.html())
+            # a bundle's tag goes where its first asset would have been
+            a = self.bundles.get(a, a)
+            if a not in seen:
+                seen.add(a)
+                ret.append(a.html())
 
         return "\n".join(ret)
 
@@ -357,9 +682,15 @@ def output_assets(event):
     config.assets.output()
 
 
-@event("output.template")
-def template_output_assets(event):
+@event("watch.start")
+def watch_assets(event):
+    config = event.config
+    event.dirpaths.extend(config.assets.dirpaths)
+
+
+@event("output.inject")
+def inject_assets(event):
     config = event.config
-    event.html = event.html.inject_into_head(config.assets.html_links())
-    event.html = event.html.inject_into_body(config.assets.html_body())
+    event.head.append(config.assets.html_links())
+    event.body.append(config.assets.html_body())
 
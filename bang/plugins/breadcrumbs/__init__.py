@@ -56,7 +56,7 @@ def output_breadcrumbs(event):
 
             # we only want to add breadcrumb files to directories that don't
             # have any index files already
-            if not path.has_file(basename):
+            if not config.writer.has(path.child_file(basename)):
                 logger.debug("Generating breadcrumb for {}".format(breadcrumb))
                 theme.output_template(
                     "breadcrumbs",
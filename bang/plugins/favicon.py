@@ -31,7 +31,7 @@ from collections import OrderedDict
 
 from ..compat import *
 from ..event import event
-from ..path import Imagepath
+from ..path import Imagepath, FileIndex
 from ..utils import Url
 
 
@@ -72,13 +72,21 @@ class Favicons(object):
         return d
 
     def __init__(self, input_dirs, *paths, **kwargs):
+        """
+        :param input_dirs: list[Dirpath], the directories favicons are found in
+        :param **kwargs:
+            - regex: str, favicon basenames match this
+            - file_index: FileIndex, the input_dirs are found with this so a
+                project's index can be shared
+        """
         self.images = []
         self.input_dirs = input_dirs
 
         regex = kwargs.get("regex", self.regex)
+        file_index = kwargs.get("file_index") or FileIndex()
         for input_dir in self.input_dirs:
-            for f in input_dir.files().regex(regex, filename=True):
-                im = Imagepath(f)
+            for entry in file_index.files(input_dir, regex=regex):
+                im = Imagepath(entry.path)
                 im.input_dir = input_dir
                 self.images.append(im)
 
@@ -159,15 +167,20 @@ class Favicons(object):
         return "\n".join(ret)
 
 
-@event("configure.plugins")
-def configure_favicon(event):
+@event("compile.start")
+def compile_favicon(event):
+    # this is done on compile so the favicons are found with the same scan of
+    # the input directories the compile uses
     config = event.config
-    config.favicons = Favicons(config.project.input_dirs)
+    config.favicons = Favicons(
+        config.project.input_dirs,
+        file_index=config.project.file_index,
+    )
     config.favicons_html = config.favicons.html()
 
 
-@event("output.template")
-def template_output_favicon(event):
+@event("output.inject")
+def inject_favicon(event):
     config = event.config
-    event.html = event.html.inject_into_head(config.favicons_html)
+    event.head.append(config.favicons_html)
 
@@ -15,7 +15,6 @@ big list of namespaces:
 import datetime
 import os
 from xml.sax.saxutils import escape
-import codecs
 import logging
 
 from ..compat import *
@@ -49,6 +48,33 @@ def configure_feed(event):
     config.setdefault("feed_url", Url("/", config.feed_filename))
 
 
+def get_pages(config):
+    """Get the pages that will be in the feed
+
+    :param config: Config, the feed context
+    :returns: list[Page], the newest config.feed_max_count pages
+    """
+    max_count = config.get("feed_max_count", 10)
+    pages = []
+    for p in config.feed_iter:
+        pages.append(p)
+        if len(pages) >= max_count:
+            break
+    return pages
+
+
+@event("output.start")
+def keep_feed_parsed(event):
+    """The feed serializes its pages again with absolute links, so their
+    parsed markdown is kept after they are output instead of parsing them
+    again, see Page.keep_parsed"""
+    config = event.config
+    with config.context("feed") as config:
+        if "feed_iter" in config and config.host:
+            for p in get_pages(config):
+                p.keep_parsed = True
+
+
 @event("output.finish")
 def output_feed(event):
     config = event.config
@@ -73,10 +99,17 @@ def output_feed(event):
 
         main_url = config.base_url
         feed_url = 'http://{}/feed.rss'.format(host)
-        max_count = config.get("feed_max_count", 10)
-        count = 0
+        pages = get_pages(config)
 
-        with codecs.open(feedpath, 'w+', 'utf-8') as fp:
+        # the feed is dated by its newest page instead of the build time so
+        # the feed only changes when its pages change, see OutputWriter
+        if pages:
+            dt = max(p.modified for p in pages)
+
+        else:
+            dt = datetime.datetime.now(datetime.timezone.utc)
+
+        with StringIO() as fp:
 
             fp.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
             fp.write("<rss version=\"2.0\"\n")
@@ -99,14 +132,13 @@ def output_feed(event):
             ))
             #fp.write(u"    <atom:link href=\"{}\" rel=\"alternate\"/>\n".format(main_url))
 
-            dt = datetime.datetime.now(datetime.timezone.utc)
             fp.write("    <pubDate>{}</pubDate>\n".format(get_datestr(dt)))
             fp.write("    <lastBuildDate>{}</lastBuildDate>\n".format(
                 get_datestr(dt)
             ))
             fp.write("    <generator>github.com/Jaymon/bang</generator>\n")
 
-            for p in config.feed_iter:
+            for p in pages:
                 fp.write("    <item>\n")
                 fp.write("      <title>{}</title>\n".format(
                     get_cdata(p.title)
@@ -125,16 +157,14 @@ def output_feed(event):
                 ))
                 fp.write("    </item>\n")
 
-                count += 1
-                if count >= max_count:
-                    break
-
             fp.write("  </channel>\n")
             fp.write("</rss>\n")
 
+            config.writer.write_text(feedpath, fp.getvalue())
+
 
-@event("output.template")
-def template_output_feed(event):
+@event("output.inject")
+def inject_feed(event):
     config = event.config
 
     s = (
@@ -148,5 +178,5 @@ def template_output_feed(event):
         config.feed_url
     )
 
-    event.html = event.html.inject_into_head(s)
+    event.head.append(s)
 
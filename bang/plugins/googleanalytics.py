@@ -23,8 +23,8 @@ from ..event import event
 logger = logging.getLogger(__name__)
 
 
-@event("output.template")
-def template_output_ga(event):
+@event("output.inject")
+def inject_ga(event):
     config = event.config
 
     ga_tracking_id = config.get("ga_tracking_id", None)
@@ -59,7 +59,5 @@ def template_output_ga(event):
             gtag('config', '{GA_TRACKING_ID}');
             </script>"""
 
-    event.html = event.html.inject_into_body(
-        s.format(GA_TRACKING_ID=ga_tracking_id)
-    )
+    event.body.append(s.format(GA_TRACKING_ID=ga_tracking_id))
 
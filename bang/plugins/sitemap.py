@@ -5,7 +5,6 @@ a plugin to generate a sitemap
 http://en.wikipedia.org/wiki/Sitemaps
 """
 import os
-import codecs
 import logging
 
 from ..compat import *
@@ -42,7 +41,7 @@ def output_sitemap(event):
         count = 0
 
         if host:
-            with codecs.open(sitemap, 'w+', 'utf-8') as fp:
+            with StringIO() as fp:
                 fp.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
                 fp.write("<urlset xmlns=\"http://www.sitemaps.org/schemas/sitemap/0.9\">\n")
 
@@ -60,6 +59,8 @@ def output_sitemap(event):
 
                 fp.write("</urlset>\n")
 
+                config.writer.write_text(sitemap, fp.getvalue())
+
         else:
             logger.error("Sitemap not generated because no config host set")
 
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+import math
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .compat import *
+from .types import Page
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutputPool(object):
+    """Outputs Type instances, fanning the Page instances out to a pool of
+    worker processes when there is more than one job
+
+    Each worker process creates its own Project once, which runs all the
+    configure events and bangfiles, and then compiles it so every instance has
+    the same prev/next linkage it has in the main process. The main process
+    then sends batches of input paths to the workers and each worker outputs
+    the instances that match those paths.
+
+    Workers are started with "spawn" so they never inherit half-configured
+    state (eg, bound events) from the main process. Every scalar value of
+    the main process's global config is passed to the workers so the values
+    that are set after the configure (eg, from the command line or by the
+    code that created the project) are the same in the workers, see
+    .get_settings(). Values that aren't scalars (eg, iterators or callbacks)
+    can't be sent, so they have to be set by a bangfile or configure event.
+    config.output_worker is True in the workers so plugins can skip the work
+    the main process already did (eg, the assets plugin doesn't hash or copy
+    assets)
+
+    :Example:
+        with OutputPool(project, jobs=4) as pool:
+            pool.output(instances)
+    """
+    worker_project = None
+    """Holds the worker process's Project instance, see .initializer()"""
+
+    worker_instances = None
+    """Holds the worker process's instances keyed by input path"""
+
+    def __init__(self, project, jobs=1, batch_size=0):
+        """
+        :param project: Project, the main process's project
+        :param jobs: int, how many worker processes, if 1 or less then
+            everything is output in this process
+        :param batch_size: int, how many input paths to send to a worker at
+            a time, if 0 then this will be figured out from jobs
+        """
+        self.project = project
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor:
+            self.executor.shutdown(cancel_futures=exc_type is not None)
+            self.executor = None
+
+    @classmethod
+    def initializer(cls, project_class, project_dir, output_dir, settings):
+        """Runs once in each worker process when it starts
+
+        :param project_class: type, the main process's Project class
+        :param project_dir: str
+        :param output_dir: str
+        :param settings: dict, config values to set before compiling, see
+            .get_settings()
+        """
+        cls.worker_project = project_class(project_dir, output_dir)
+        for k, v in settings.items():
+            setattr(cls.worker_project.config, k, v)
+        cls.worker_project.compile()
+
+        cls.worker_instances = {}
+        for instances in cls.worker_project.types.values():
+            for instance in instances:
+                cls.worker_instances[String(instance.input_file)] = instance
+
+    @classmethod
+    def output_batch(cls, input_paths):
+        """Runs in a worker process, outputs the instances of input_paths
+
+        :param input_paths: list[str]
+        :returns: OutputWriter, the writer that output this batch, so the
+            main process knows what was written
+        """
+        project = cls.worker_project
+        project.writer = project.create_writer()
+
+        with project.config.context("output") as config:
+            low_memory = config.get("low_memory", False)
+            for input_path in input_paths:
+                instance = cls.worker_instances[input_path]
+                instance.output()
+                if low_memory:
+                    instance.release()
+
+        return project.writer
+
+    def get_settings(self):
+        """Returns the config values every worker sets before it compiles,
+        these are the scalar values of the main process's global context,
+        the values of other contexts are set by their context events in the
+        workers also
+
+        :returns: dict
+        """
+        config = self.project.config
+        context = config.get_context(config._context_names[0])
+        settings = {}
+        for k, v in context.items():
+            if k.startswith("_"):
+                continue
+
+            if v is None or isinstance(v, (basestring, int, float, bool)):
+                settings[k] = v
+
+        settings["output_worker"] = True
+        return settings
+
+    def get_executor(self):
+        if not self.executor:
+            logger.info(f"Starting {self.jobs} output worker processes")
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.jobs,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=type(self).initializer,
+                initargs=(
+                    type(self.project),
+                    String(self.project.project_dir),
+                    String(self.project.output_dir),
+                    self.get_settings(),
+                ),
+            )
+        return self.executor
+
+    def get_batch_size(self, count):
+        if self.batch_size:
+            return self.batch_size
+
+        # a few batches per worker keeps the workers busy without making
+        # the batches so small the overhead of sending them dominates
+        return max(1, math.ceil(count / (self.jobs * 4)))
+
+    def is_pooled(self, instance):
+        """Return True if instance should be output by a worker process, only
+        pages are worth it, everything else is a file copy"""
+        return self.jobs > 1 and isinstance(instance, Page)
+
+    def output(self, instances):
+        """Output instances, this blocks until every instance has been output
+
+        :param instances: Iterable[Type]
+        :returns: int, how many instances were output
+        """
+        count = 0
+        input_paths = []
+        for instance in instances:
+            if self.is_pooled(instance):
+                input_paths.append(String(instance.input_file))
+
+            else:
+                instance.output()
+                count += 1
+
+        if input_paths:
+            executor = self.get_executor()
+            batch_size = self.get_batch_size(len(input_paths))
+
+            futures = []
+            for i in range(0, len(input_paths), batch_size):
+                batch = input_paths[i:i + batch_size]
+                futures.append(executor.submit(
+                    type(self).output_batch,
+                    batch,
+                ))
+                count += len(batch)
+
+            for future in futures:
+                # any exception raised in the worker is raised again here
+                self.project.writer.update(future.result())
+
+        return count
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Build profiling for `bang compile --profile`
+
+BuildProfiler wraps the methods where a build spends its time while it is
+active and then restores them, so a normal build pays nothing for it
+"""
+import json
+import time
+import logging
+import functools
+from collections import defaultdict
+from contextlib import contextmanager
+
+from .compat import *
+from .event import event
+from .config import Theme
+from .types import Type
+from .md import Markdown
+
+
+logger = logging.getLogger(__name__)
+
+
+class BuildProfiler(object):
+    """Times a build broken down by phase, type, plugin, template, and
+    markdown extension
+
+    All the times are inclusive, so the time of a page's output includes the
+    time it took to render its template, which includes the time of the
+    output.template callbacks, and so on
+
+    :Example:
+        project = Project(project_dir, output_dir)
+        with BuildProfiler() as profiler:
+            with profiler.phase("compile"):
+                project.compile()
+
+            with profiler.phase("output"):
+                project.output()
+
+        profiler.report()
+    """
+    def __init__(self, limit=10):
+        """
+        :param limit: int, how many rows .report() shows for each category
+        """
+        self.limit = limit
+        self.timings = defaultdict(dict)
+        self.patched = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def record(self, category, key, elapsed):
+        """Add elapsed seconds to key in category"""
+        timing = self.timings[category].get(key)
+        if timing is None:
+            timing = self.timings[category][key] = [0, 0.0, 0.0]
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] = max(timing[2], elapsed)
+
+    def timed(self, func, get_keys):
+        """Wrap func so every call is recorded
+
+        :param func: callable
+        :param get_keys: Callable[..., list[tuple[str, str]]], called with the
+            same arguments as func and returns the (category, key) tuples the
+            call should be recorded under
+        :returns: callable
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+
+            finally:
+                elapsed = time.perf_counter() - start
+                for category, key in get_keys(*args, **kwargs):
+                    self.record(category, key, elapsed)
+
+        wrapper.profiled = True
+        return wrapper
+
+    def patch(self, obj, name, get_keys):
+        """Replace obj.name with a timed version, the original is put back in
+        .stop()"""
+        if name in vars(obj):
+            original = vars(obj)[name]
+            func = getattr(obj, name)
+            if not getattr(func, "profiled", False):
+                self.patched.append((obj, name, original))
+                setattr(obj, name, self.timed(func, get_keys))
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager that records the time of a phase of the build"""
+        start = time.perf_counter()
+        try:
+            yield self
+
+        finally:
+            self.record("phases", name, time.perf_counter() - start)
+
+    def start(self):
+        self.patch_events()
+        self.patch_types()
+        self.patch(
+            Theme,
+            "render_template",
+            lambda theme, template_name, **kwargs: [
+                ("templates", f"{theme.name}.{template_name}"),
+            ]
+        )
+
+        # a render is a parse and an output, both are recorded under the
+        # page so a page's markdown row is the total of its render
+        for method_name in ["parse", "output"]:
+            self.patch_markdown_method(method_name)
+
+    def patch_markdown_method(self, method_name):
+        method = getattr(Markdown, method_name)
+        def markdown_method(md, page, *args, **kwargs):
+            # markdown instances are created lazily so their processors are
+            # patched the first time they are used
+            self.patch_markdown(md)
+            return method(md, page, *args, **kwargs)
+        self.patched.append((Markdown, method_name, method))
+        setattr(Markdown, method_name, self.timed(
+            functools.wraps(method)(markdown_method),
+            lambda md, page, *args, **kwargs: [
+                ("markdown", String(page.input_file)),
+            ]
+        ))
+
+    def stop(self):
+        while self.patched:
+            obj, name, original = self.patched.pop()
+            if isinstance(obj, type):
+                setattr(obj, name, original)
+
+            else:
+                # instance patches are removed so the class's method shows
+                # through again
+                delattr(obj, name)
+
+    def patch_events(self):
+        # event.emit is the one place every callback of every event is run
+        # from, patching the instance leaves the Events class alone
+        emit = event.emit
+        @functools.wraps(emit)
+        def timed_emit(bc_event, callback):
+            start = time.perf_counter()
+            try:
+                return emit(bc_event, callback)
+
+            finally:
+                elapsed = time.perf_counter() - start
+                module = getattr(callback, "__module__", "") or ""
+                name = getattr(callback, "__qualname__", String(callback))
+                self.record(
+                    "callbacks",
+                    f"{bc_event.event_name} {module}.{name}",
+                    elapsed
+                )
+                self.record("plugins", module, elapsed)
+
+        self.patched.append((event, "emit", emit))
+        event.emit = timed_emit
+
+    def patch_types(self):
+        """Time the output of every instance, only the outermost .output() call
+        of an instance is recorded so a child calling its parent's output
+        isn't counted twice"""
+        if not Type.classes:
+            return
+
+        active = set()
+        for type_class in Type.classes.get_mro_classes():
+            if "output" in vars(type_class):
+                output = vars(type_class)["output"]
+                self.patched.append((type_class, "output", output))
+                type_class.output = self.timed_output(output, active)
+
+    def timed_output(self, output, active):
+        @functools.wraps(output)
+        def wrapper(instance, *args, **kwargs):
+            if id(instance) in active:
+                return output(instance, *args, **kwargs)
+
+            active.add(id(instance))
+            start = time.perf_counter()
+            try:
+                return output(instance, *args, **kwargs)
+
+            finally:
+                elapsed = time.perf_counter() - start
+                active.discard(id(instance))
+                self.record("types", instance.name, elapsed)
+                self.record("instances", String(instance.input_file), elapsed)
+
+        return wrapper
+
+    def patch_markdown(self, md):
+        """Time every processor of md"""
+        if getattr(md, "_profiled", False):
+            return
+
+        md._profiled = True
+        self.patched.append((md, "_profiled", None))
+
+        for registry, method_name in [
+            (md.preprocessors, "run"),
+            (md.parser.blockprocessors, "run"),
+            (md.inlinePatterns, "handleMatch"),
+            (md.treeprocessors, "run"),
+            (md.postprocessors, "run"),
+        ]:
+            for item in registry._priority:
+                processor = registry[item.name]
+                module = processor.__class__.__module__
+                processor_name = f"{module}.{item.name}"
+                self.patch_processor(
+                    processor,
+                    method_name,
+                    [
+                        ("extensions", module),
+                        ("processors", processor_name),
+                    ]
+                )
+
+    def patch_processor(self, processor, method_name, keys):
+        func = getattr(processor, method_name, None)
+        if func and not getattr(func, "profiled", False):
+            self.patched.append((processor, method_name, None))
+            setattr(
+                processor,
+                method_name,
+                self.timed(func, lambda *args, **kwargs: keys)
+            )
+
+    def get_rows(self, category):
+        """Returns the rows of category sorted by total time, slowest first
+
+        :returns: list[dict]
+        """
+        rows = [
+            {
+                "name": key,
+                "count": timing[0],
+                "total": timing[1],
+                "max": timing[2],
+            }
+            for key, timing in self.timings.get(category, {}).items()
+        ]
+        rows.sort(key=lambda row: row["total"], reverse=True)
+        return rows
+
+    def to_dict(self):
+        return {
+            category: self.get_rows(category)
+            for category in self.timings.keys()
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="UTF-8") as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+        logger.info(f"Profile written to {path}")
+
+    def report(self):
+        """Log the slowest rows of every category"""
+        titles = [
+            ("phases", "Phases"),
+            ("types", "Types"),
+            ("instances", "Slowest pages and files"),
+            ("markdown", "Slowest markdown renders"),
+            ("templates", "Slowest templates"),
+            ("plugins", "Event callbacks by module"),
+            ("callbacks", "Slowest event callbacks"),
+            ("extensions", "Markdown processors by module"),
+            ("processors", "Slowest markdown processors"),
+        ]
+        for category, title in titles:
+            rows = self.get_rows(category)
+            if rows:
+                logger.info("")
+                logger.info(f"{title}:")
+                for row in rows[:self.limit]:
+                    logger.info("    {:>10.1f} ms {:>7}x  {}".format(
+                        row["total"] * 1000,
+                        row["count"],
+                        row["name"],
+                    ))
@@ -11,10 +11,8 @@ from datatypes.reflection import ClassKeyFinder
 from datatypes import (
     Url,
     HTML,
-    ContextNamespace,
     AppendList,
     OrderedList,
-    property as cachedproperty,
     Datetime,
 )
 
@@ -48,18 +46,29 @@ class ClassKeyFinder(ClassKeyFinder):
 
 class TypeIterator(object):
     """Iterate the passed in types"""
-    def __init__(self, config, types):
+    def __init__(self, config, types, reverse=False):
+        """
+        :param config: Config
+        :param types: list[type], the Type classes to iterate
+        :param reverse: bool, True to iterate the instances of each type in
+            reverse order
+        """
         self.config = config
         self.types = types
+        self.reverse_order = reverse
 
     def reverse(self):
-        for ts in self.get_types():
-            for instance in reversed(ts):
-                yield instance
+        """Returns an iterator of the instances in reverse order, like this
+        iterator it can be iterated as many times as needed"""
+        return TypeIterator(
+            self.config,
+            self.types,
+            reverse=not self.reverse_order
+        )
 
     def __iter__(self):
         for ts in self.get_types():
-            for instance in ts:
+            for instance in (reversed(ts) if self.reverse_order else ts):
                 yield instance
 
     def __reversed__(self):
@@ -197,16 +206,9 @@ class Pages(Types):
                 ret.append(c.name)
         return ret
 
-    @cachedproperty(cached="_template_name")
+    @property
     def template_name(self):
-        theme = self.config.theme
-        for template_name in self.template_names:
-            logger.debug("Attempting to use template [{}.{}]".format(
-                theme.name,
-                template_name
-            ))
-            if theme.has_template(template_name):
-                return template_name
+        return self.config.theme.find_template(self.template_names)
 
     def output(self, output_dir="", **kwargs):
         """This will output an index.html file in the root directory
@@ -222,7 +224,7 @@ class Pages(Types):
             output_dir.relative_to(self.config.output_dir)
         )
 
-        if output_dir.has_file(output_basename):
+        if self.config.writer.has(output_dir.child_file(output_basename)):
             logger.warning(
                 "Pages.output() cannot generate a root index.html file"
                 " because one already exists"
@@ -439,18 +441,103 @@ class Other(Type):
 
     def output(self, **kwargs):
         logger.info(f"output {self}")
-        self.input_file.copy_to(self.output_file)
+        self.config.writer.copy(self.input_file, self.output_file)
 
     @classmethod
     def match(cls, filepath):
         return True
 
 
+class PageInfo(object):
+    """Holds everything a Page renders to in one context
+
+    title, html, and meta come from the render and the plain text,
+    description, and image are derived from html the first time they are
+    accessed, so templates and plugins can read them as often as they want
+    """
+    __slots__ = ("title", "html", "meta", "_plain", "_description", "_image")
+
+    def __init__(self, title, html, meta):
+        self.title = title
+        self.html = HTML(html)
+        self.meta = meta
+        self._plain = None
+        self._description = None
+        self._image = None
+
+    def __iter__(self):
+        """Page.compile() used to return a (title, html, meta) tuple, this
+        keeps `title, html, meta = page.compile()` working"""
+        yield self.title
+        yield self.html
+        yield self.meta
+
+    @property
+    def plain(self):
+        """The html as plain text without captions and footnotes"""
+        if self._plain is None:
+            self._plain = self.html.plain(
+                strip_tagnames=["figcaption", "sup", "div.footnote"]
+            )
+        return self._plain
+
+    @property
+    def description(self):
+        """The first 2 sentences of the plain text"""
+        if self._description is None:
+            ms = re.split(
+                r"(?<=\S[\.\?!])(?:\s|$)",
+                self.plain,
+                maxsplit=2,
+                flags=re.M
+            )
+
+            sentences = []
+            for sentence in ms[0:2]:
+                sentences.extend(
+                    (s.strip() for s in sentence.splitlines() if s)
+                )
+
+            self._description = " ".join(sentences)
+        return self._description
+
+    @property
+    def image(self):
+        """The src of the first image in html, yes, this uses regex because I
+        didn't want to rely on third party libraries to do this"""
+        if self._image is None:
+            self._image = ""
+            m = re.search(r"<img\s+[^>]+>", self.html, flags=re.M | re.I)
+            if m:
+                m = re.search(r"src=[\"\']([^\"\']+)", m.group(0), re.I)
+                if m:
+                    self._image = m.group(1)
+        return self._image
+
+    def release(self):
+        """Drop the html and plain text, the description and image are
+        found first so they stay available, see Page.release()"""
+        if self.html is not None:
+            self.description
+            self.image
+            self.html = None
+            self._plain = None
+
+
 class Page(Other):
     """This is the generic page type, any page.md files will be this page
     type"""
     instances_class = Pages
 
+    slug = None
+    """The slug of the input file's basename (eg, "foo" for page-foo.md), this
+    is set when the input file is matched, see TypeMatcher"""
+
+    keep_parsed = False
+    """True if the parsed markdown should be kept after this page is output
+    because an output.finish callback (eg, the feed) will serialize it again
+    in another context, see .parse()"""
+
     @property
     def next_title(self):
         """returns the title of the next post"""
@@ -476,30 +563,12 @@ class Page(Other):
     @property
     def description(self):
         """Returns a nice description of the post, first 2 sentences"""
-        plain = self.html.plain(
-            strip_tagnames=["figcaption", "sup", "div.footnote"]
-        )
-        ms = re.split(r"(?<=\S[\.\?!])(?:\s|$)", plain, maxsplit=2, flags=re.M)
-
-        sentences = []
-        for sentence in ms[0:2]:
-            sentences.extend((s.strip() for s in sentence.splitlines() if s))
-
-        desc = " ".join(sentences)
-        return desc
+        return self.compile().description
 
     @property
     def image(self):
-        """Return the image for the post, yes, this uses regex because I didn't
-        want to rely on third party libraries to do this"""
-        ret = ""
-        html = self.html
-        m = re.search(r"<img\s+[^>]+>", html, flags=re.M | re.I)
-        if m:
-            m = re.search(r"src=[\"\']([^\"\']+)", m.group(0), flags=re.I)
-            if m:
-                ret = m.group(1)
-        return ret
+        """Return the image for the post"""
+        return self.compile().image
 
     @property
     def markdown(self):
@@ -507,50 +576,39 @@ class Page(Other):
 
     @property
     def title(self):
-        title, html, meta = self.compile()
-        return title
+        return self.compile().title
 
     @property
     def html(self):
         """return html of the post
 
-        :return: str, rendered html
+        :return: HTML, rendered html
         """
-        title, html, meta = self.compile()
-        return HTML(html)
+        return self.compile().html
 
     @property
     def meta(self):
         """return any meta-data this post has"""
-
-        # this is kind of a crap way to do it but we need to parse the body to
-        # make sure meta is parsed and available
-        title, html, meta = self.compile()
-        return meta
+        return self.compile().meta
 
     @property
     def output_file(self):
         """this is the path of the file that this page will be outputted to
         after it is templated"""
 
-        # see if there is a slug we should add
-        input_basename = self.input_file.basename
-        m = re.match(self.regex(), input_basename, flags=re.I)
-        dname = m.group(1) or ""
+        # see if there is a slug we should add, the compile sets the slug
+        # when it matches the input file so this rarely has to
+        slug = self.slug
+        if slug is None:
+            m = re.match(self.regex(), self.input_file.basename, flags=re.I)
+            slug = self.slug = m.group(1) or ""
 
         output_basename = self.config.page_output_basename
-        return self.output_dir.child_file(dname, output_basename)
+        return self.output_dir.child_file(slug, output_basename)
 
     @property
     def template_name(self):
-        theme = self.config.theme
-        for template_name in self.template_names:
-            logger.debug("Attempting to use theme template [{}.{}]".format(
-                theme.name,
-                template_name
-            ))
-            if theme.has_template(template_name):
-                return template_name
+        return self.config.theme.find_template(self.template_names)
 
     @classproperty
     def template_names(cls):
@@ -574,54 +632,134 @@ class Page(Other):
         """Compile this type instance
 
         This is called implicitely internally (eg, see the `.html` property)
+
+        Renders are cached by the config values the markdown reads (see
+        Config.get_markdown_fingerprint()) instead of by context, so contexts
+        that don't change any of those values share one render
+
+        :returns: PageInfo, the rendered page in the current context
         """
         cache = getattr(self, "_cache", None)
-        if not cache:
-            cache = ContextNamespace(cascade=False)
+        if cache is None:
+            cache = self._cache = {}
 
         context_name = self.config.context_name()
-        cache.switch_context(context_name)
+        fingerprint = self.config.get_markdown_fingerprint()
+
+        info = cache.get(fingerprint)
+        if info is None or info.html is None:
+            md_cache = self.config.markdown_cache
+            key = md_cache.get_key(self) if md_cache else ""
+            cached = md_cache.get(key) if key else None
+
+            if cached:
+                logger.debug("Cached html[{}]: {}".format(
+                    context_name,
+                    self.uri
+                ))
+                title, html, meta = cached
+
+            else:
+                logger.debug("Rendering html[{}]: {}".format(
+                    context_name,
+                    self.uri
+                ))
+                title, html, meta = self.render()
+                # a render with missing embeds is only good until the embeds
+                # are fetched, so it isn't saved
+                if key and not self.parse().embed_misses:
+                    md_cache.set(key, title, html, meta)
+
+            if info is None:
+                info = cache[fingerprint] = PageInfo(title, html, meta)
+
+            else:
+                # the html was released, everything else is still here
+                info.html = HTML(html)
+
+        return info
+
+    def release(self):
+        """Release the rendered html of every context, only the small values
+        (eg, title, meta, description) are kept and the html is loaded from
+        the markdown cache, or rendered again, the next time it is needed.
+        This is called after output when config.low_memory is True"""
+        for info in (getattr(self, "_cache", None) or {}).values():
+            info.release()
+        self.release_parsed()
+
+    def release_parsed(self):
+        """Release the parsed markdown, it is only needed while the page is
+        serialized in the contexts of one output, this is called after the
+        page is output unless .keep_parsed is True, and after every output"""
+        self._parsed = None
+        self.keep_parsed = False
+
+    def parse(self):
+        """Parse the markdown body of this page
+
+        This is the expensive, context independent, half of a render, it is
+        cached by Config.get_parse_fingerprint() so contexts that only differ
+        by their links (eg, a different scheme) only serialize the page
+        again, see Markdown.parse()
+
+        :returns: ParsedDocument
+        """
+        cache = getattr(self, "_parsed", None)
+        if cache is None:
+            cache = self._parsed = {}
+
+        fingerprint = self.config.get_parse_fingerprint()
+        parsed = cache.get(fingerprint)
+        if parsed is None:
+            try:
+                parsed = cache[fingerprint] = self.markdown.parse(self)
 
-        if "html" not in cache:
-            logger.debug("Rendering html[{}]: {}".format(
-                context_name,
-                self.uri
-            ))
+            finally:
+                self.config.markdown_pool.checkin()
 
+        return parsed
+
+    def render(self):
+        """Convert the markdown body of this page to html, this is called
+        from .compile() when the rendered html isn't cached
+
+        :returns: tuple[str, str, dict], the title, html, and meta
+        """
+        try:
+            parsed = self.parse()
             try:
-                md = self.markdown
-                html = md.output(self)
-                meta = getattr(md, "Meta", {})
-
-                title = meta.get("title", "")
-                if not title:
-                    m = re.match(
-                        r"^\s*<h1[^>]*>([^<]*)</h1>\s*",
-                        html,
-                        flags=re.I | re.M
-                    )
-                    if m:
-                        title = m.group(1).strip()
-
-                        # we actually remove the title from the html since it
-                        # will be available in .title
-                        html = html[:m.start()] + html[m.end():]
-
-                    else:
-                        title = self.find_title(html)
-
-                cache["html"] = html
-                cache["meta"] = meta
-                cache["title"] = title
-                self._cache = cache
-
-            except AttributeError as e:
-                # there might be attribute errors deep into Markdown that would
-                # be suppressed if they bubbled up from here
-                logger.exception(e)
-                raise ValueError(e) from e
-
-        return cache["title"], cache["html"], cache["meta"]
+                html = self.markdown.output(self, parsed)
+
+            finally:
+                self.config.markdown_pool.checkin()
+
+            meta = parsed.meta
+
+            title = meta.get("title", "")
+            if not title:
+                m = re.match(
+                    r"^\s*<h1[^>]*>([^<]*)</h1>\s*",
+                    html,
+                    flags=re.I | re.M
+                )
+                if m:
+                    title = m.group(1).strip()
+
+                    # we actually remove the title from the html since it
+                    # will be available in .title
+                    html = html[:m.start()] + html[m.end():]
+
+                else:
+                    title = self.find_title(html)
+
+        except AttributeError as e:
+            # there might be attribute errors deep into Markdown that would
+            # be suppressed if they bubbled up from here
+            logger.exception(e)
+            raise ValueError(e) from e
+
+        return title, html, meta
 
     def find_title(self, html):
         """Find an appropriate title for this page, this is called in the
@@ -656,6 +794,12 @@ class Page(Other):
             **kwargs
         )
 
+        if self.config.get("low_memory", False):
+            self.release()
+
+        elif not self.keep_parsed:
+            self.release_parsed()
+
     def output_template(self, output_file, theme=None, **kwargs):
         # not sure what name I like the best yet
         template_names = self.template_names
@@ -692,6 +836,89 @@ class Page(Other):
                 **kwargs
             )
 
-        f = Filepath(output_file, encoding=self.config.encoding)
-        f.write_text(r.html)
+        self.config.writer.write_text(
+            output_file,
+            r.html,
+            self.config.encoding
+        )
+
+
+
+class TypeMatcher(object):
+    """Finds the Type class of input files
+
+    The regexes of all the Type classes that use the default Page.match are
+    compiled into one alternation, so finding the class of a basename is one
+    regex match instead of a match for every class, and the match has the
+    slug also. Classes with their own .match() are checked on their own in
+    their place in the order
 
+    :Example:
+        matcher = TypeMatcher(config.types.get_mro_classes())
+        type_class, slug = matcher.match("page-foo.md") # Page, "foo"
+    """
+    def __init__(self, type_classes):
+        """
+        :param type_classes: Iterable[type], the Type classes in the order
+            they should be checked
+        """
+        self.type_classes = tuple(type_classes)
+
+        # each step is either a (compiled regex, {group name: (class, slug
+        # group)}) tuple or a Type class that has its own .match()
+        self.steps = []
+        parts = []
+        groups = {}
+        group_count = 0
+        for type_class in self.type_classes:
+            if self.is_regex_class(type_class):
+                regex = type_class.regex()
+                group_name = f"t{len(parts)}"
+                parts.append(f"(?P<{group_name}>{regex})")
+                # the class's first group is the slug, it comes right after
+                # the named group wrapping the class's regex
+                groups[group_name] = (type_class, group_count + 2)
+                group_count += re.compile(regex).groups + 1
+
+            else:
+                if parts:
+                    self.steps.append(self.compile(parts, groups))
+                    parts = []
+                    groups = {}
+                    group_count = 0
+
+                self.steps.append(type_class)
+
+        if parts:
+            self.steps.append(self.compile(parts, groups))
+
+    def is_regex_class(self, type_class):
+        """Return True if type_class matches with its regex, which is true
+        of any Page class that doesn't override .match()"""
+        return (
+            issubclass(type_class, Page)
+            and type_class.match.__func__ is Page.match.__func__
+        )
+
+    def compile(self, parts, groups):
+        return (re.compile("|".join(parts), flags=re.I), groups)
+
+    def match(self, basename):
+        """Find the Type class of basename
+
+        :param basename: str, the basename of an input file
+        :returns: tuple[type|None, str|None], the first matching Type class
+            and the slug of basename if the class has one
+        """
+        for step in self.steps:
+            if isinstance(step, tuple):
+                regex, groups = step
+                m = regex.match(basename)
+                if m:
+                    type_class, slug_group = groups[m.lastgroup]
+                    return type_class, m.group(slug_group) or ""
+
+            elif step.match(basename):
+                return step, None
+
+        return None, None
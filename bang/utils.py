@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import re
+import sys
 
 from datatypes import (
     Url,
@@ -7,3 +9,55 @@ from datatypes import (
     HTTPClient,
 )
 
+
+INJECT_REGEX = re.compile(r"</(head|body)>", re.I)
+
+
+def inject_html(html, head="", body=""):
+    """Inject head right before </head> and body right before </body> of html
+
+    This is one scan of html and one copy of it, no matter how much is
+    injected
+
+    :param html: str
+    :param head: str
+    :param body: str
+    :returns: HTML
+    """
+    head_index = body_index = -1
+    for m in INJECT_REGEX.finditer(html):
+        if m.group(1).lower() == "head":
+            if head_index < 0:
+                head_index = m.start()
+
+        else:
+            body_index = m.start()
+
+    parts = []
+    start = 0
+    # a template could have </body> before </head> (eg, in a script string)
+    # so the injections are spliced in the order they are in html
+    for index, s in sorted([(head_index, head), (body_index, body)]):
+        if s and index >= 0:
+            parts.extend([html[start:index], s, "\n"])
+            start = index
+
+    if not parts:
+        return html if isinstance(html, HTML) else HTML(html)
+
+    parts.append(html[start:])
+    return HTML("".join(parts))
+
+
+def get_peak_rss():
+    """Returns the peak resident memory of this process in bytes, or 0 if
+    that can't be found on this platform"""
+    try:
+        import resource
+
+    except ImportError:
+        return 0
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos reports bytes
+    return rss if sys.platform == "darwin" else rss * 1024
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+Watch a project for changes and recompile it while it is being served
+
+This is used by `bang serve --watch`, any change to the project's input
+directories, the theme's template directories, the directories plugins add
+(see the watch.start event), or the bangfiles will recompile the project in
+a background thread and then tell any open browser pages to reload
+themselves using server-sent events
+"""
+import os
+import sys
+import time
+import struct
+import select
+import logging
+import threading
+import ctypes
+import ctypes.util
+from socketserver import ThreadingMixIn
+
+from datatypes import PathServer
+from datatypes.server import PathHandler
+
+from .compat import *
+from .event import event
+from .path import Filepath
+
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher(object):
+    """Base class for watching directories and files for changes
+
+    :Example:
+        w = Watcher.create(dirpaths=["/some/dir"], filepaths=["/some/file"])
+        changes = w.wait()
+    """
+    @classmethod
+    def create(cls, *args, **kwargs):
+        """Returns an InotifyWatcher if the platform supports it, otherwise a
+        PollingWatcher"""
+        try:
+            return InotifyWatcher(*args, **kwargs)
+
+        except OSError as e:
+            logger.debug(f"Falling back to polling for changes: {e}")
+            return PollingWatcher(*args, **kwargs)
+
+    def __init__(self, dirpaths=None, filepaths=None, is_private=None):
+        """
+        :param dirpaths: list[str], these directories will be watched
+            recursively
+        :param filepaths: list[str], these individual files will be watched
+        :param is_private: Callable[[str], bool], called with the basename of
+            every file and directory, if it returns True then changes to that
+            path (and anything under it) are ignored
+        """
+        self.dirpaths = [
+            String(d) for d in (dirpaths or []) if os.path.isdir(d)
+        ]
+        self.filepaths = set(String(f) for f in (filepaths or []))
+        self.is_private = is_private or (lambda basename: False)
+
+    def is_watched(self, path):
+        """Return True if a change to path should be reported"""
+        if path in self.filepaths:
+            return True
+
+        for dirpath in self.dirpaths:
+            if path.startswith(dirpath + os.sep):
+                relpath = os.path.relpath(path, dirpath)
+                for part in relpath.split(os.sep):
+                    if self.is_private(part):
+                        return False
+                return True
+
+        return False
+
+    def wait(self, timeout=None):
+        """Block until something changes
+
+        :param timeout: float, how many seconds to wait, None to wait forever
+        :returns: set[str], the paths that changed, empty if timeout was
+            reached before anything changed
+        """
+        raise NotImplementedError()
+
+
+class PollingWatcher(Watcher):
+    """Finds changes by periodically checking the modified time and size of
+    every watched file"""
+    interval = 0.5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot = self.get_snapshot()
+
+    def get_snapshot(self):
+        snapshot = {}
+        for filepath in self.filepaths:
+            self.add_snapshot(snapshot, filepath)
+
+        for dirpath in self.dirpaths:
+            for basedir, dirnames, filenames in os.walk(dirpath):
+                dirnames[:] = [d for d in dirnames if not self.is_private(d)]
+                for filename in filenames:
+                    if not self.is_private(filename):
+                        self.add_snapshot(
+                            snapshot,
+                            os.path.join(basedir, filename)
+                        )
+
+        return snapshot
+
+    def add_snapshot(self, snapshot, path):
+        try:
+            st = os.stat(path)
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+
+        except OSError:
+            pass
+
+    def wait(self, timeout=None):
+        start = time.monotonic()
+        while True:
+            snapshot = self.get_snapshot()
+            changes = set(
+                path for path in set(snapshot) | set(self.snapshot)
+                if snapshot.get(path) != self.snapshot.get(path)
+            )
+            self.snapshot = snapshot
+            if changes:
+                return changes
+
+            if timeout is not None and time.monotonic() - start >= timeout:
+                return changes
+
+            time.sleep(self.interval)
+
+
+class InotifyWatcher(Watcher):
+    """Uses Linux's inotify to find changes without polling
+
+    https://man7.org/linux/man-pages/man7/inotify.7.html
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+
+    MASK = (
+        IN_MODIFY
+        | IN_ATTRIB
+        | IN_CLOSE_WRITE
+        | IN_MOVED_FROM
+        | IN_MOVED_TO
+        | IN_CREATE
+        | IN_DELETE
+    )
+
+    EVENT_STRUCT = struct.Struct("iIII")
+
+    settle = 0.1
+    """How long to keep collecting events after the first one so a save that
+    touches multiple files results in one change set"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("libc does not support inotify")
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches = {}
+
+        for dirpath in self.dirpaths:
+            self.add_watches(dirpath)
+
+        for filepath in self.filepaths:
+            self.add_watch(os.path.dirname(filepath))
+
+    def __del__(self):
+        fd = getattr(self, "fd", -1)
+        if fd >= 0:
+            os.close(fd)
+
+    def add_watch(self, dirpath):
+        if dirpath not in self.watches.values():
+            wd = self.libc.inotify_add_watch(
+                self.fd,
+                os.fsencode(dirpath),
+                self.MASK
+            )
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"Cannot watch {dirpath}")
+            self.watches[wd] = dirpath
+
+    def add_watches(self, dirpath):
+        """watch dirpath and all its non private subdirectories"""
+        for basedir, dirnames, filenames in os.walk(dirpath):
+            dirnames[:] = [d for d in dirnames if not self.is_private(d)]
+            self.add_watch(basedir)
+
+    def read_events(self):
+        """Read all the available events
+
+        :returns: set[str], the changed paths
+        """
+        changes = set()
+        try:
+            buf = os.read(self.fd, 65536)
+
+        except BlockingIOError:
+            return changes
+
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = self.EVENT_STRUCT.unpack_from(
+                buf,
+                offset
+            )
+            offset += self.EVENT_STRUCT.size
+            name = buf[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            dirpath = self.watches.get(wd, None)
+            if dirpath and name:
+                path = os.path.join(dirpath, os.fsdecode(name))
+                if mask & self.IN_ISDIR:
+                    if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        if self.is_watched(os.path.join(path, "")):
+                            self.add_watches(path)
+
+                elif self.is_watched(path):
+                    changes.add(path)
+
+        return changes
+
+    def wait(self, timeout=None):
+        changes = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            changes.update(self.read_events())
+            while True:
+                readable, _, _ = select.select([self.fd], [], [], self.settle)
+                if not readable:
+                    break
+                changes.update(self.read_events())
+
+        return changes
+
+
+class ReloadHandler(PathHandler):
+    """Serves the output directory and also a server-sent events endpoint
+    that sends a reload message every time the project is recompiled
+
+    https://developer.mozilla.org/en-US/docs/Web/API/Server-sent_events
+    """
+    def do_GET(self):
+        if self.path.split("?")[0] == self.server.reload_path:
+            # grab the generation before responding so a reload that happens
+            # right after the client connects isn't missed
+            generation = self.server.generation
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            try:
+                while True:
+                    generation = self.server.wait_for_reload(generation)
+                    if generation is None:
+                        # no reload, keep the connection alive
+                        self.wfile.write(b": ping\n\n")
+
+                    else:
+                        self.wfile.write(b"data: reload\n\n")
+                    self.wfile.flush()
+
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        else:
+            super().do_GET()
+
+
+class ReloadServer(ThreadingMixIn, PathServer):
+    """A threaded PathServer that can tell browsers to reload, see
+    ReloadHandler"""
+    handler_class = ReloadHandler
+
+    daemon_threads = True
+
+    reload_path = "/__bang__/reload"
+
+    def __init__(self, *args, **kwargs):
+        self.generation = 0
+        self.condition = threading.Condition()
+        super().__init__(*args, **kwargs)
+
+    def reload(self):
+        """Tell every connected browser to reload"""
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+
+    def wait_for_reload(self, generation, timeout=15):
+        """Wait for a reload newer than generation
+
+        :returns: int|None, the new generation or None if timeout was reached
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.generation != generation,
+                timeout=timeout
+            )
+            return None if self.generation == generation else self.generation
+
+
+class Rebuilder(threading.Thread):
+    """Background thread that recompiles project whenever the watcher finds
+    changes and then tells server to reload
+
+    The project is output incrementally (see Manifest) so only the pages
+    affected by a change are rendered again. Setting reload_path changes the
+    config's fingerprint so the first watched output is a full output and the
+    first compile after watching won't leave the reload script behind
+    """
+    def __init__(self, project, server, watcher=None):
+        super().__init__(daemon=True)
+        self.project = project
+        self.server = server
+
+        config = project.config
+        config.set("reload_path", server.reload_path)
+        event.bind("output.inject", inject_reload)
+
+        theme = config.theme
+        self.bangfiles = [
+            String(Filepath(project.project_dir, "bangfile.py")),
+            String(Filepath(theme.theme_dir, "bangfile.py")),
+        ]
+
+        # plugins add the other directories they read files from (eg, the
+        # assets plugin's asset directories)
+        r = event.broadcast(
+            "watch.start",
+            dirpaths=list(project.input_dirs) + list(theme.template_dirs),
+        )
+        self.watcher = watcher or Watcher.create(
+            dirpaths=r.dirpaths,
+            filepaths=self.bangfiles,
+            is_private=config.get(
+                "is_private_callback",
+                project.is_private_basename
+            ),
+        )
+
+    def get_restart_args(self):
+        """Returns the command that starts this process again
+
+        sys.argv[0] is a path (eg, .../bang/__main__.py or a console script)
+        and not something python can run the same way, so the module is run
+        instead
+
+        :returns: list[str]
+        """
+        return [sys.executable, "-m", __package__] + sys.argv[1:]
+
+    def run(self):
+        while True:
+            changes = self.watcher.wait()
+            if changes:
+                for path in sorted(changes):
+                    logger.info(f"Changed: {path}")
+                self.rebuild(changes)
+
+    def rebuild(self, changes):
+        if any(path in self.bangfiles for path in changes):
+            # bangfiles bind events and configure everything, the only sane
+            # way to load them again is to start over
+            logger.info("Bangfile changed, restarting")
+            self.server.server_close()
+            args = self.get_restart_args()
+            os.execv(args[0], args)
+
+        try:
+            self.project.compile()
+            self.project.output(incremental=True)
+
+        except Exception as e:
+            logger.exception(e)
+
+        else:
+            self.server.reload()
+
+
+def reload_script(reload_path):
+    """Returns the script that listens for reload messages"""
+    return "\n".join([
+        "<script>",
+        f'new EventSource("{reload_path}").onmessage = function() {{',
+        "  window.location.reload();",
+        "};",
+        "</script>",
+    ])
+
+
+def inject_reload(event):
+    """Injects the reload script into every template, this is bound by
+    Rebuilder so it only happens while watching"""
+    config = event.config
+    reload_path = config.get("reload_path", "")
+    if reload_path:
+        event.body.append(reload_script(reload_path))
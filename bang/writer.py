@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+import os
+import errno
+import shutil
+import filecmp
+import logging
+
+from .compat import *
+from .path import Dirpath
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutputWriter(object):
+    """Writes files into the output directory, skipping any write that would
+    leave the file exactly as it already is
+
+    An unchanged output file keeps its modified time, so tools like rsync or a
+    CDN sync only see the files that actually changed between builds, and the
+    disk isn't rewritten on every build.
+
+    The writer remembers every output path it wrote, skipped, or was told to
+    keep (see .keep()), and .sweep() uses that to remove everything else
+    from the output directory after a full output
+
+    :Example:
+        writer = OutputWriter(output_dir)
+        writer.write_text(output_dir.child_file("index.html"), html)
+        writer.copy(input_file, output_dir.child_file("image.jpg"))
+        writer.sweep()
+    """
+    FICLONE = 0x40049409
+    """The linux ioctl that creates a copy-on-write clone of a file, see
+    ioctl_ficlone(2)"""
+
+    def __init__(self, output_dir, hardlinks=False):
+        """
+        :param output_dir: Dirpath
+        :param hardlinks: bool, True if copies can be hard links to the input
+            file when the filesystem can't do copy-on-write clones. This is off
+            by default because anything that edits an output file in place
+            will also edit the input file
+        """
+        self.output_dir = Dirpath(output_dir)
+        self.hardlinks = hardlinks
+        self.paths = set()
+        self.written = 0
+        self.skipped = 0
+
+    def has(self, path):
+        """Return True if path has been output by this writer"""
+        return String(path) in self.paths
+
+    def keep(self, path):
+        """Mark path as output without writing it, this is for files that
+        are still valid from a previous output"""
+        self.paths.add(String(path))
+
+    def skip(self, path):
+        """Mark path as output and unchanged, this is for files whose name
+        guarantees their contents (eg, a file named after its hash)"""
+        self.keep(path)
+        self.skipped += 1
+
+    def wrote(self, path):
+        """Mark path as output and changed, this is for files that were
+        written by something other than this writer (eg, an asset that was
+        copied while it was hashed)"""
+        self.keep(path)
+        self.written += 1
+
+    def update(self, writer):
+        """Merge another writer's results into this writer, this is used to
+        combine the results of worker processes"""
+        self.paths.update(writer.paths)
+        self.written += writer.written
+        self.skipped += writer.skipped
+
+    def is_same_bytes(self, path, data):
+        """Return True if the file at path contains exactly data"""
+        try:
+            if os.stat(path).st_size != len(data):
+                return False
+
+            with open(path, "rb") as fp:
+                return fp.read() == data
+
+        except OSError:
+            return False
+
+    def is_same_file(self, src, dst):
+        """Return True if dst is a copy of src"""
+        try:
+            if os.path.samefile(src, dst):
+                return True
+
+            return filecmp.cmp(src, dst, shallow=False)
+
+        except OSError:
+            return False
+
+    def write_text(self, path, text, encoding="UTF-8"):
+        """Write text to path unless path already contains text
+
+        :param path: str
+        :param text: str
+        :param encoding: str
+        :returns: bool, True if path was written
+        """
+        return self.write_bytes(path, text.encode(encoding))
+
+    def write_bytes(self, path, data):
+        path = String(path)
+        self.paths.add(path)
+
+        if self.is_same_bytes(path, data):
+            logger.debug(f"Skipped writing unchanged file: {path}")
+            self.skipped += 1
+            return False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fp:
+            fp.write(data)
+
+        self.written += 1
+        return True
+
+    def copy(self, src, dst):
+        """Copy src to dst unless dst is already a copy of src
+
+        The copy will be a copy-on-write clone if the filesystem supports it
+        (eg, btrfs and xfs), then a hard link if .hardlinks is True, and
+        finally a plain copy
+
+        :param src: str, the input file
+        :param dst: str, the output file
+        :returns: bool, True if dst was written
+        """
+        src = String(src)
+        dst = String(dst)
+        self.paths.add(dst)
+
+        if self.is_same_file(src, dst):
+            logger.debug(f"Skipped copying unchanged file: {dst}")
+            self.skipped += 1
+            return False
+
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.lexists(dst):
+            # a hard link or clone has to be made to a new path, and removing
+            # the file first means we never write through an old hard link
+            os.unlink(dst)
+
+        if not self.clone(src, dst):
+            if not self.hardlinks or not self.link(src, dst):
+                shutil.copy2(src, dst)
+
+        self.written += 1
+        return True
+
+    def clone(self, src, dst):
+        """Try and make dst a copy-on-write clone of src
+
+        :returns: bool, True if the clone was made
+        """
+        try:
+            import fcntl
+
+        except ImportError:
+            return False
+
+        with open(src, "rb") as src_fp, open(dst, "wb") as dst_fp:
+            try:
+                fcntl.ioctl(dst_fp.fileno(), self.FICLONE, src_fp.fileno())
+
+            except OSError:
+                cloned = False
+
+            else:
+                cloned = True
+
+        if cloned:
+            shutil.copystat(src, dst)
+
+        else:
+            os.unlink(dst)
+
+        return cloned
+
+    def link(self, src, dst):
+        """Try and make dst a hard link of src
+
+        :returns: bool, True if the link was made
+        """
+        try:
+            os.link(src, dst)
+            return True
+
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            return False
+
+    def sweep(self):
+        """Remove every file in the output directory that wasn't output by
+        this writer, this is what a full output does instead of clearing the
+        output directory first
+
+        Anything written to the output directory without going through this
+        writer, or being marked with .keep(), is removed
+
+        :returns: int, how many files were removed
+        """
+        removed = 0
+        if not self.output_dir.exists():
+            return removed
+
+        for basedir, dirnames, filenames in os.walk(
+            self.output_dir,
+            topdown=False
+        ):
+            for filename in filenames:
+                path = os.path.join(basedir, filename)
+                if path not in self.paths:
+                    os.unlink(path)
+                    removed += 1
+
+            if basedir != self.output_dir and not os.listdir(basedir):
+                os.rmdir(basedir)
+
+        if removed:
+            logger.info(
+                f"Removed {removed} stale file(s) from output directory"
+            )
+
+        return removed
@@ -12,6 +12,7 @@ from datatypes import Path
 from bang.compat import *
 from bang.decorators import deprecated
 from bang import Project
+from bang.writer import OutputWriter
 from bang.__main__ import configure_logging
 from bang.event import event
 
@@ -204,7 +205,8 @@ class TestCase(testdata.TestCase):
         )
         config = testdata.mock(
             input_dir=project_input_dir,
-            output_dir=project_output_dir
+            output_dir=project_output_dir,
+            writer=OutputWriter(project_output_dir),
         )
 
         return type_class(
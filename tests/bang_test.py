@@ -6,7 +6,7 @@ import re
 import testdata
 
 from bang.compat import *
-from bang.path import Dirpath, Filepath
+from bang.path import Dirpath, Filepath, FileIndex
 from bang import config
 from . import TestCase
 
@@ -56,6 +56,26 @@ class ProjectTest(TestCase):
         self.assertEqual(2, len(p.get_types("page")))
         self.assertEqual(1, len(p.get_types("other")))
 
+    def test_file_index(self):
+        p = self.get_project({
+            "foo/page.md": "1",
+            "bar.txt": "2",
+        })
+        index = p.file_index
+        self.assertIs(index, p.file_index)
+
+        # new files are only found by the next compile
+        p.input_dirs[0].child_file("che", "page.md").write_text("3")
+        self.assertEqual(1, len(p.get_types("page")))
+        self.assertEqual(
+            ["bar.txt", "foo/page.md"],
+            sorted(rp for rp, ip, op in p)
+        )
+
+        p.compile()
+        self.assertIsNot(index, p.file_index)
+        self.assertEqual(2, len(p.get_types("page")))
+
     def test_no_bangfile_host(self):
         name = testdata.get_ascii(16)
         ps = self.get_pages({
@@ -114,6 +134,151 @@ class ProjectTest(TestCase):
         self.assertEqual(0, len(s.get_types("page")))
         self.assertEqual(0, len(s.get_types("other")))
 
+    def test_output_incremental(self):
+        s = self.get_project({
+            'foo/page.md': "foo text",
+            'bar/page.md': "bar text",
+            'che/page.md': "che text",
+            'che.txt': "che text",
+            'baz.txt': "baz text",
+        })
+        s.output(incremental=True)
+
+        # the manifest is written even on a full output so the next output
+        # can be incremental
+        self.assertTrue(s.cache_dir.has_file("manifest.json"))
+
+        # write sentinels into the outputs that shouldn't be output again
+        s.output_dir.child_file("baz.txt").write_text("sentinel")
+        s.output_dir.child_file("che.txt").write_text("sentinel")
+
+        # files that don't belong to an instance (eg, a plugin's files) are
+        # left alone
+        s.output_dir.child_file("plugin", "plugin.txt").write_text("plugin")
+
+        s.input_dirs[0].child_file("foo", "page.md").write_text("foo 2")
+        s.input_dirs[0].child_file("che.txt").delete()
+        s.input_dirs[0].child_file("bar", "page.md").delete()
+        s.compile()
+        s.output(incremental=True)
+
+        self.assertTrue(
+            "foo 2" in s.output_dir.file_text("foo", "index.html")
+        )
+        self.assertEqual("sentinel", s.output_dir.file_text("baz.txt"))
+        self.assertFalse(s.output_dir.has_file("che.txt"))
+        self.assertFalse(s.output_dir.has_dir("bar"))
+        self.assertTrue(s.output_dir.has_file("plugin", "plugin.txt"))
+
+        # a non incremental output should output everything
+        s.output()
+        self.assertEqual("baz text", s.output_dir.file_text("baz.txt"))
+
+    def test_output_incremental_template(self):
+        s = self.get_project({
+            'foo/page.md': "foo text",
+            'bar.txt': "bar text",
+        })
+        s.output(incremental=True)
+        s.output_dir.child_file("foo", "index.html").write_text("sentinel")
+        s.output_dir.child_file("bar.txt").write_text("sentinel")
+
+        s.compile()
+        s.output(incremental=True)
+        self.assertEqual(
+            "sentinel",
+            s.output_dir.file_text("foo", "index.html")
+        )
+
+        # changed templates should cause all the pages to output again
+        manifest_file = s.cache_dir.child_file("manifest.json")
+        manifest = json.loads(manifest_file.read_text())
+        manifest["templates"] = {}
+        manifest_file.write_text(json.dumps(manifest))
+
+        s.compile()
+        s.output(incremental=True)
+        self.assertTrue(
+            "foo text" in s.output_dir.file_text("foo", "index.html")
+        )
+        self.assertEqual("sentinel", s.output_dir.file_text("bar.txt"))
+
+    def test_output_jobs(self):
+        s = self.get_project({
+            'foo/page.md': "# foo title\n\nfoo text",
+            'bar/page.md': "# bar title\n\nbar text",
+            'che/page.md': "# che title\n\nche text",
+            'baz.txt': "baz text",
+        })
+        s.output(jobs=2)
+
+        self.assertTrue(s.output_dir.has_file("baz.txt"))
+        for name in ["foo", "bar", "che"]:
+            html = s.output_dir.file_text(name, "index.html")
+            self.assertTrue(f"{name} text" in html)
+
+    def test_output_jobs_settings(self):
+        s = self.get_project({
+            'foo/page.md': "# foo title\n\n![alt](che.jpg)",
+            'bar/page.md': "# bar title\n\n![alt](che.jpg)",
+        })
+        # values set on the project after it's configured are used by the
+        # workers also
+        s.config.lazyload_images = False
+        s.config.markdown_cache_size = 0
+
+        s.output(jobs=2)
+        htmls = [
+            s.output_dir.file_text(name, "index.html")
+            for name in ["foo", "bar"]
+        ]
+        self.assertFalse(any('loading="lazy"' in html for html in htmls))
+
+        s.output()
+        self.assertEqual(
+            htmls,
+            [
+                s.output_dir.file_text(name, "index.html")
+                for name in ["foo", "bar"]
+            ]
+        )
+
+
+class FileIndexTest(TestCase):
+    def test_files(self):
+        d = testdata.create_files({
+            "foo/bar/che.txt": "1",
+            "foo/baz.txt": "2",
+            "_foo/che.txt": "3",
+            "boo.txt": "4",
+            "boo.png": "5",
+        })
+        index = FileIndex(is_private=lambda basename: basename[0] == "_")
+
+        self.assertEqual(
+            ["boo.png", "boo.txt", "foo/baz.txt", "foo/bar/che.txt"],
+            [os.path.relpath(e.path, d) for e in index.files(d)]
+        )
+        self.assertEqual(
+            ["boo.png", "boo.txt"],
+            [e.name for e in index.files(d, depth=1)]
+        )
+        self.assertEqual(
+            ["boo.txt", "baz.txt", "che.txt"],
+            [e.name for e in index.files(d, regex=r"\.txt$")]
+        )
+        self.assertEqual([], list(index.files(d.child_dir("nope"))))
+
+        # private folders are never read
+        self.assertFalse(os.path.join(d, "_foo") in index.listings)
+
+        # the listing and stats are reused
+        path = d.child_file("boo.txt")
+        st = index.stat(path)
+        path.write_text("changed")
+        self.assertEqual(st.st_size, index.stat(path).st_size)
+        self.assertEqual(4, len(list(index.files(d))))
+
 
 class GenerateTest(TestCase):
     def test_generate(self):
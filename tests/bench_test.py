@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import testdata
+
+from bang.compat import *
+from bang.bench import SiteGenerator, Benchmark, compare
+from . import TestCase
+
+
+class SiteGeneratorTest(TestCase):
+    def test_generate(self):
+        d1 = testdata.create_dir()
+        SiteGenerator(d1, posts=3, seed=1).generate()
+        self.assertTrue(d1.has_file("bangfile.py"))
+        self.assertTrue(d1.has_file("input", "post-00002", "post.md"))
+
+        d2 = testdata.create_dir()
+        SiteGenerator(d2, posts=3, seed=1).generate()
+        self.assertEqual(
+            d1.file_text("input", "post-00001", "post.md"),
+            d2.file_text("input", "post-00001", "post.md"),
+        )
+
+
+class BenchmarkTest(TestCase):
+    def test_run(self):
+        project_dir = testdata.create_dir()
+        SiteGenerator(project_dir, posts=3, paragraphs=20).generate()
+
+        b = Benchmark(project_dir, project_dir.child_dir("output"), repeat=2)
+        results = b.run()
+
+        self.assertEqual(2, len(results["runs"]))
+        self.assertEqual(3, results["best"]["pages"])
+        self.assertLess(0, results["best"]["pages_per_sec"])
+        self.assertLess(0, results["peak_rss"])
+        self.assertLess(0, results["blocks"]["ImageProcessor"])
+        self.assertLess(0, results["magicref"]["seconds"])
+        self.assertTrue(project_dir.has_file("output", "index.html"))
+
+        previous = {
+            "best": dict(
+                results["best"],
+                pages_per_sec=results["best"]["pages_per_sec"] / 2
+            ),
+            "peak_rss": results["peak_rss"],
+        }
+        changes = compare(results, previous)
+        self.assertAlmostEqual(1.0, changes["pages_per_sec"])
+        self.assertEqual(0.0, changes["peak_rss"])
+        self.assertFalse("magicref" in changes)
+
+        previous["blocks"] = dict(
+            (name, seconds * 2)
+            for name, seconds in results["blocks"].items()
+        )
+        previous["magicref"] = {
+            "seconds": results["magicref"]["seconds"] / 2,
+        }
+        changes = compare(results, previous)
+        self.assertAlmostEqual(-0.5, changes["blocks.ImageProcessor"])
+        self.assertAlmostEqual(1.0, changes["magicref"])
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+
+import testdata
+
+from bang.compat import *
+from bang.cache import MarkdownCache, EmbedCache
+from . import TestCase
+
+
+class MarkdownCacheTest(TestCase):
+    def test_compile(self):
+        p = self.get_page([
+            "# cached title",
+            "",
+            "cached body",
+        ])
+        self.assertEqual("cached title", p.title)
+
+        md_cache = p.config.markdown_cache
+        self.assertEqual(1, md_cache.stats()["count"])
+
+        # a new instance of the same page should come from the cache and never
+        # touch markdown
+        p2 = type(p)(p.input_file, p.output_dir, p.config)
+        pool = p.config.markdown_pool
+        md = p2.markdown
+        pool.checkin()
+        def output(page):
+            raise RuntimeError("markdown should not be rendered")
+        md.output = output
+        try:
+            self.assertEqual("cached title", p2.title)
+            self.assertTrue("cached body" in p2.html)
+
+            # the cache hit didn't leave an instance checked out
+            self.assertEqual({}, pool.local.instances)
+
+        finally:
+            del md.output
+
+    def test_key(self):
+        p = self.get_page("body text")
+        md_cache = p.config.markdown_cache
+
+        key = md_cache.get_key(p)
+        self.assertEqual(key, md_cache.get_key(p))
+
+        with p.config.context("feed", scheme="https"):
+            self.assertNotEqual(key, md_cache.get_key(p))
+
+        p.input_file.write_text("other body text")
+        self.assertNotEqual(key, md_cache.get_key(p))
+
+    def test_disabled(self):
+        c = self.get_config(markdown_cache_size=0)
+        self.assertIsNone(c.markdown_cache)
+
+    def test_prune(self):
+        md_cache = MarkdownCache(testdata.create_dir(), max_size=1)
+        for i in range(3):
+            md_cache.set(f"{i:02}key", "title", "html", {})
+
+        # make the first entry the least recently used
+        os.utime(md_cache.get_path("00key"), (0, 0))
+        md_cache.max_size = md_cache.stats()["size"] - 1
+
+        self.assertEqual(1, md_cache.prune())
+        self.assertIsNone(md_cache.get("00key"))
+        self.assertIsNotNone(md_cache.get("01key"))
+
+        md_cache.clear()
+        self.assertEqual(0, md_cache.stats()["count"])
+
+
+class EmbedCacheTest(TestCase):
+    def test_crud(self):
+        path = os.path.join(testdata.create_dir(), "embed.sqlite")
+        c = EmbedCache(path)
+        self.assertIsNone(c.get("twitter", "http://example.com/1"))
+        self.assertFalse(os.path.isfile(path))
+
+        c.set("twitter", "http://example.com/1", {"html": "1"})
+        c.set_many("twitter", {
+            "http://example.com/1": {"html": "1.1"},
+            "http://example.com/2": {"html": "2"},
+        })
+        self.assertEqual(
+            {"html": "1.1"},
+            c.get("twitter", "http://example.com/1")
+        )
+        self.assertIsNone(c.get("vimeo", "http://example.com/1"))
+        c.close()
+
+        # a new instance sees everything, but everything has expired
+        c = EmbedCache(path, ttl=1)
+        self.assertEqual(2, c.stats()["count"])
+        c.connection.execute("UPDATE embeds SET created = 0")
+        self.assertIsNone(c.get("twitter", "http://example.com/2"))
+        self.assertEqual(
+            {"html": "2"},
+            c.get("twitter", "http://example.com/2", ttl=0)
+        )
+
+        c.clear()
+        self.assertFalse(os.path.isfile(path))
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
+from unittest import mock
 
 from bang.compat import *
+from bang.event import event
 from bang.config import (
     Config,
     Theme,
@@ -57,6 +59,58 @@ class ThemeTest(TestCase):
         self.assertTrue(t.has_template("foo"))
         self.assertTrue(t.has_template("che"))
         self.assertTrue(t.has_template("bar/baz"))
+        self.assertFalse(t.has_template("baz"))
+        self.assertTrue(t.has_templates("bar"))
+        self.assertFalse(t.has_templates("foo"))
+
+        self.assertEqual("che", t.find_template(["bam", "che", "foo"]))
+        self.assertIsNone(t.find_template(["bam"]))
+
+        # appending a template directory should rebuild the index
+        t.template_dirs.append(testdata.create_files({"bam.html": "bam"}))
+        self.assertEqual("bam", t.find_template(["bam"]))
+
+    def test_bytecode_cache(self):
+        s = self.get_project({"page.md": "page text"})
+        s.output()
+        c = s.config
+        self.assertTrue(
+            list(c.cache_dir.child_dir("jinja", c.theme.name).files())
+        )
+
+        c = self.create_config(template_cache=False)
+        self.assertIsNone(c.theme.get_bytecode_cache())
+
+    def test_compile_templates(self):
+        theme_name = "foobar"
+        template_file = f"themes/{theme_name}/template/page.html"
+        s = self.get_project(
+            input_files={"page.md": "page text"},
+            project_files={
+                'bangfile.py': [
+                    "from bang import event",
+                    "@event('configure.project')",
+                    "def theme_config(event):",
+                    f"    event.config.theme_name = '{theme_name}'",
+                    ""
+                ],
+                template_file: "compiled {{ instance.html }}",
+            },
+        )
+        theme = s.config.theme
+
+        self.assertEqual(1, theme.compile_templates())
+        self.assertTrue(theme.compiled_dir.has_file("templates.json"))
+
+        loader = theme.get_template_loader()
+        self.assertEqual("ChoiceLoader", type(loader).__name__)
+
+        # a modified template should ignore the precompiled templates
+        s.project_dir.child_file(template_file).write_text(
+            "modified {{ instance.html }}"
+        )
+        loader = theme.get_template_loader()
+        self.assertEqual("FileSystemLoader", type(loader).__name__)
 
 
 class ConfigTest(TestCase):
@@ -80,3 +134,58 @@ class ConfigTest(TestCase):
         with config.context("none_host_and_scheme", scheme=None, host=None) as conf:
             self.assertEqual("", conf.base_url)
 
+
+    def test_injection(self):
+        p = self.get_project(
+            {
+                "foo/page.md": "foo text",
+                "bar/page.md": "bar text",
+            },
+            bangfile=[
+                "@event('output.inject')",
+                "def inject(event):",
+                "    event.head.append('<meta name=\"che\">')",
+                "    event.body.append('<script>che</script>')",
+            ]
+        )
+
+        broadcast = event.broadcast
+        with mock.patch.object(event, "broadcast", wraps=broadcast) as m:
+            p.output()
+
+        # the injected html is gathered once for all the pages
+        names = [c.args[0] for c in m.call_args_list]
+        self.assertEqual(1, names.count("output.inject"))
+
+        for path in ["foo/index.html", "bar/index.html"]:
+            html = p.output_dir.file_text(path)
+            self.assertEqual(1, html.count('<meta name="che">'))
+            self.assertLess(
+                html.index('<meta name="che">'),
+                html.index("</head>")
+            )
+            self.assertLess(
+                html.index("<script>che</script>"),
+                html.index("</body>")
+            )
+
+    def test_inject_html(self):
+        from bang.utils import inject_html
+
+        html = inject_html(
+            "<head><script>s = '</body>';</script></head><body>b</body>",
+            head="H",
+            body="B",
+        )
+        self.assertEqual(
+            "<head><script>s = '</body>';</script>H\n</head><body>b"
+            "B\n</body>",
+            html
+        )
+
+        html = inject_html(
+            "<body>b</body><head>h</head>",
+            head="H",
+            body="B",
+        )
+        self.assertEqual("<body>bB\n</body><head>hH\n</head>", html)
@@ -3,11 +3,16 @@ import os
 import json
 import re
 import textwrap
+import threading
+import time
+from unittest import mock
 
 import testdata
+from datatypes.server import ServerThread, CallbackServer
 
 from bang.compat import *
-from bang.md import Registry, Markdown
+from bang.md import Registry, Markdown, FootnoteExtension
+from bang.md.extensions.embed import TwitterProcessor, EmbedResolver
 from . import TestCase
 
 
@@ -44,6 +49,57 @@ class MarkdownTest(TestCase):
         pr = md.find_priority("_begin", reg)
         self.assertEqual(45, pr)
 
+    def test_pool(self):
+        p = self.get_page([
+            "Title: the title",
+            "",
+            "text[^1] with a [link][1]",
+            "",
+            "[1]: http://example.com",
+            "[^1]: the footnote",
+        ])
+        config = p.config
+        pool = config.markdown_pool
+
+        md = config.markdown
+        self.assertIs(md, config.markdown)
+
+        # another thread gets its own instance
+        mds = []
+        t = threading.Thread(target=lambda: mds.append(config.markdown))
+        t.start()
+        t.join()
+        self.assertIsNot(md, mds[0])
+
+        # a page checks its instance back in when it is done with it
+        p.html
+        self.assertEqual({}, pool.local.instances)
+        self.assertIs(md, config.markdown)
+
+        # everything from the page is cleared by the next reset
+        md.reset()
+        self.assertIsNone(md.page)
+        self.assertEqual({}, md.Meta)
+        self.assertEqual(0, md.htmlStash.html_counter)
+        self.assertEqual({}, md.references)
+        for extension in md.registeredExtensions:
+            if isinstance(extension, FootnoteExtension):
+                self.assertEqual(0, len(extension.footnotes))
+
+        with config.context("feed"):
+            self.assertIsNot(md, config.markdown)
+
+        # checked in instances are reused
+        pool.checkin()
+        t = threading.Thread(target=lambda: mds.append(config.markdown))
+        t.start()
+        t.join()
+        self.assertIs(md, mds[1])
+
+        stats = pool.get_stats()
+        self.assertEqual(3, stats["instances"])
+        self.assertLessEqual(1, stats["resets"])
+
     def test_inline_html(self):
         p = self.get_page("before <code>```</code>, after")
         self.assertEqual("<p>before <code>```</code>, after</p>", p.html)
@@ -216,6 +272,71 @@ class MarkdownTest(TestCase):
         r = p.html
         self.assertRegex(r, r'class=\"codeblock python\"')
 
+    def test_codeblocks_many(self):
+        lines = []
+        for i in range(50):
+            lines.extend([
+                f"paragraph {i}",
+                "",
+                "```python",
+                f"x = {i}",
+                "```",
+                "",
+            ])
+
+        p = self.get_page(lines)
+        html = p.html
+        self.assertEqual(50, html.count('class="codeblock python"'))
+        self.assertTrue("paragraph 49" in html)
+        self.assertTrue("x = 49" in html)
+        self.assertLess(html.index("x = 0"), html.index("paragraph 1"))
+
+    def test_codeblocks_highlight(self):
+        from bang.md.extensions.highlight import (
+            CodeBlockPreprocessor,
+            highlight,
+        )
+        if not highlight:
+            self.skipTest("pygments is not installed")
+
+        p = self.get_page([
+            "```python",
+            "def foo(): pass",
+            "```",
+            "",
+            "```unknownlang",
+            "def foo(): pass",
+            "```",
+        ])
+        p.config.highlight_code = True
+        CodeBlockPreprocessor.highlighted.clear()
+
+        html = p.html
+        self.assertTrue('class="codeblock python highlight"' in html)
+        self.assertTrue('<span class="k">def</span>' in html)
+        self.assertTrue('class="codeblock unknownlang"' in html)
+        self.assertEqual(2, len(CodeBlockPreprocessor.highlighted))
+
+    def test_block_classifier(self):
+        from bang.md.extensions import BlockClassifier as BC
+
+        c = BC()
+        self.assertEqual(0, c.classify("some plain prose"))
+        self.assertEqual(0, c.classify(""))
+        self.assertEqual(BC.IMAGE, c.classify("  ![alt](che.jpg) "))
+        self.assertEqual("![alt](che.jpg)", c.stripped)
+        self.assertEqual(BC.IMAGE, c.classify("[![alt](che.gif)](/foo)"))
+        self.assertEqual(
+            BC.URL | BC.IMAGE_PATH,
+            c.classify("HTTPS://example.com/che.PNG")
+        )
+        self.assertEqual(BC.IMAGE_PATH, c.classify("foo/bar.jpeg"))
+
+        # the classifier is shared by every processor of an instance
+        p = self.get_page("![alt](che.jpg)")
+        md = p.config.markdown
+        self.assertIs(BC.get_instance(md), BC.get_instance(md))
+
     def test_codeblocks_footnotes(self):
         markdown = textwrap.dedent("""
             before
@@ -575,6 +696,37 @@ class MarkdownTest(TestCase):
         r = p.html
         self.assertEqual(2, r.count("<code>[^n]</code>"))
 
+    def test_easy_refs_code(self):
+        from bang.md.extensions.magicref import Sub
+
+        s = Sub("n")
+        text = s.sub("\n".join([
+            "text[^n] `[^n]` and ``a ` [link][n]`` [link][n]",
+            "",
+            "```",
+            "code[^n] [link][n]",
+            "```",
+            "",
+            "[^n]: footnote",
+            "[n]: http://example.com",
+        ]))
+        self.assertEqual(
+            "\n".join([
+                "text[^magicref-n-1] `[^n]` and ``a ` [link][n]``"
+                " [link][magicref-n-2]",
+                "",
+                "```",
+                "code[^n] [link][n]",
+                "```",
+                "",
+                "[^magicref-n-1]: footnote",
+                "[magicref-n-2]: http://example.com",
+            ]),
+            text
+        )
+        self.assertEqual([], s.footnote_placeholders)
+        self.assertEqual([], s.link_placeholders)
+
     def test_footnote_with_colon(self):
         p = self.get_page([
             "link before a [quote][n]:",
@@ -659,6 +811,33 @@ class EmbedLocalPluginTest(TestCase):
         r = p.html
         self.assertFalse("embed" in r)
 
+    def test_linkify(self):
+        from bang.md.extensions.embed import LinkifyPostprocessor
+
+        p = self.get_page([
+            "before https://foo.com/bar and `www.code.com` after",
+            "",
+            "<script>var s = 'https://script.com/';</script>",
+            "",
+            "<style>a { background: url(https://style.com/a.png); }</style>",
+            "",
+            "<!-- https://comment.com/ -->",
+            "",
+            "[link text](https://link.com/)",
+        ])
+        r = p.html
+        self.assertTrue(
+            '<a class="embed" href="https://foo.com/bar">' in r
+        )
+        for url in ["code.com", "script.com", "style.com", "comment.com"]:
+            self.assertFalse(f'href="https://{url}' in r, url)
+            self.assertTrue(url in r, url)
+        self.assertEqual(1, r.count('class="embed"'))
+
+        lp = LinkifyPostprocessor(p.config.markdown)
+        text = "<p>plain <b>text</b> with no urls.</p>"
+        self.assertIs(text, lp.run(text))
+
     def test_no_embed_twitter_links(self):
         p = self.get_page([
             "[@Jaymon](https://twitter.com/jaymon)",
@@ -739,69 +918,140 @@ class EmbedLocalPluginTest(TestCase):
 
 
 class EmbedRemotePluginTest(TestCase):
-    """Emboed plugins that make requests"""
-    def setUp(self):
-        """This makes sure these tests only run when they are run specifically,
-        so these will be skipped when all tests are run, we do this because
-        these tests can ping external networks"""
-        if 'PYT_TEST_CLASS_COUNT' in os.environ:
-            skip = True
-            pyt_cls_count = int(os.environ['PYT_TEST_CLASS_COUNT'])
-            pyt_test_count = int(os.environ['PYT_TEST_COUNT'])
-            pyt_mod_count = int(os.environ['PYT_TEST_MODULE_COUNT'])
-            #pout.v(pyt_cls_count, pyt_test_count, pyt_mod_count)
+    """Embed plugins that make requests, the requests go to a local server"""
+    def get_server(self, requests):
+        def do_GET(handler):
+            url = handler.query["url"]
+            requests.append(url)
+            tweet_id = url.rsplit("/", 1)[-1]
+            return {"html": f"<blockquote>tweet {tweet_id}</blockquote>"}
 
-            if pyt_cls_count == 1:
-                skip = False
+        return ServerThread(CallbackServer({"GET": do_GET}))
 
-            elif pyt_test_count == 1:
-                skip = False
+    def test_embed_twitter(self):
+        tweet_url = "https://twitter.com/JohnKirk/status/801086441325375491"
+        p = self.get_project({
+            "foo/page.md": [
+                "before",
+                "",
+                tweet_url,
+                "",
+                "middle",
+                "",
+                "https://twitter.com/foo/status/100",
+                "",
+                "after",
+            ],
+            "foo/_embed/twitter.json": json.dumps({
+                "https://twitter.com/foo/status/100": {
+                    'html': (
+                        '<blockquote class="twitter-tweet">'
+                        '<p lang="en" dir="ltr">foo</p>'
+                        '&mdash;'
+                        ' <a href="https://twiiter.com/foo/status/100">'
+                        'month DD, YYYY</a>'
+                        '</blockquote>'
+                    ),
+                },
+            }),
+            "bar/page.md": ["before", "", tweet_url],
+        })
 
-            elif pyt_mod_count == 1:
-                skip = False
+        requests = []
+        with self.get_server(requests) as server:
+            with mock.patch.object(TwitterProcessor, "base_url", server):
+                p.output()
 
-            if skip:
-                raise self.skipTest("takes too long")
+        # the tweet in both pages was only fetched once
+        self.assertEqual([tweet_url], requests)
 
-        super(EmbedPluginTest, self).setUp()
+        html = p.output_dir.file_text("foo", "index.html")
+        self.assertEqual(2, html.count("<figure"))
+        self.assertTrue("month DD, YYYY" in html)
+        self.assertTrue("<blockquote>tweet 801086441325375491<" in html)
 
-    def test_embed_twitter(self):
-        p = self.get_page(
-            {
-                "page.md": [
-                    "before",
-                    "",
-                    "https://twitter.com/JohnKirk/status/801086441325375491",
-                    "",
-                    "middle",
-                    "",
-                    "https://twitter.com/foo/status/100",
-                    "",
-                    "after",
-                ],
-                "_embed/twitter.json": json.dumps({
-                    "https://twitter.com/foo/status/100": {
-                        'html': (
-                            '<blockquote class="twitter-tweet">'
-                            '<p lang="en" dir="ltr">foo</p>'
-                            '&mdash;'
-                            ' <a href="https://twiiter.com/foo/status/100">'
-                            'month DD, YYYY</a>'
-                            '</blockquote>'
-                        ),
-                    },
-                })
-            }
-        )
-
-        r = p.html
-        self.assertEqual(2, r.count("<figure"))
+        # the legacy cache is read but never written
+        input_dir = p.input_dirs[0]
+        contents = json.loads(input_dir.file_text("foo/_embed/twitter.json"))
+        self.assertEqual(1, len(contents))
+        self.assertFalse(input_dir.has_file("bar/_embed/twitter.json"))
 
-        contents = json.loads(
-            p.input_dir.child_dir("_embed").file_bytes("twitter.json")
+        store = p.config.embed_cache
+        self.assertIsNotNone(store.get("twitter", tweet_url))
+        self.assertTrue(
+            "month DD, YYYY" in store.get(
+                "twitter",
+                "https://twitter.com/foo/status/100"
+            )["html"]
         )
-        self.assertEqual(2, len(contents))
-
-        foo_html = contents["https://twitter.com/foo/status/100"]["html"]
-        self.assertTrue("month DD, YYYY" in foo_html)
 
+        # everything is cached now so nothing is fetched
+        requests = []
+        p.resolve_embeds(p.get_types("page"))
+        self.assertEqual([], requests)
+
+    def test_embed_twitter_uncached(self):
+        """an embed that isn't cached, or fails to fetch, stays a link"""
+        url = "https://twitter.com/foo/status/100"
+        p = self.get_page(["before", "", url])
+        self.assertFalse("<figure" in p.html)
+        self.assertTrue(f'href="{url}"' in p.html)
+
+        # nothing is listening on port 1 so the fetch fails
+        with mock.patch.object(
+            TwitterProcessor,
+            "base_url",
+            "http://127.0.0.1:1"
+        ):
+            resolver = EmbedResolver(p.config.markdown, timeout=1)
+            self.assertEqual(1, resolver.resolve([p]))
+
+        self.assertIsNone(p.config.embed_cache.get("twitter", url))
+
+        # the render isn't cached so the embed shows up once it is fetched
+        self.assertEqual(0, p.config.markdown_cache.stats()["count"])
+        p.config.embed_cache.set("twitter", url, {"html": "tweet"})
+        p2 = type(p)(p.input_file, p.output_dir, p.config)
+        self.assertTrue("<figure" in p2.html)
+        self.assertEqual(1, p.config.markdown_cache.stats()["count"])
+
+    def test_embed_twitter_invalid(self):
+        """a fetch that doesn't return json loses the embed, not the build"""
+        url = "https://twitter.com/foo/status/100"
+        p = self.get_page(["before", "", url])
+
+        def do_GET(handler):
+            return "<html>not json</html>"
+
+        with ServerThread(CallbackServer({"GET": do_GET})) as server:
+            with mock.patch.object(TwitterProcessor, "base_url", server):
+                resolver = EmbedResolver(p.config.markdown)
+                self.assertEqual(1, resolver.resolve([p]))
+
+        self.assertIsNone(p.config.embed_cache.get("twitter", url))
+        self.assertTrue(f'href="{url}"' in p.html)
+
+    def test_embed_offline(self):
+        url = "https://twitter.com/foo/status/100"
+        p = self.get_page(["before", "", url])
+
+        requests = []
+        with self.get_server(requests) as server:
+            with mock.patch.object(TwitterProcessor, "base_url", server):
+                resolver = EmbedResolver(p.config.markdown, offline=True)
+                self.assertEqual(0, resolver.resolve([p]))
+                self.assertEqual([url], resolver.misses)
+                self.assertEqual([], requests)
+
+                # expired embeds are fetched again
+                p.config.embed_cache.set("twitter", url, {"html": "old"})
+                p.config.embed_cache.ttl = 1
+                with mock.patch("time.time", return_value=time.time() + 2):
+                    resolver = EmbedResolver(p.config.markdown)
+                    self.assertEqual(1, resolver.resolve([p]))
+
+        self.assertEqual([url], requests)
+        self.assertEqual(
+            "<blockquote>tweet 100</blockquote>",
+            p.config.embed_cache.get("twitter", url)["html"]
+        )
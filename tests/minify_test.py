@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import json
+
+from bang.compat import *
+from bang.minify import minify_css, minify_js, SourceMap
+from . import TestCase
+
+
+class MinifyTest(TestCase):
+    def test_css(self):
+        lines = minify_css("\n".join([
+            "/* comment",
+            "   comment */",
+            "a :hover, b > c {",
+            "    content: \"  /* not a comment */  \";",
+            "    background: url(http://example.com/che.png);",
+            "}",
+        ]))
+        self.assertEqual(
+            [
+                (2, "a :hover,b>c{", False),
+                (3, "content:\"  /* not a comment */  \";", False),
+                (4, "background:url(http://example.com/che.png);", False),
+                (5, "}", False),
+            ],
+            lines
+        )
+
+    def test_js(self):
+        lines = minify_js("\n".join([
+            "// comment",
+            "var re = /a\\/b[/]c/g; // comment",
+            "var d = a / b / 2;",
+            "var s = \"it's // not a comment\";",
+            "var t = `one",
+            "  two`;",
+            "return /che/.test(s);",
+        ]))
+        self.assertEqual(
+            [
+                (1, "var re=/a\\/b[/]c/g;", False),
+                (2, "var d=a / b / 2;", False),
+                (3, "var s=\"it's // not a comment\";", False),
+                (4, "var t=`one", True),
+                (5, "  two`;", True),
+                (6, "return /che/.test(s);", False),
+            ],
+            lines
+        )
+
+    def test_js_regex_after_head(self):
+        lines = minify_js("\n".join([
+            "if (x) /a, b/.test(s);",
+            "while (f(x)) /a {2}/.exec(s);",
+            "for (;;) /c = d/.test(s);",
+            "var n = (a + b) / c / d;",
+        ]))
+        self.assertEqual(
+            [
+                (0, "if(x)/a, b/.test(s);", False),
+                (1, "while(f(x))/a {2}/.exec(s);", False),
+                (2, "for(;;)/c = d/.test(s);", False),
+                (3, "var n=(a + b)/ c / d;", False),
+            ],
+            lines
+        )
+
+    def test_source_map(self):
+        sm = SourceMap(join_lines=True)
+        sm.add("/foo.css", minify_css("foo {\n  color: red;\n}"))
+        sm.add("/bar.css", minify_css("\n\nbar {}"))
+        self.assertEqual("foo{color:red;}\nbar{}", sm.text)
+
+        d = json.loads(sm.json("app.css"))
+        self.assertEqual(["/foo.css", "/bar.css"], d["sources"])
+        self.assertEqual("AAAA,IACA,UACA;ACAA", d["mappings"])
+
+    def test_source_map_separator(self):
+        sm = SourceMap(separator=";")
+        sm.add("/a.js", minify_js("a()"))
+        sm.add("/b.js", minify_js("(function(){})()"))
+        sm.add("/c.js", minify_js("c();"))
+        self.assertEqual("a();\n(function(){})();\nc();", sm.text)
+
+        d = json.loads(sm.json("app.js"))
+        self.assertEqual("AAAA;ACAA;ACAA", d["mappings"])
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import json
+from unittest import mock
+
 import testdata
 
 from bang.compat import *
@@ -29,6 +32,45 @@ class FeedTest(TestCase):
         self.assertTrue('example.com/2' in body)
         self.assertTrue('example.com/3' in body)
 
+        # the feed goes through the writer so an unchanged feed isn't written
+        # again
+        self.assertTrue(s.writer.has(p))
+        s.compile()
+        s.output()
+        self.assertTrue(s.writer.has(p))
+        self.assertEqual(0, s.writer.written)
+
+    def test_keep_parsed(self):
+        s = self.get_project({
+            '1/post.md': '# 1',
+            '2/post.md': '# 2',
+            '3/post.md': '# 3',
+            'bangfile.py': [
+                "from bang import event",
+                "from bang.plugins import blog",
+                "",
+                "@event('configure.finish')",
+                "def global_config(event):",
+                "    event.config.host = 'example.com'",
+                "    event.config.feed_max_count = 2",
+                "",
+                "@event('output.finish.post')",
+                "def check_parsed(event):",
+                "    event.config.project.kept = [",
+                "        bool(p._parsed)",
+                "        for p in event.config.project.get_types('post')",
+                "    ]",
+            ],
+        })
+        s.output()
+
+        # only the pages in the feed keep their parsed markdown until the
+        # feed is output
+        self.assertEqual([False, True, True], s.kept)
+        for p in s.get_types("post"):
+            self.assertIsNone(p._parsed)
+            self.assertFalse(p.keep_parsed)
+
     def test_context_lifecycle(self):
         s = self.get_project({
             'p1/post.md': [
@@ -84,6 +126,7 @@ class SitemapTest(TestCase):
         self.assertTrue('example.com/1' in body)
         self.assertTrue('example.com/2' in body)
         self.assertTrue('example.com/3' in body)
+        self.assertTrue(s.writer.has(p))
 
 
 class FaviconTest(TestCase):
@@ -264,6 +307,305 @@ class AssetsTest(TestCase):
         self.assertTrue(".baz.css" in r)
         self.assertTrue(".foo.css" in r)
 
+    def test_file_index(self):
+        from bang import Project
+
+        project_files = self.get_project_files(
+            {"page.md": ""},
+            {"assets/foo.css": "/* foo.css */"},
+        )
+        project_dir, output_dir = self.get_dirs(project_files)
+        p = Project(project_dir, output_dir)
+
+        # the assets were found with the index the first compile uses
+        index = p.file_index
+        self.assertTrue(any(
+            "assets" in dirpath for dirpath in index.listings
+        ))
+        p.compile()
+        self.assertIs(index, p.file_index)
+        self.assertTrue(p.config.assets.get("foo.css"))
+
+        p.compile()
+        self.assertIsNot(index, p.file_index)
+
+    def test_output_incremental(self):
+        p = self.get_project(
+            input_files={
+                "one/page.md": "",
+            },
+            project_files={
+                "assets/app.css": "body { color: red; }",
+            }
+        )
+        p.output(incremental=True)
+        html = p.output_dir.file_text("one", "index.html")
+        url = p.config.assets.get("app.css").url
+        self.assertTrue(url in html)
+
+        # every page links the asset so every page is output again
+        p.project_dir.child_file("assets", "app.css").write_text(
+            "body { color: blue; }"
+        )
+        p.compile()
+        p.output(incremental=True)
+        html = p.output_dir.file_text("one", "index.html")
+        url2 = p.config.assets.get("app.css").url
+        self.assertNotEqual(url, url2)
+        self.assertTrue(url2 in html)
+        self.assertFalse(url in html)
+
+    def test_watch(self):
+        from bang.watch import ReloadServer, Rebuilder
+
+        p = self.get_project(
+            input_files={
+                "page.md": "",
+            },
+            project_files={
+                "assets/app.css": "body { color: red; }",
+            }
+        )
+        s = ReloadServer(p.output_dir, server_address=("127.0.0.1", 0))
+        try:
+            r = Rebuilder(p, s)
+            self.assertTrue(
+                String(p.project_dir.child_dir("assets")) in r.watcher.dirpaths
+            )
+
+        finally:
+            s.server_close()
+
+    def test_hashes(self):
+        from bang.plugins.assets import AssetHashes
+
+        p = self.get_project(
+            input_files={
+                "page.md": "",
+            },
+            project_files={
+                "assets/foo.css": "/* foo.css */",
+            }
+        )
+        p.output()
+
+        assets = p.config.assets
+        asset = [a for a in assets if a.input_file.endswith("foo.css")][0]
+        self.assertTrue(asset.output_file.isfile())
+        self.assertEqual(
+            asset.input_file.checksum(),
+            asset.output_file.basename.split(".")[0]
+        )
+
+        # the hash is read from the cache without touching the file
+        hashes = AssetHashes(assets.hashes.path)
+        with mock.patch.object(AssetHashes, "hash_copy") as m:
+            asset.compile(hashes)
+            self.assertEqual(0, m.call_count)
+
+        p.writer.skipped = 0
+        asset.output()
+        self.assertEqual(1, p.writer.skipped)
+
+        # a changed file is hashed again, and the copy made while hashing it
+        # counts as a write
+        asset.input_file.write_text("/* foo.css 2 */")
+        output_file = asset.output_file
+        p.compile()
+        asset = p.config.assets.get("foo.css")
+        self.assertTrue(asset.copied)
+        self.assertNotEqual(output_file, asset.output_file)
+        self.assertEqual("/* foo.css 2 */", asset.output_file.read_text())
+
+        p.writer.written = p.writer.skipped = 0
+        asset.output()
+        self.assertEqual(1, p.writer.written)
+        self.assertEqual(0, p.writer.skipped)
+        self.assertTrue(p.writer.has(asset.output_file))
+
+    def test_output_worker(self):
+        from bang.plugins.assets import AssetHashes
+        from bang.pool import OutputPool
+
+        p = self.get_project(
+            input_files={
+                "page.md": "page text",
+            },
+            project_files={
+                "assets/foo.css": "/* foo.css */",
+            }
+        )
+        p.config.low_memory = True
+        p.config.embed_offline = True
+        pool = OutputPool(p, jobs=2)
+        settings = pool.get_settings()
+        self.assertTrue(settings["low_memory"])
+        self.assertTrue(settings["embed_offline"])
+        self.assertTrue(settings["output_worker"])
+
+        # workers never hash and copy the assets the main process output,
+        # even if they can't use the main process's hashes
+        p.cache_dir.child_file("assets.json").delete()
+        with mock.patch.object(AssetHashes, "hash_copy") as m:
+            OutputPool.initializer(
+                type(p),
+                p.project_dir,
+                p.output_dir,
+                settings
+            )
+            self.assertEqual(0, m.call_count)
+
+        worker_project = OutputPool.worker_project
+        self.assertTrue(worker_project.config.embed_offline)
+        asset = worker_project.config.assets.get("foo.css")
+        self.assertEqual(
+            p.config.assets.get("foo.css").output_file,
+            asset.output_file
+        )
+
+        page = worker_project.get_types("page")[0]
+        OutputPool.output_batch([String(page.input_file)])
+        self.assertTrue(page.output_file.isfile())
+        self.assertIsNone(list(page._cache.values())[0].html)
+
+    def test_bundle(self):
+        p = self.get_project(
+            input_files={
+                "page.md": "",
+            },
+            project_files={
+                "assets/bar.css": [
+                    "/* bar.css */",
+                    "bar {",
+                    "    color: red;",
+                    "}",
+                ],
+                "assets/foo.css": "foo { color: blue; }",
+                "assets/print.css": "body { color: black; }",
+                "assets/app.js": [
+                    "// app.js",
+                    "var s = 'app // js';",
+                ],
+                "bangfile.py": [
+                    "from bang import event",
+                    "from bang.plugins import assets",
+                    "",
+                    "@event('configure.assets')",
+                    "def configure_assets(event):",
+                    "    config = event.config",
+                    "    config.assets_bundle = True",
+                    "    config.assets.order(before=[r'foo'])",
+                    "    config.assets.get('print.css').properties['media'] = (",
+                    "        'print'",
+                    "    )",
+                ],
+            }
+        )
+        p.output()
+
+        html = p.output_dir.file_text("index.html")
+        self.assertEqual(2, html.count(".bundle.css"))
+        self.assertEqual(1, html.count(".bundle.js"))
+        self.assertFalse("foo.css" in html)
+        self.assertTrue('media="print"' in html)
+
+        assets = p.config.assets
+        bundle = assets.bundles[assets.get("foo.css")]
+        self.assertIs(bundle, assets.bundles[assets.get("bar.css")])
+
+        text = bundle.output_file.read_text()
+        self.assertTrue(text.startswith("foo{color:blue;}\n"))
+        self.assertTrue("\nbar{color:red;}\n" in text)
+        self.assertTrue(
+            f"sourceMappingURL={bundle.map_file.basename}" in text
+        )
+
+        sm = json.loads(bundle.map_file.read_text())
+        # foo.css, the theme's project.css, and bar.css
+        self.assertEqual(3, len(sm["sources"]))
+        self.assertTrue(sm["sources"][0].endswith("foo.css"))
+        self.assertTrue(sm["sources"][2].endswith("bar.css"))
+
+        bundle = assets.bundles[assets.get("app.js")]
+        text = bundle.output_file.read_text()
+        self.assertTrue(text.startswith("var s='app // js';\n//#"))
+
+        # nothing changed so the bundles aren't built again
+        bundle.output_file.write_text("stale")
+        p.output(incremental=True)
+        self.assertEqual("stale", bundle.output_file.read_text())
+
+        # anything that removes the files between outputs gets them built
+        bundle.output_file.delete()
+        bundle.map_file.delete()
+        for _ in range(2):
+            p.output(incremental=True)
+            for bundle in set(assets.bundles.values()):
+                self.assertTrue(bundle.output_file.isfile())
+                self.assertTrue(bundle.map_file.isfile())
+
+        self.assertTrue(
+            assets.bundles[assets.get("app.js")].output_file.read_text(
+            ).startswith("var s=")
+        )
+
+    def test_bundle_order(self):
+        p = self.get_project(
+            input_files={
+                "page.md": "",
+            },
+            project_files={
+                "assets/a.css": "a { color: red; }",
+                "assets/b.css": "b { color: blue; }",
+                "assets/c.css": "c { color: black; }",
+                "assets/d.css": "d { color: white; }",
+                "assets/a.js": "a()",
+                "assets/b.js": "(function(){})()",
+                "bangfile.py": [
+                    "from bang import event",
+                    "from bang.plugins import assets",
+                    "",
+                    "@event('configure.assets')",
+                    "def configure_assets(event):",
+                    "    config = event.config",
+                    "    config.assets_bundle = True",
+                    "    config.assets.add('https://example.com/cdn.css')",
+                    "    config.assets.get('c.css').properties['media'] = (",
+                    "        'print'",
+                    "    )",
+                    "    config.assets.order(",
+                    "        before=[r'a\\.', r'cdn', r'b\\.', r'c\\.',",
+                    "            r'd\\.'],",
+                    "    )",
+                ],
+            }
+        )
+        p.output()
+
+        assets = p.config.assets
+        bundles = assets.bundles
+        a = bundles[assets.get("a.css")]
+        b = bundles[assets.get("b.css")]
+        c = bundles[assets.get("c.css")]
+        d = bundles[assets.get("d.css")]
+        # the url and the print asset split the runs
+        self.assertEqual(4, len(set([a, b, c, d])))
+
+        html = p.output_dir.file_text("index.html")
+        indexes = [
+            html.index(a.url),
+            html.index("cdn.css"),
+            html.index(b.url),
+            html.index(c.url),
+            html.index(d.url),
+        ]
+        self.assertEqual(sorted(indexes), indexes)
+
+        bundle = bundles[assets.get("a.js")]
+        self.assertIs(bundle, bundles[assets.get("b.js")])
+        text = bundle.output_file.read_text()
+        self.assertTrue(text.startswith("a();\n(function(){})()"))
+
 
 class RefTest(TestCase):
     plugins = "ref"
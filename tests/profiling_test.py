@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+
+import testdata
+
+from bang.compat import *
+from bang.event import event
+from bang.md import Markdown
+from bang.types import Page
+from bang.profiling import BuildProfiler
+from . import TestCase
+
+
+class BuildProfilerTest(TestCase):
+    def test_profile(self):
+        s = self.get_project({
+            "foo/page.md": "# foo title\n\nfoo text[^1]\n\n[^1]: note",
+            "bar.txt": "bar text",
+        })
+        s.config.markdown_cache_size = 0
+
+        output = Markdown.output
+        with BuildProfiler() as bp:
+            with bp.phase("output"):
+                s.output()
+
+        # everything that was patched should be restored
+        self.assertIs(output, Markdown.output)
+        self.assertFalse("emit" in vars(event))
+        self.assertFalse(hasattr(Page.output, "__wrapped__"))
+
+        d = bp.to_dict()
+        self.assertEqual("output", d["phases"][0]["name"])
+        self.assertTrue(
+            set(["page", "other"]) <= set(row["name"] for row in d["types"])
+        )
+        self.assertEqual(
+            String(s.input_dirs[0].child_file("foo", "page.md")),
+            d["markdown"][0]["name"]
+        )
+        self.assertTrue(d["templates"])
+        self.assertTrue(d["plugins"])
+        self.assertTrue(any(
+            row["name"] == "markdown.extensions.footnotes"
+            for row in d["extensions"]
+        ))
+
+        path = testdata.get_file()
+        bp.write_json(path)
+        self.assertEqual(d, json.loads(path.read_text()))
@@ -3,7 +3,7 @@
 import testdata
 
 from bang.compat import *
-from bang.types import Other, Page, Pages
+from bang.types import Other, Page, Pages, TypeMatcher
 from . import TestCase
 
 
@@ -38,6 +38,33 @@ class PageTest(TestCase):
         self.assertFalse(Page.match("other.md"))
         self.assertFalse(Page.match("index.md"))
 
+    def test_type_matcher(self):
+        from bang.plugins.blog import Post
+
+        class Bar(object):
+            # not a Type subclass so it isn't added to Type.classes
+            @classmethod
+            def match(cls, basename):
+                return basename.endswith(".bar")
+
+        m = TypeMatcher([Post, Bar, Page, Other])
+        self.assertEqual(4, len(m.steps))
+        self.assertEqual((Post, ""), m.match("post.md"))
+        self.assertEqual((Post, "che"), m.match("Post-che.markdown"))
+        self.assertEqual((Bar, None), m.match("page.bar"))
+        self.assertEqual((Page, "che baz"), m.match("page_che baz.md"))
+        self.assertEqual((Other, None), m.match("page.txt"))
+
+        self.assertEqual((None, None), TypeMatcher([Post]).match("page.md"))
+
+    def test_slug(self):
+        pr = self.get_project({
+            "page-che.md": "che",
+        })
+        p = pr.get_types("page")[0]
+        self.assertEqual("che", p.slug)
+        self.assertTrue(p.output_file.endswith("che/index.html"))
+
     def test_crud(self):
         p = self.get_page()
 
@@ -149,6 +176,121 @@ class PageTest(TestCase):
         desc = p.description
         self.assertEqual("This is the first line There are no sentences", desc)
 
+    def test_compile_once(self):
+        p = self.get_page([
+            "# the title",
+            "",
+            "The first sentence. The second sentence.",
+            "",
+            "![alt](che.jpg)",
+        ])
+
+        info = p.compile()
+        self.assertIs(info, p.compile())
+        self.assertIs(info.html, p.html)
+
+        self.assertEqual("the title", p.title)
+        self.assertEqual(
+            "The first sentence. The second sentence.",
+            p.description
+        )
+        self.assertTrue(p.image.endswith("che.jpg"))
+        plain = info.plain
+        self.assertIs(plain, p.compile().plain)
+
+        title, html, meta = p.compile()
+        self.assertEqual(info.title, title)
+        self.assertIs(info.html, html)
+        self.assertIs(info.meta, meta)
+
+        # contexts that don't change the markdown share the render
+        with p.config.context("feed"):
+            self.assertIs(info, p.compile())
+
+        with p.config.context("feed", scheme="https"):
+            self.assertIsNot(info, p.compile())
+            self.assertIs(p.compile(), p.compile())
+
+        self.assertIs(info, p.compile())
+
+    def test_parse_once(self):
+        p = self.get_page([
+            "# the title",
+            "",
+            "[link](/foo) footnote[^1] ![alt](che.jpg)",
+            "",
+            "[^1]: note",
+        ])
+        p.config.markdown_cache_size = 0
+
+        parsed = p.parse()
+        html = p.markdown.output(p, parsed)
+        self.assertTrue('href="//example.com/foo"' in p.html)
+
+        # a context that only changes the links serializes the parsed page
+        # again instead of parsing it again
+        with p.config.context("feed", scheme="https"):
+            self.assertIs(parsed, p.parse())
+            feed_html = p.html
+            self.assertTrue('href="https://example.com/foo"' in feed_html)
+            self.assertTrue('src="https://' in feed_html)
+            self.assertTrue('href="#fn-' in feed_html)
+
+        # the parsed tree wasn't changed by serializing it
+        self.assertEqual(html, p.markdown.output(p, parsed))
+
+        with p.config.context("feed", highlight_code=True):
+            self.assertIsNot(parsed, p.parse())
+
+    def test_release(self):
+        pr = self.get_project({
+            "page.md": [
+                "# the title",
+                "",
+                "The first sentence. ![alt](che.jpg)",
+            ],
+        })
+        pr.config.low_memory = True
+        pr.output()
+
+        p = pr.get_types("page")[0]
+        info = list(p._cache.values())[0]
+        self.assertIsNone(info.html)
+        self.assertEqual("the title", info.title)
+        self.assertEqual("The first sentence.", info.description)
+        self.assertTrue(info.image.endswith("che.jpg"))
+
+        # the html comes back the next time it is needed
+        self.assertTrue("The first sentence." in p.html)
+        self.assertIs(info, p.compile())
+
+    def test_release_parsed(self):
+        pr = self.get_project({
+            "page.md": [
+                "# the title",
+                "",
+                "The first sentence.",
+            ],
+        })
+        p = pr.get_types("page")[0]
+        parsed = p.parse()
+        self.assertIs(parsed, p.parse())
+
+        # nothing renders the page again after it's output so the parsed
+        # markdown isn't kept
+        p.output()
+        self.assertIsNone(p._parsed)
+        self.assertTrue("The first sentence." in p.html)
+
+        p.keep_parsed = True
+        p.parse()
+        p.output()
+        self.assertIsNotNone(p._parsed)
+
+        pr.output()
+        self.assertIsNone(p._parsed)
+        self.assertFalse(p.keep_parsed)
+
     def test_description_2(self):
         """https://github.com/Jaymon/bang/issues/32"""
         p = self.get_page([
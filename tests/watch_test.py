@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import http.client
+from unittest import mock
+
+import testdata
+
+from bang.compat import *
+from bang.watch import (
+    PollingWatcher,
+    InotifyWatcher,
+    ReloadServer,
+    Rebuilder,
+)
+from . import TestCase
+
+
+class WatcherTest(TestCase):
+    def assertWatch(self, watcher_class):
+        d = testdata.create_files({
+            "foo.md": "foo",
+            "_private/bar.md": "bar",
+        })
+        f = testdata.create_file("bangfile", tmpdir=testdata.create_dir())
+
+        w = watcher_class(
+            dirpaths=[d],
+            filepaths=[f],
+            is_private=lambda basename: basename.startswith("_"),
+        )
+        self.assertEqual(set(), w.wait(0.1))
+
+        d.child_file("_private", "bar.md").write_text("bar 2")
+        self.assertEqual(set(), w.wait(0.6))
+
+        d.child_file("foo.md").write_text("foo 2")
+        self.assertEqual(set([String(d.child_file("foo.md"))]), w.wait(2))
+
+        d.child_file("che", "baz.md").write_text("baz")
+        changes = w.wait(2)
+        if not changes:
+            # inotify can miss a file created at the same time as its
+            # directory, it should see the next write though
+            d.child_file("che", "baz.md").write_text("baz 2")
+            changes = w.wait(2)
+        self.assertEqual(set([String(d.child_file("che", "baz.md"))]), changes)
+
+        f.write_text("bangfile 2")
+        self.assertEqual(set([String(f)]), w.wait(2))
+
+    def test_polling(self):
+        self.assertWatch(PollingWatcher)
+
+    def test_inotify(self):
+        try:
+            InotifyWatcher()
+
+        except OSError as e:
+            self.skipTest(String(e))
+
+        self.assertWatch(InotifyWatcher)
+
+
+class ReloadServerTest(TestCase):
+    def test_reload(self):
+        s = ReloadServer(
+            testdata.create_dir(),
+            server_address=("127.0.0.1", 0)
+        )
+        t = threading.Thread(target=s.serve_forever, daemon=True)
+        t.start()
+
+        try:
+            conn = http.client.HTTPConnection(*s.server_address, timeout=5)
+            conn.request("GET", s.reload_path)
+            res = conn.getresponse()
+            self.assertEqual(200, res.status)
+            self.assertEqual(
+                "text/event-stream",
+                res.getheader("Content-Type")
+            )
+
+            s.reload()
+            self.assertEqual(b"data: reload\n", res.fp.readline())
+
+        finally:
+            s.shutdown()
+            s.server_close()
+
+
+class RebuilderTest(TestCase):
+    def test_rebuild(self):
+        p = self.get_project({
+            "foo/page.md": "foo text",
+            "bar.txt": "bar text",
+        })
+        s = ReloadServer(p.output_dir, server_address=("127.0.0.1", 0))
+
+        try:
+            r = Rebuilder(p, s, watcher=PollingWatcher())
+            r.rebuild(set())
+
+            html = p.output_dir.file_text("foo", "index.html")
+            self.assertTrue(s.reload_path in html)
+            self.assertEqual(1, s.generation)
+
+            p.input_dirs[0].child_file("foo", "page.md").write_text("foo 2")
+            p.output_dir.child_file("bar.txt").write_text("sentinel")
+            r.rebuild(set([
+                String(p.input_dirs[0].child_file("foo", "page.md"))
+            ]))
+
+            self.assertTrue(
+                "foo 2" in p.output_dir.file_text("foo", "index.html")
+            )
+            self.assertEqual(
+                "sentinel",
+                p.output_dir.file_text("bar.txt")
+            )
+            self.assertEqual(2, s.generation)
+
+        finally:
+            s.server_close()
+
+    def test_restart_args(self):
+        p = self.get_project({"foo/page.md": "foo text"})
+        s = ReloadServer(p.output_dir, server_address=("127.0.0.1", 0))
+        try:
+            r = Rebuilder(p, s, watcher=PollingWatcher())
+            argv = ["/usr/bin/bang", "serve", "--watch"]
+            with mock.patch.object(sys, "argv", argv):
+                self.assertEqual(
+                    [sys.executable, "-m", "bang", "serve", "--watch"],
+                    r.get_restart_args()
+                )
+
+        finally:
+            s.server_close()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import os
+
+import testdata
+
+from bang.compat import *
+from bang.writer import OutputWriter
+from . import TestCase
+
+
+class OutputWriterTest(TestCase):
+    def test_write_text(self):
+        output_dir = testdata.create_dir()
+        path = output_dir.child_file("foo", "index.html")
+
+        w = OutputWriter(output_dir)
+        self.assertTrue(w.write_text(path, "foo text"))
+        os.utime(path, (0, 0))
+
+        self.assertFalse(w.write_text(path, "foo text"))
+        self.assertEqual(0, path.stat().st_mtime)
+
+        self.assertTrue(w.write_text(path, "foo text 2"))
+        self.assertEqual("foo text 2", path.read_text())
+
+        self.assertEqual(2, w.written)
+        self.assertEqual(1, w.skipped)
+        self.assertTrue(w.has(path))
+
+    def test_copy(self):
+        input_file = testdata.create_file(data="input text")
+        output_dir = testdata.create_dir()
+        path = output_dir.child_file("bar.txt")
+
+        w = OutputWriter(output_dir)
+        self.assertTrue(w.copy(input_file, path))
+        self.assertFalse(w.copy(input_file, path))
+        self.assertEqual("input text", path.read_text())
+
+        # a changed output file is replaced and never written through
+        path.write_text("changed text")
+        self.assertTrue(w.copy(input_file, path))
+        self.assertEqual("input text", path.read_text())
+
+    def test_copy_hardlinks(self):
+        input_file = testdata.create_file(data="input text")
+        output_dir = testdata.create_dir()
+        path = output_dir.child_file("bar.txt")
+
+        w = OutputWriter(output_dir, hardlinks=True)
+        w.copy(input_file, path)
+        self.assertTrue(os.path.samefile(input_file, path))
+
+        input_file.write_text("input text 2")
+        self.assertFalse(w.copy(input_file, path))
+
+    def test_sweep(self):
+        output_dir = testdata.create_files({
+            "foo/index.html": "foo",
+            "bar/index.html": "bar",
+            "che.txt": "che",
+        })
+
+        # files are removed no matter how recently they were modified
+        w = OutputWriter(output_dir)
+        w.write_text(output_dir.child_file("foo", "index.html"), "foo")
+        w.keep(output_dir.child_file("che.txt"))
+
+        self.assertEqual(1, w.sweep())
+        self.assertTrue(output_dir.has_file("foo", "index.html"))
+        self.assertTrue(output_dir.has_file("che.txt"))
+        self.assertFalse(output_dir.has_dir("bar"))
+
+    def test_project_output(self):
+        s = self.get_project({
+            "foo/page.md": "foo text",
+            "bar.txt": "bar text",
+        })
+        s.output()
+        for path in s.output_dir.files():
+            os.utime(path, (0, 0))
+        s.output_dir.child_file("stale.txt").write_text("stale")
+        os.utime(s.output_dir.child_file("stale.txt"), (0, 0))
+
+        s.compile()
+        s.output()
+        self.assertEqual(0, s.writer.written)
+        self.assertEqual(len(s.writer.paths), s.writer.skipped)
+        self.assertEqual(
+            0,
+            s.output_dir.child_file("foo", "index.html").stat().st_mtime
+        )
+        self.assertFalse(s.output_dir.has_file("stale.txt"))